@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, UploadedFile, EmailVerification, SecureDownloadURL
+from .models import User, UploadedFile, EmailVerification, SecureDownloadURL, FileBlob, UploadSession, OutboundEmail
 
 class CustomUserAdmin(UserAdmin):
     list_display = ['email', 'username', 'user_type', 'is_email_verified', 'is_active']
@@ -17,6 +17,9 @@ admin.site.register(User, CustomUserAdmin)
 admin.site.register(UploadedFile)
 admin.site.register(EmailVerification)
 admin.site.register(SecureDownloadURL)
+admin.site.register(FileBlob)
+admin.site.register(UploadSession)
+admin.site.register(OutboundEmail)
 
 
 
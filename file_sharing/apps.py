@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class FileSharingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'file_sharing'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if settings.ENCRYPTION_KEY_RELOAD_SIGNAL:
+            from .utils import key_ring
+            try:
+                key_ring.install_reload_signal(settings.ENCRYPTION_KEY_RELOAD_SIGNAL)
+            except ValueError:
+                # Signal handlers can only be installed from the main thread
+                pass
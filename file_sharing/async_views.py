@@ -0,0 +1,183 @@
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from functools import wraps
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+from rest_framework.utils import formatting
+from .authentication import ClaimsJWTAuthentication
+from .catalog import acached_catalog_response
+from .delivery import aserve_file
+from .download_tokens import DownloadTokenError, aissue_download_token, aredeem_download_token, build_download_url
+from .models import UploadedFile
+from .pagination import FileKeysetPagination
+from .renderers import FastJSONRenderer, render_json
+from .serializers import FileFilterSerializer, UPLOADED_FILE_COLUMNS, project_uploaded_files
+from .throttling import DownloadURLThrottle, transfer_slot
+
+# Async versions of the catalog and download views, for ASGI deployments:
+# urls.py routes to them instead of the DRF views when FILE_SHARING_ASYNC_VIEWS
+# is set (asgi.py sets it). DRF's @api_view is sync-only, so the part of it
+# these views need is done by async_api_view below, with the same
+# authentication class and response shapes. Database access uses the async
+# ORM and downloads stream through an async iterator, so a transfer waiting
+# on a slow client holds no thread.
+
+_authenticator = ClaimsJWTAuthentication()
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(render_json(data), content_type='application/json', status=status_code)
+
+
+def _error_response(request, exc):
+    """The response DRF's exception handler gives for ``exc``"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = _json(data, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response['WWW-Authenticate'] = _authenticator.authenticate_header(request)
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+def _metadata(view):
+    """DRF's SimpleMetadata for a function view, the body of an OPTIONS response"""
+    return {
+        'name': formatting.camelcase_to_spaces(view.__name__.title().replace('_', '')),
+        'description': formatting.dedent(view.__doc__ or ''),
+        'renders': [FastJSONRenderer.media_type],
+        'parses': [parser.media_type for parser in api_settings.DEFAULT_PARSER_CLASSES],
+    }
+
+
+async def _check_throttles(request, throttle_classes):
+    # Like APIView.check_throttles(): every throttle counts the request
+    waits = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not await throttle.aallow_request(request, None):
+            waits.append(throttle.wait())
+    if waits:
+        raise exceptions.Throttled(max(waits))
+
+
+def async_api_view(methods, require_authentication=True, throttle_classes=()):
+    """What ``@api_view`` plus ``@permission_classes`` and ``@throttle_classes`` do, for an async view.
+
+    Authenticates every request that sends credentials (bad ones are a 401
+    even where anonymous access is allowed, as with DRF), applies the
+    throttles (429 with Retry-After), answers OPTIONS with the view's
+    metadata and other methods with 405, and sets the same Allow header as
+    DRF. A GET view also answers HEAD.
+    """
+    allowed = ['OPTIONS'] + list(methods)
+    if 'GET' in allowed and 'HEAD' not in allowed:
+        allowed.append('HEAD')
+    allow_header = ', '.join(allowed)
+
+    def decorator(view):
+        metadata = _metadata(view)
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # The views render JSON only, like their sync versions
+            request.accepted_renderer = FastJSONRenderer()
+            request.accepted_media_type = 'application/json'
+
+            if request.method not in allowed:
+                response = _error_response(request, exceptions.MethodNotAllowed(request.method))
+            else:
+                try:
+                    result = await _authenticator.aauthenticate(request)
+                    if result is None and require_authentication:
+                        raise exceptions.NotAuthenticated()
+                    request.user, request.auth = result or (AnonymousUser(), None)
+                    await _check_throttles(request, throttle_classes)
+                    if request.method == 'OPTIONS':
+                        response = _json(metadata)
+                    else:
+                        response = await view(request, *args, **kwargs)
+                except exceptions.APIException as e:
+                    response = _error_response(request, e)
+
+            response['Allow'] = allow_header
+            return response
+
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+# ================================================================
+# File Catalog
+# ================================================================
+
+@async_api_view(['GET'])
+async def list_files(request):
+    """List uploaded files for client users (filterable, full-text searchable with ?q=)"""
+    if request.user.user_type != 'client':
+        return _json({'error': 'Only client users can list files'}, status.HTTP_403_FORBIDDEN)
+
+    filters = FileFilterSerializer(data=request.GET)
+
+    if not filters.is_valid():
+        return _json(filters.errors, status.HTTP_400_BAD_REQUEST)
+
+    async def build_page():
+        paginator = FileKeysetPagination()
+        files = filters.filter_queryset(UploadedFile.objects.all())
+        rows = await paginator.apaginate_queryset(files.values_list(*UPLOADED_FILE_COLUMNS, named=True), request)
+        return paginator.get_paginated_data(project_uploaded_files(rows))
+
+    # Same versioned page cache (and ETags) as the sync view
+    return await acached_catalog_response(request, build_page)
+
+
+# ================================================================
+# Downloads
+# ================================================================
+
+@async_api_view(['GET'], throttle_classes=[DownloadURLThrottle])
+async def get_download_url(request, file_id):
+    """Generate secure download URL for client users"""
+    if request.user.user_type != 'client':
+        return _json({'error': 'Only client users can download files'}, status.HTTP_403_FORBIDDEN)
+
+    try:
+        file_obj = await UploadedFile.objects.aget(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return _json({'error': 'File not found'}, status.HTTP_404_NOT_FOUND)
+
+    token, expires_at = await aissue_download_token(file_obj, request.user)
+
+    return _json({
+        'download_url': build_download_url(token),
+        'expires_at': expires_at,
+        'filename': file_obj.original_filename
+    })
+
+
+@async_api_view(['GET'], require_authentication=False)
+@transfer_slot('download')
+async def download_file(request, encrypted_url):
+    """Download file using encrypted URL"""
+    try:
+        file_obj, use = await aredeem_download_token(encrypted_url)
+    except DownloadTokenError as e:
+        return _json({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    # Streamed through an async iterator; the token is consumed once the
+    # whole file has been handed to the server
+    try:
+        response = await aserve_file(request, file_obj, on_delivered=use.adelivered if use else None)
+    except FileNotFoundError:
+        response = _json({'error': 'File not found on server'}, status.HTTP_404_NOT_FOUND)
+    except BaseException:
+        if use:
+            await use.arelease()
+        raise
+
+    # Held until the transfer is over: a concurrent request is refused
+    return use.release_on_close(response) if use else response
@@ -0,0 +1,198 @@
+from asgiref.sync import sync_to_async
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .blacklist import token_blacklist
+from .models import User
+import threading
+import time
+
+# Claims copied into every token so views can authorize without a User row
+USER_CLAIMS = ('user_type', 'is_email_verified')
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token (and derived access tokens) carrying USER_CLAIMS.
+
+    Revocation goes through the cache-backed token_blacklist instead of
+    simplejwt's database blacklist app.
+    """
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if token_blacklist.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        """Revoke this token; False if it was already revoked"""
+        return token_blacklist.revoke(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['user_type'] = user.user_type
+        token['is_email_verified'] = user.is_email_verified
+        return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that re-reads the user's claims and rotates atomically"""
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        try:
+            refresh = self.token_class(attrs['refresh'])
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        status = user_status_cache.get(refresh[api_settings.USER_ID_CLAIM])
+        if status is None or not status[0]:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        refresh['user_type'], refresh['is_email_verified'] = status[1], status[2]
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # Revoking is the check: of two concurrent refreshes of the same
+            # token only one wins the cache add
+            if api_settings.BLACKLIST_AFTER_ROTATION and not refresh.blacklist():
+                raise InvalidToken('Token is blacklisted')
+            data = {'access': str(refresh.access_token)}
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+            return data
+
+        return {'access': str(refresh.access_token)}
+
+
+class ClaimsUser(TokenUser):
+    """Request user built from token claims; has ``id`` but no database row.
+
+    Assign it to foreign keys through ``<field>_id=user.id``.
+    """
+
+    @property
+    def user_type(self):
+        return self.token['user_type']
+
+    @property
+    def is_email_verified(self):
+        return self.token['is_email_verified']
+
+
+class UserStatusCache:
+    """Small per-process LRU of ``(is_active, user_type, is_email_verified)``.
+
+    Entries expire after USER_STATUS_CACHE_TTL seconds, which bounds how long
+    a deactivated user (or one whose role changed) keeps being let in by a
+    still-valid token on other processes; changes made in this process
+    invalidate the entry immediately (see signals.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _cached(self, user_id):
+        """``(hit, status)`` from the local entries"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return True, entry[1]
+        return False, None
+
+    def _store(self, user_id, status):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + settings.USER_STATUS_CACHE_TTL, status)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.USER_STATUS_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        return status
+
+    def _query(self, user_id):
+        return User.objects.filter(pk=user_id).values_list('is_active', 'user_type', 'is_email_verified')
+
+    def get(self, user_id):
+        hit, status = self._cached(user_id)
+        if hit:
+            return status
+        return self._store(user_id, self._query(user_id).first())
+
+    async def aget(self, user_id):
+        hit, status = self._cached(user_id)
+        if hit:
+            return status
+        return self._store(user_id, await self._query(user_id).afirst())
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_status_cache = UserStatusCache()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that trusts the token's claims instead of loading the user.
+
+    Returns a ClaimsUser. The only database access is the narrow status
+    lookup behind UserStatusCache, at most once per user per TTL. Tokens
+    issued before the claims existed fall back to the regular user query.
+    """
+
+    def _claims_user(self, validated_token, status):
+        if status is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+
+        is_active, user_type, is_email_verified = status
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if user_type != validated_token['user_type'] or (
+            validated_token['is_email_verified'] and not is_email_verified
+        ):
+            raise AuthenticationFailed('Token claims are out of date, log in again', code='stale_claims')
+
+        return ClaimsUser(validated_token)
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+
+        status = user_status_cache.get(self._user_id(validated_token))
+        return self._claims_user(validated_token, status)
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views: the status lookup uses the async ORM"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            return await sync_to_async(super().get_user)(validated_token), validated_token
+
+        status = await user_status_cache.aget(self._user_id(validated_token))
+        return self._claims_user(validated_token, status), validated_token
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+from file_sharing.routers import is_read_only
+
+# Django's SQLite backend opens transactions with a deferred BEGIN: the
+# first read takes a shared lock and the first write then has to upgrade
+# it. When another connection holds the write lock, that upgrade fails at
+# once with "database is locked" (busy_timeout cannot help, waiting could
+# deadlock). BEGIN IMMEDIATE takes the write lock up front, where
+# busy_timeout does apply. Django 5.1 has this as OPTIONS
+# ['transaction_mode']; here it is SQLITE_TRANSACTION_MODE.
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        mode = settings.SQLITE_TRANSACTION_MODE
+        if mode and not is_read_only(self):
+            self.cursor().execute(f'BEGIN {mode}')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.utils import timezone
+from datetime import timedelta
+from .download_tokens import issue_download_tokens
+from .models import User, UploadedFile
+from .processing import MAIN_PARTS
+from .storage import store_blob
+import io
+import os
+import zipfile
+
+# Sizes of seeded and uploaded documents with their relative frequency:
+# mostly small office files, a few large decks and workbooks
+FILE_SIZES = [
+    (16 * 1024, 40),
+    (128 * 1024, 35),
+    (1024 * 1024, 20),
+    (5 * 1024 * 1024, 5),
+]
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>'
+)
+
+
+@contextmanager
+def isolated_database(verbosity=0, directory=None):
+    """Run the block against throwaway test databases, as the test runner does.
+
+    Benchmarks seed and query these instead of the real database, which is
+    never touched. With SQLite the test database lives in memory unless
+    ``directory`` is given: it is then a file there, so several threads get
+    real connections with the configured journal mode and busy timeout.
+    """
+    if directory is not None:
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if connections[alias].vendor == 'sqlite' and not settings_dict['TEST'].get('MIRROR'):
+                settings_dict['TEST']['NAME'] = os.path.join(directory, f'bench-{alias}.sqlite3')
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity)
+        teardown_test_environment()
+
+
+def seed_users(count, user_type='client', prefix='bench'):
+    """Bulk-create verified users (password 'password123', hashed once)"""
+    template = User(user_type=user_type)
+    template.set_password('password123')
+    users = [
+        User(
+            username=f'{prefix}-{user_type}-{i}',
+            email=f'{prefix}-{user_type}-{i}@example.com',
+            user_type=user_type,
+            is_email_verified=True,
+            password=template.password
+        )
+        for i in range(count)
+    ]
+    return User.objects.bulk_create(users)
+
+
+def seed_files(count, uploaded_by, offset=0, batch_size=5000):
+    """Bulk-create ``count`` processed UploadedFile rows (no content on disk), one second apart"""
+    types = [ext for ext, _ in UploadedFile.ALLOWED_EXTENSIONS]
+    now = timezone.now()
+    for start in range(offset, offset + count, batch_size):
+        indexes = range(start, min(start + batch_size, offset + count))
+        files = UploadedFile.objects.bulk_create([
+            UploadedFile(
+                uploaded_by=uploaded_by,
+                file=f'uploads/bench-{i}.{types[i % 3]}',
+                original_filename=f'Quarterly report {i} – draft.{types[i % 3]}',
+                file_size=1024 + i,
+                file_type=types[i % 3],
+                processing_status='ready'
+            )
+            for i in indexes
+        ])
+        # auto_now_add overwrites uploaded_at on insert: spread the rows
+        # over time afterwards, so listings page through distinct timestamps
+        for i, file_obj in zip(indexes, files):
+            file_obj.uploaded_at = now - timedelta(seconds=i)
+        UploadedFile.objects.bulk_update(files, ['uploaded_at'])
+
+
+def pick_size(rng):
+    """A document size drawn from FILE_SIZES"""
+    sizes, weights = zip(*FILE_SIZES)
+    return rng.choices(sizes, weights)[0]
+
+
+def make_document(file_type, size, rng):
+    """A minimal valid OOXML package of about ``size`` bytes.
+
+    The bulk is an incompressible stored part, so no two documents share
+    content (uploads are not deduplicated) and the size on disk is ``size``.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        # [Content_Types].xml first, as Office writes it, so libmagic sees the type
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES, zipfile.ZIP_DEFLATED)
+        archive.writestr(MAIN_PARTS[file_type], '<?xml version="1.0" encoding="UTF-8"?><document/>', zipfile.ZIP_DEFLATED)
+        archive.writestr('docProps/padding.bin', rng.randbytes(max(0, size - buffer.tell() - 256)))
+    return buffer.getvalue()
+
+
+def seed_stored_files(count, uploaded_by, rng):
+    """Create ``count`` ready UploadedFiles with content on disk (sizes from FILE_SIZES)"""
+    types = [ext for ext, _ in UploadedFile.ALLOWED_EXTENSIONS]
+    files = []
+    for i in range(count):
+        file_type = types[i % len(types)]
+        name = f'Quarterly report {i}.{file_type}'
+        blob = store_blob(ContentFile(make_document(file_type, pick_size(rng), rng), name=name))
+        files.append(UploadedFile.objects.create(
+            uploaded_by=uploaded_by,
+            file=blob.file.name,
+            blob=blob,
+            original_filename=name,
+            file_size=blob.size,
+            file_type=file_type,
+            processing_status='ready'
+        ))
+    return files
+
+
+def seed_download_urls(count, files, user):
+    """Mint ``count`` outstanding download tokens for ``user``, cycling over ``files``"""
+    file_objs = [files[i % len(files)] for i in range(count)]
+    return [token for token, _ in issue_download_tokens(file_objs, user)]
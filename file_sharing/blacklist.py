@@ -0,0 +1,186 @@
+from django.conf import settings
+from django.core.cache import caches
+import hashlib
+import math
+import threading
+import time
+
+# Revoked token ids (JTIs) live in the Django cache, each under its own key
+# with a timeout equal to the token's remaining lifetime, so they purge
+# themselves once the token could not be used anyway. Every revocation is
+# also appended to a numbered log in the cache, which each process replays
+# into a local Bloom filter: a JTI the filter has never seen is certainly not
+# revoked and is answered without any I/O; a filter hit is confirmed with a
+# cache read. Use a cache shared by all workers that does not evict live keys
+# (e.g. Redis with a noeviction / volatile-ttl policy).
+_REVOKED_KEY = 'jwt-revoked:{}'
+_LOG_KEY = 'jwt-revoked:log:{}'
+_SEQ_KEY = 'jwt-revoked:seq'
+# A log number can be seen before its entry is written (revoke() bumps the
+# counter first); such gaps are retried for this many seconds
+_LOG_GRACE = 10
+
+
+def _cache():
+    return caches[settings.JWT_BLACKLIST_CACHE]
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no removal)"""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class TokenBlacklist:
+    """Process-local view of the revoked-JTI set kept in the cache.
+
+    JTIs go into the current of two Bloom filter generations. Every
+    refresh-token lifetime the older generation is dropped: anything in it
+    was revoked more than one lifetime ago, so its token has expired. The
+    log is replayed at most every JWT_BLACKLIST_SYNC_INTERVAL seconds, which
+    is how long a revocation made by another process can go unnoticed here
+    (0 checks the log position, one cache read, on every lookup). While the
+    filters hold more than they were sized for, or after entries had to be
+    skipped, lookups read the cache every time rather than risk a false
+    "not revoked".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filters = None
+        self._rotated_at = 0.0
+        self._seq = 0
+        self._synced_at = None
+        self._saturated_until = 0.0
+        self._missing = {}
+
+    def _new_filter(self):
+        return BloomFilter(settings.JWT_BLACKLIST_BLOOM_CAPACITY, settings.JWT_BLACKLIST_BLOOM_ERROR_RATE)
+
+    def _lifetime(self):
+        return settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds()
+
+    @property
+    def saturated(self):
+        if time.monotonic() < self._saturated_until:
+            return True
+        capacity = settings.JWT_BLACKLIST_BLOOM_CAPACITY
+        return self._filters is not None and any(bloom.count > capacity for bloom in self._filters)
+
+    def _rotate(self, now):
+        if self._filters is None:
+            self._filters = [self._new_filter(), self._new_filter()]
+            self._rotated_at = now
+        elif now - self._rotated_at >= self._lifetime():
+            self._filters = [self._new_filter(), self._filters[0]]
+            self._rotated_at = now
+
+    def _load(self, cache, numbers):
+        """Add the given log entries to the current filter; returns the numbers found"""
+        entries = cache.get_many([_LOG_KEY.format(n) for n in numbers])
+        for jti in entries.values():
+            self._filters[0].add(jti)
+        return {int(key.rsplit(':', 1)[1]) for key in entries}
+
+    def _sync(self, now):
+        """Replay log entries this process has not seen yet"""
+        cache = _cache()
+        seq = cache.get(_SEQ_KEY) or 0
+        batch = settings.JWT_BLACKLIST_SYNC_BATCH
+        capacity = settings.JWT_BLACKLIST_BLOOM_CAPACITY
+
+        if self._synced_at is None or seq < self._seq:
+            # First sync (or the counter was lost): walk back from the newest
+            # entry until a whole batch has expired; older entries belong to
+            # tokens that are dead too
+            loaded = 0
+            for last in range(seq, 0, -batch):
+                found = self._load(cache, range(max(last - batch + 1, 1), last + 1))
+                loaded += len(found)
+                if not found or loaded > 2 * capacity:
+                    break
+            if loaded > 2 * capacity:
+                self._saturated_until = now + 2 * self._lifetime()
+            self._missing = {}
+        elif seq - self._seq > 2 * capacity:
+            # Fell too far behind to catch up sensibly
+            self._saturated_until = now + 2 * self._lifetime()
+        else:
+            numbers = list(self._missing) + list(range(self._seq + 1, seq + 1))
+            for start in range(0, len(numbers), batch):
+                wanted = numbers[start:start + batch]
+                found = self._load(cache, wanted)
+                for n in wanted:
+                    if n in found:
+                        self._missing.pop(n, None)
+                    elif now - self._missing.setdefault(n, now) > _LOG_GRACE:
+                        del self._missing[n]
+
+        self._seq = seq
+        self._synced_at = now
+
+    def _refresh(self):
+        now = time.monotonic()
+        interval = settings.JWT_BLACKLIST_SYNC_INTERVAL
+        if (
+            self._synced_at is not None
+            and not self._missing
+            and now - self._synced_at < interval
+            and now - self._rotated_at < self._lifetime()
+        ):
+            return
+        with self._lock:
+            self._rotate(now)
+            if self._synced_at is None or self._missing or now - self._synced_at >= interval:
+                self._sync(now)
+
+    def is_revoked(self, jti):
+        self._refresh()
+        if not self.saturated and not any(jti in bloom for bloom in self._filters):
+            return False
+        return bool(_cache().get(_REVOKED_KEY.format(jti)))
+
+    def revoke(self, jti, exp):
+        """Revoke ``jti`` until ``exp`` (unix time); False if it already was.
+
+        The check and the write are one atomic cache add, so two concurrent
+        refreshes of the same token cannot both succeed.
+        """
+        timeout = max(int(exp - time.time()), 1)
+        cache = _cache()
+        if not cache.add(_REVOKED_KEY.format(jti), 1, timeout=timeout):
+            return False
+
+        try:
+            seq = cache.incr(_SEQ_KEY)
+        except ValueError:
+            cache.add(_SEQ_KEY, 0, timeout=None)
+            seq = cache.incr(_SEQ_KEY)
+        cache.set(_LOG_KEY.format(seq), jti, timeout=timeout)
+
+        self._refresh()
+        with self._lock:
+            self._filters[0].add(jti)
+        return True
+
+
+token_blacklist = TokenBlacklist()
@@ -0,0 +1,138 @@
+import os
+import struct
+import zlib
+
+# ZIP structures (PKWARE APPNOTE 6.3.x). Entries are STORED (no compression):
+# the OOXML formats are already deflated zip containers, so recompressing
+# them would burn CPU for nothing, and stored sizes let us compute the
+# archive length before the first byte is sent.
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIR = struct.Struct('<IHHHHIIH')
+
+_VERSION = 20
+# bit 3: CRC/sizes follow the data in a data descriptor; bit 11: UTF-8 names
+_FLAGS = 0x0808
+_STORED = 0
+_UNIX_FILE_ATTRS = (0o100644 << 16)
+
+_ZIP32_LIMIT = 0xFFFFFFFF
+_MAX_ENTRIES = 0xFFFF
+
+
+def _dos_datetime(dt):
+    year = max(dt.year, 1980)
+    return (
+        (dt.hour << 11) | (dt.minute << 5) | (dt.second // 2),
+        ((year - 1980) << 9) | (dt.month << 5) | dt.day,
+    )
+
+
+def _entry_name(name):
+    """A flat archive name, so extracting a bundle cannot write outside its folder.
+
+    Rows from before upload file names were checked may still hold a path.
+    """
+    name = name.replace('\\', '/').rsplit('/', 1)[-1].replace('\x00', '')
+    return name if name not in ('', '.', '..') else 'file'
+
+
+def _unique_name(name, seen):
+    """Suffix duplicate archive names the way file managers do: a (2).xlsx"""
+    candidate = name
+    root, ext = os.path.splitext(name)
+    n = 1
+    while candidate in seen:
+        n += 1
+        candidate = f'{root} ({n}){ext}'
+    seen.add(candidate)
+    return candidate
+
+
+class ZipStream:
+    """A ZIP archive produced entry by entry while it is being sent.
+
+    ``entries`` is a list of ``(arcname, path, modified_datetime)``. File
+    sizes are taken when the stream is built, which fixes ``size`` (the
+    exact Content-Length) up front; the CRC of each entry is computed on the
+    fly and written in its data descriptor. Nothing is buffered beyond one
+    read chunk.
+
+    Raises FileNotFoundError if an entry is missing on disk and ValueError if
+    the archive would need ZIP64.
+    """
+
+    def __init__(self, entries, chunk_size=64 * 1024, on_complete=None):
+        if len(entries) > _MAX_ENTRIES:
+            raise ValueError('Too many files for one bundle')
+
+        seen = set()
+        self.entries = []
+        for arcname, path, modified in entries:
+            name = _unique_name(_entry_name(arcname), seen).encode('utf-8')
+            self.entries.append((name, path, os.path.getsize(path), _dos_datetime(modified)))
+
+        self.chunk_size = chunk_size
+        self.on_complete = on_complete
+        self._file = None
+
+        central_size = sum(_CENTRAL_HEADER.size + len(name) for name, *_ in self.entries)
+        data_size = sum(
+            _LOCAL_HEADER.size + len(name) + size + _DATA_DESCRIPTOR.size
+            for name, _, size, _ in self.entries
+        )
+        if data_size + central_size > _ZIP32_LIMIT:
+            raise ValueError('Bundle is too large')
+        self.size = data_size + central_size + _END_OF_CENTRAL_DIR.size
+
+    def _read_entry(self, path, size):
+        """Yield exactly ``size`` bytes of ``path`` while accumulating its CRC"""
+        crc = 0
+        remaining = size
+        self._file = open(path, 'rb')
+        try:
+            while remaining > 0:
+                chunk = self._file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f'{path} shrank while being bundled')
+                crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self._file.close()
+            self._file = None
+        self._crc = crc
+
+    def __iter__(self):
+        offset = 0
+        central = []
+
+        for name, path, size, (dos_time, dos_date) in self.entries:
+            header = _LOCAL_HEADER.pack(
+                0x04034b50, _VERSION, _FLAGS, _STORED, dos_time, dos_date,
+                0, 0, 0, len(name), 0
+            ) + name
+            yield header
+            yield from self._read_entry(path, size)
+            yield _DATA_DESCRIPTOR.pack(0x08074b50, self._crc, size, size)
+
+            central.append(_CENTRAL_HEADER.pack(
+                0x02014b50, (3 << 8) | _VERSION, _VERSION, _FLAGS, _STORED, dos_time, dos_date,
+                self._crc, size, size, len(name), 0, 0, 0, 0, _UNIX_FILE_ATTRS, offset
+            ) + name)
+            offset += len(header) + size + _DATA_DESCRIPTOR.size
+
+        central_dir = b''.join(central)
+        yield central_dir
+        yield _END_OF_CENTRAL_DIR.pack(
+            0x06054b50, 0, 0, len(central), len(central), len(central_dir), offset, 0
+        )
+
+        # Only reached once the server has asked for data past the last byte
+        if self.on_complete is not None:
+            self.on_complete()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+import hashlib
+import time
+
+# The catalog version is a counter in the shared cache, bumped whenever the
+# file list may have changed. Rendered list pages are cached under the
+# version current when they were built, so a bump invalidates every cached
+# page at once without having to find and delete them. Document text only
+# shows in ?q= results: search pages are also keyed on a second counter,
+# bumped when text is indexed, which leaves plain list pages cached while
+# uploads are processed.
+VERSION_KEY = 'catalog:version'
+SEARCH_VERSION_KEY = 'catalog:search-version'
+
+# UploadedFile fields that appear in (or filter) the file list; saves that
+# only touch other fields (blob adoption, processing results) leave the
+# catalog as it is
+CATALOG_FIELDS = frozenset({'original_filename', 'file_size', 'file_type', 'uploaded_at', 'uploaded_by'})
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE]
+
+
+def _version_keys(search):
+    return (VERSION_KEY, SEARCH_VERSION_KEY) if search else (VERSION_KEY,)
+
+
+def get_catalog_version(search=False):
+    """The catalog version, combined with the search version for ``search`` pages"""
+    cache = _cache()
+    keys = _version_keys(search)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock rather than 1, so a cache flush can never
+            # bring back a version a client still holds an ETag for
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+async def aget_catalog_version(search=False):
+    cache = _cache()
+    keys = _version_keys(search)
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, int(time.time() * 1000), timeout=None)
+            versions[key] = await cache.aget(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def _bump(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not set (yet, or evicted): any fresh value invalidates old pages
+        cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def bump_catalog_version():
+    _bump(VERSION_KEY)
+
+
+def bump_search_version():
+    """Invalidate ?q= pages only, after document text was indexed"""
+    _bump(SEARCH_VERSION_KEY)
+
+
+def touches_catalog(update_fields):
+    return update_fields is None or not CATALOG_FIELDS.isdisjoint(update_fields)
+
+
+def _page_key(request):
+    """Identity of one list page: absolute URL with the query normalized, and format"""
+    params = sorted(request.GET.lists())
+    source = f"{request.build_absolute_uri(request.path)}?{params!r} {request.accepted_media_type}"
+    return hashlib.sha256(source.encode()).hexdigest()[:32]
+
+
+def _finish(response, etag):
+    response['ETag'] = etag
+    # Clients may keep the page but must revalidate it on every poll
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def cached_catalog_response(request, build_data):
+    """Serve a file list page from the versioned cache.
+
+    ``build_data`` is called on a miss and returns the page data to render.
+    A client whose ETag matches gets a 304 after a single cache read; a hit
+    costs two reads and no ORM or serializer work.
+    """
+    version = get_catalog_version(search=bool(request.GET.get('q')))
+    page_key = _page_key(request)
+    etag = f'"{version}.{page_key[:16]}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache_key = f'catalog:{version}:{page_key}'
+        body = _cache().get(cache_key)
+        if body is None:
+            # Rendered by the view's own (negotiated) renderer
+            body = request.accepted_renderer.render(build_data(), request.accepted_media_type)
+            _cache().set(cache_key, body, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        response = HttpResponse(body, content_type=request.accepted_media_type)
+
+    return _finish(response, etag)
+
+
+async def acached_catalog_response(request, abuild_data):
+    """cached_catalog_response() for async views; ``abuild_data`` is a coroutine function.
+
+    Uses the same keys and ETags, so sync and async workers share pages.
+    """
+    version = await aget_catalog_version(search=bool(request.GET.get('q')))
+    page_key = _page_key(request)
+    etag = f'"{version}.{page_key[:16]}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache_key = f'catalog:{version}:{page_key}'
+        body = await _cache().aget(cache_key)
+        if body is None:
+            body = request.accepted_renderer.render(await abuild_data(), request.accepted_media_type)
+            await _cache().aset(cache_key, body, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        response = HttpResponse(body, content_type=request.accepted_media_type)
+
+    return _finish(response, etag)
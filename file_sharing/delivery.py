@@ -0,0 +1,471 @@
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import get_random_string
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from urllib.parse import quote
+from . import metrics
+from .bundles import ZipStream
+import asyncio
+import hashlib
+import io
+import os
+
+OFFLOAD_BACKENDS = ('x-accel-redirect', 'x-sendfile')
+
+# More ranges than this in one request is treated as abuse and answered
+# with the full file instead (RFC 9110 section 14.2 allows ignoring Range).
+MAX_RANGES = 20
+
+
+def file_etag(file_obj):
+    """Strong ETag for an UploadedFile.
+
+    Deduplicated files use their content hash. Legacy rows fall back to the
+    row identity, storage name and size, which pin the content because
+    stored files are never modified after upload.
+    """
+    if file_obj.blob_id is not None:
+        return '"%s"' % file_obj.blob.sha256
+    source = f"{file_obj.pk}:{file_obj.file.name}:{file_obj.file_size}:{file_obj.uploaded_at.isoformat()}"
+    return '"%s"' % hashlib.sha256(source.encode()).hexdigest()[:32]
+
+
+def parse_range_header(header, size):
+    """Parse a ``Range`` header into sorted, merged ``(start, end)`` pairs.
+
+    Returns None when the header should be ignored (malformed, not bytes,
+    too many ranges) and an empty list when no range is satisfiable.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        start, sep, end = part.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if start:
+                first = int(start)
+                last = int(end) if end else max(first, size - 1)
+                if last < first:
+                    return None
+            else:
+                # Suffix range: the last N bytes
+                length = int(end)
+                first, last = max(size - length, 0), size - 1
+                if length == 0:
+                    continue
+        except ValueError:
+            return None
+        if first < 0:
+            return None
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Evaluate ``If-Range``; a mismatch means the full file must be sent"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    if if_range.startswith('W/'):
+        # Weak validators never match for range requests
+        return False
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class _SendTrackingFile(io.BufferedReader):
+    """Binary file noting how far a server has certainly sent it (``sent_to``).
+
+    Whatever was read before a read() has been written out, since the server
+    asks for the next chunk only then; socket.sendfile() (gunicorn's
+    sendfile path) seeks the file to the offset it reached, even when the
+    client goes away part-way. Either way of sending is therefore observed
+    without taking the file away from ``wsgi.file_wrapper``. Tracking
+    starts once ``sent_to`` is set.
+    """
+    sent_to = None
+
+    def read(self, size=-1):
+        if self.sent_to is not None:
+            self.sent_to = max(self.sent_to, self.tell())
+        return super().read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        position = super().seek(offset, whence)
+        if self.sent_to is not None:
+            self.sent_to = max(self.sent_to, position)
+        return position
+
+
+def _open(path):
+    return _SendTrackingFile(io.FileIO(path))
+
+
+class _TrackedFileResponse(FileResponse):
+    """FileResponse (from the file's position to its end) reporting what it sent.
+
+    The file is still handed to the server's ``wsgi.file_wrapper`` when it
+    has one; how far the transfer got is read from the _SendTrackingFile
+    when the server closes the response, and passed to ``on_delivered``.
+    """
+
+    def __init__(self, f, *args, on_delivered=None, **kwargs):
+        self.on_delivered = on_delivered
+        super().__init__(f, *args, **kwargs)
+        # Set after FileResponse has measured the file by seeking to its end
+        self.tracked_file = f
+        self.start_position = f.tell()
+        self.size = os.fstat(f.fileno()).st_size
+        f.sent_to = self.start_position
+        self.transfer = metrics.Transfer('file')
+
+    def close(self):
+        if not self.transfer.done:
+            sent_to = self.tracked_file.sent_to
+            self.transfer.sent(sent_to - self.start_position)
+            self.transfer.finish()
+            if self.on_delivered is not None:
+                self.on_delivered(self.start_position, sent_to, self.size)
+        super().close()
+
+
+class _RangeStream:
+    """Iterable body for range requests that do not run to end of file"""
+
+    def __init__(self, f, size, parts, chunk_size, on_delivered=None):
+        self.f = f
+        self.size = size
+        self.parts = parts
+        self.chunk_size = chunk_size
+        self.on_delivered = on_delivered
+        # First byte of each part -> end of what has been sent of it
+        self.sent = {}
+
+    def __iter__(self):
+        for prefix, first, last, suffix in self.parts:
+            if prefix:
+                yield prefix
+            self.f.seek(first)
+            position = first
+            while position <= last:
+                chunk = self.f.read(min(self.chunk_size, last - position + 1))
+                if not chunk:
+                    return
+                yield chunk
+                # The server asks for more only once it has written the chunk
+                position += len(chunk)
+                self.sent[first] = position
+            if suffix:
+                yield suffix
+
+    def close(self):
+        try:
+            if self.on_delivered is not None:
+                for first, end in self.sent.items():
+                    self.on_delivered(first, end, self.size)
+        finally:
+            self.f.close()
+
+
+class _MeteredStream:
+    """Iterable body wrapper counting the bytes sent and the transfer time"""
+
+    def __init__(self, stream, kind):
+        self.stream = stream
+        self.transfer = metrics.Transfer(kind)
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.transfer.sent(len(chunk))
+            yield chunk
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.transfer.finish()
+
+
+def _multipart_layout(ranges, size):
+    """``(boundary, parts, length)`` of a multipart/byteranges body"""
+    boundary = get_random_string(32)
+    parts = []
+    length = 0
+    for first, last in ranges:
+        prefix = (
+            f'--{boundary}\r\n'
+            f'Content-Type: application/octet-stream\r\n'
+            f'Content-Range: bytes {first}-{last}/{size}\r\n\r\n'
+        ).encode()
+        parts.append((prefix, first, last, b'\r\n'))
+        length += len(prefix) + (last - first + 1) + 2
+    closing = f'--{boundary}--\r\n'.encode()
+    parts.append((closing, 0, -1, b''))
+    length += len(closing)
+    return boundary, parts, length
+
+
+def _range_response(f, size, ranges, on_delivered):
+    """206 response for a list of satisfiable ranges"""
+    chunk_size = settings.FILE_DOWNLOAD_CHUNK_SIZE
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        if last == size - 1:
+            # A resume from an offset: the same response as a full download
+            f.seek(first)
+            response = _TrackedFileResponse(
+                f, content_type='application/octet-stream', status=206, on_delivered=on_delivered
+            )
+            response.block_size = chunk_size
+        else:
+            response = StreamingHttpResponse(
+                _MeteredStream(_RangeStream(f, size, [(b'', first, last, b'')], chunk_size, on_delivered), 'file'),
+                content_type='application/octet-stream',
+                status=206
+            )
+            response['Content-Length'] = last - first + 1
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        return response
+
+    boundary, parts, length = _multipart_layout(ranges, size)
+    response = StreamingHttpResponse(
+        _MeteredStream(_RangeStream(f, size, parts, chunk_size, on_delivered), 'file'),
+        content_type=f'multipart/byteranges; boundary={boundary}',
+        status=206
+    )
+    response['Content-Length'] = length
+    return response
+
+
+def _offload_response(file_obj):
+    """Hand the transfer to the fronting web server (nginx / Apache / lighttpd)"""
+    response = HttpResponse(content_type='application/octet-stream')
+
+    if settings.FILE_DOWNLOAD_BACKEND == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.FILE_DOWNLOAD_ACCEL_PREFIX + quote(file_obj.file.name)
+    else:
+        response['X-Sendfile'] = file_obj.file.path
+
+    return response
+
+
+def _stream_response(request, file_obj, etag, last_modified, on_delivered):
+    """Stream the file (or the requested ranges) from disk in chunks"""
+    with metrics.timing('storage'):
+        f = _open(file_obj.file.path)
+        size = os.fstat(f.fileno()).st_size
+
+    ranges = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+
+    if ranges == []:
+        f.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if ranges:
+        return _range_response(f, size, ranges, on_delivered)
+
+    # FileResponse takes ownership of the handle and closes it when done
+    response = _TrackedFileResponse(f, content_type='application/octet-stream', on_delivered=on_delivered)
+    response.block_size = settings.FILE_DOWNLOAD_CHUNK_SIZE
+    return response
+
+
+def serve_file(request, file_obj, on_delivered=None):
+    """Build the download response for an UploadedFile.
+
+    Handles conditional requests (304/412) and byte ranges. When the
+    response is closed, ``on_delivered(first, end, size)`` is called for
+    each span of the file that reached the client (a TokenUse decides from
+    these whether a single-use URL is consumed); 304s and HEAD requests
+    deliver nothing. When the transfer is offloaded to the web server it
+    cannot be observed, so the whole file counts as delivered at hand-off.
+
+    Raises FileNotFoundError when streaming and the file is missing on disk.
+    """
+    etag = file_etag(file_obj)
+    last_modified = int(file_obj.uploaded_at.timestamp())
+    if request.method == 'HEAD':
+        on_delivered = None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    if response is None:
+        if settings.FILE_DOWNLOAD_BACKEND in OFFLOAD_BACKENDS:
+            response = _offload_response(file_obj)
+            if on_delivered is not None:
+                on_delivered(0, file_obj.file_size, file_obj.file_size)
+        else:
+            response = _stream_response(request, file_obj, etag, last_modified, on_delivered)
+
+        response['Content-Disposition'] = content_disposition_header(True, file_obj.original_filename)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+# ================================================================
+# Async (ASGI) delivery
+# ================================================================
+
+async def _aread_parts(f, size, parts, chunk_size, on_delivered=None):
+    """Async iterator over ``(prefix, first, last, suffix)`` parts of an open file.
+
+    Each read is a pread in the event loop's default executor, so the file
+    is read without blocking the loop and no thread is held between chunks
+    while a slow client drains the ones already sent. ``on_delivered`` (a
+    coroutine function) is awaited with each span that was sent.
+    """
+    loop = asyncio.get_running_loop()
+    fd = f.fileno()
+    transfer = metrics.Transfer('file')
+    sent = None
+    try:
+        for prefix, first, last, suffix in parts:
+            if prefix:
+                transfer.sent(len(prefix))
+                yield prefix
+            offset = first
+            while offset <= last:
+                chunk = await loop.run_in_executor(None, os.pread, fd, min(chunk_size, last - offset + 1), offset)
+                if not chunk:
+                    return
+                transfer.sent(len(chunk))
+                yield chunk
+                # The server asks for more only once it has written the chunk
+                offset += len(chunk)
+                sent = (first, offset)
+            if suffix:
+                transfer.sent(len(suffix))
+                yield suffix
+            if on_delivered is not None and sent is not None:
+                await on_delivered(*sent, size)
+            sent = None
+    finally:
+        transfer.finish()
+        f.close()
+        # What was sent of a part the client did not wait for
+        if on_delivered is not None and sent is not None:
+            await on_delivered(*sent, size)
+
+
+def _astream_response(request, file_obj, etag, last_modified, on_delivered):
+    # A file object rather than a bare descriptor: closed by the garbage
+    # collector too if the body is never iterated
+    with metrics.timing('storage'):
+        f = open(file_obj.file.path, 'rb', buffering=0)
+        size = os.fstat(f.fileno()).st_size
+    chunk_size = settings.FILE_DOWNLOAD_CHUNK_SIZE
+
+    ranges = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+
+    if ranges == []:
+        f.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if not ranges:
+        response = StreamingHttpResponse(
+            _aread_parts(f, size, [(b'', 0, size - 1, b'')], chunk_size, on_delivered),
+            content_type='application/octet-stream'
+        )
+        response['Content-Length'] = size
+        return response
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        response = StreamingHttpResponse(
+            _aread_parts(f, size, [(b'', first, last, b'')], chunk_size, on_delivered),
+            content_type='application/octet-stream',
+            status=206
+        )
+        response['Content-Length'] = last - first + 1
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        return response
+
+    boundary, parts, length = _multipart_layout(ranges, size)
+    response = StreamingHttpResponse(
+        _aread_parts(f, size, parts, chunk_size, on_delivered),
+        content_type=f'multipart/byteranges; boundary={boundary}',
+        status=206
+    )
+    response['Content-Length'] = length
+    return response
+
+
+async def aserve_file(request, file_obj, on_delivered=None):
+    """serve_file() for async views; ``on_delivered`` is a coroutine function.
+
+    The body is an async iterator, so under ASGI a transfer occupies no
+    thread while it waits on the client.
+    """
+    etag = file_etag(file_obj)
+    last_modified = int(file_obj.uploaded_at.timestamp())
+    if request.method == 'HEAD':
+        on_delivered = None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    if response is None:
+        if settings.FILE_DOWNLOAD_BACKEND in OFFLOAD_BACKENDS:
+            response = _offload_response(file_obj)
+            if on_delivered is not None:
+                await on_delivered(0, file_obj.file_size, file_obj.file_size)
+        else:
+            response = _astream_response(request, file_obj, etag, last_modified, on_delivered)
+
+        response['Content-Disposition'] = content_disposition_header(True, file_obj.original_filename)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+# ================================================================
+# Bundles
+# ================================================================
+
+def serve_bundle(file_objs, filename='files.zip', on_complete=None):
+    """Stream several UploadedFiles as one ZIP archive with a known length.
+
+    Raises FileNotFoundError if a file is missing on disk and ValueError if
+    the bundle is too large for a plain (non-ZIP64) archive.
+    """
+    stream = ZipStream(
+        [(f.original_filename, f.file.path, f.uploaded_at) for f in file_objs],
+        chunk_size=settings.FILE_DOWNLOAD_CHUNK_SIZE,
+        on_complete=on_complete
+    )
+    response = StreamingHttpResponse(_MeteredStream(stream, 'bundle'), content_type='application/zip')
+    response['Content-Length'] = stream.size
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
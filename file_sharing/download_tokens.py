@@ -0,0 +1,425 @@
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .metrics import TOKENS_MINTED, TOKENS_REDEEMED
+from .models import UploadedFile, SecureDownloadURL
+from .utils import encrypt_url, decrypt_url
+import base64
+import os
+import struct
+import time
+import uuid
+
+# Signed tokens carry everything needed to redeem them:
+# file id, user id, expiry (unix seconds) and a random nonce.
+SIGNED_PREFIX = 's.'
+_PAYLOAD = struct.Struct('>QQI12s')
+_MAC_SIZE = 16
+_MAC_SALT = 'file_sharing.download_tokens'
+_BUNDLE_SALT = 'file_sharing.bundle_tokens'
+
+
+class DownloadTokenError(Exception):
+    """Raised when a download token cannot be redeemed; str() is the API message"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _mac(payload):
+    return salted_hmac(_MAC_SALT, payload, algorithm='sha256').digest()[:_MAC_SIZE]
+
+
+def _replay_cache():
+    return caches[settings.DOWNLOAD_TOKEN_REPLAY_CACHE]
+
+
+def _replay_key(nonce):
+    return f'download-token:{nonce.hex()}'
+
+
+# Replay cache values: a token being downloaded, and a used one. Any value
+# makes the atomic add() of a claim fail.
+_IN_USE = 'in-use'
+_USED = 1
+
+
+class TokenUse:
+    """One transfer's hold on a single-use download token, and its consumption.
+
+    Redeeming claims the token with an atomic cache add(), so a concurrent
+    request with the same URL is refused instead of streaming the file too;
+    the claim is released when the response closes (release_on_close()),
+    so a dropped transfer can be resumed. Delivery reports each byte span a
+    response got to the client with delivered() (adelivered() in async
+    views). The token is consumed once the spans cover the whole file from
+    byte 0: in one response, or a dropped one and a Range request resuming
+    where it stopped. A range that leaves a gap, such as a probe of the
+    last byte, consumes nothing. How far the file is covered is kept in the
+    replay cache until the token expires.
+
+    Without ``consume``/``aconsume`` (signed tokens) the claim itself is
+    turned into the record that the token was used.
+    """
+
+    def __init__(self, key, expires, consume=None, aconsume=None):
+        self.key = key
+        self.covered_key = f'{key}:covered'
+        self.expires = expires
+        self._consume = consume
+        self._aconsume = aconsume
+        self.held = False
+
+    def _timeout(self):
+        return max(self.expires - int(time.time()), 1)
+
+    @staticmethod
+    def _refusal(value):
+        if value == _IN_USE:
+            return DownloadTokenError('Download URL is already in use')
+        return DownloadTokenError('Invalid or expired download URL')
+
+    def claim(self):
+        if not _replay_cache().add(self.key, _IN_USE, timeout=self._timeout()):
+            raise self._refusal(_replay_cache().get(self.key))
+        self.held = True
+        return self
+
+    async def aclaim(self):
+        if not await _replay_cache().aadd(self.key, _IN_USE, timeout=self._timeout()):
+            raise self._refusal(await _replay_cache().aget(self.key))
+        self.held = True
+        return self
+
+    def release(self):
+        if self.held:
+            self.held = False
+            _replay_cache().delete(self.key)
+
+    async def arelease(self):
+        if self.held:
+            self.held = False
+            await _replay_cache().adelete(self.key)
+
+    def release_on_close(self, response):
+        response._resource_closers.append(self.release)
+        return response
+
+    def consume(self):
+        if self._consume is not None:
+            self._consume()
+        else:
+            # Remembered only until the token would have expired anyway
+            _replay_cache().set(self.key, _USED, timeout=self._timeout())
+            self.held = False
+
+    async def aconsume(self):
+        if self._aconsume is not None:
+            await self._aconsume()
+        else:
+            await _replay_cache().aset(self.key, _USED, timeout=self._timeout())
+            self.held = False
+
+    def delivered(self, first, end, size):
+        if first == 0 and end >= size:
+            self.consume()
+        elif first < end:
+            covered = _replay_cache().get(self.covered_key, 0)
+            if first <= covered < end:
+                if end >= size:
+                    self.consume()
+                else:
+                    _replay_cache().set(self.covered_key, end, timeout=self._timeout())
+
+    async def adelivered(self, first, end, size):
+        if first == 0 and end >= size:
+            await self.aconsume()
+        elif first < end:
+            covered = await _replay_cache().aget(self.covered_key, 0)
+            if first <= covered < end:
+                if end >= size:
+                    await self.aconsume()
+                else:
+                    await _replay_cache().aset(self.covered_key, end, timeout=self._timeout())
+
+
+# ================================================================
+# Database-backed tokens (SecureDownloadURL rows, kept for auditing)
+# ================================================================
+
+def _new_database_token(file_obj, user):
+    token = uuid.uuid4()
+    return SecureDownloadURL(
+        file=file_obj,
+        user_id=user.id,
+        encrypted_url=encrypt_url(f"{file_obj.id}_{user.id}_{token}"),
+        token=token
+    )
+
+
+def _issue_database_token(file_obj, user):
+    secure_url = _new_database_token(file_obj, user)
+    secure_url.save()
+    return secure_url.encrypted_url, secure_url.expires_at
+
+
+async def _aissue_database_token(file_obj, user):
+    secure_url = _new_database_token(file_obj, user)
+    await secure_url.asave()
+    return secure_url.encrypted_url, secure_url.expires_at
+
+
+def _issue_database_tokens(file_objs, user):
+    """Batch variant of _issue_database_token: one bulk INSERT in one transaction"""
+    expires_at = timezone.now() + timedelta(hours=1)
+    rows = []
+    for file_obj in file_objs:
+        token = uuid.uuid4()
+        rows.append(SecureDownloadURL(
+            file=file_obj,
+            user_id=user.id,
+            encrypted_url=encrypt_url(f"{file_obj.id}_{user.id}_{token}"),
+            token=token,
+            expires_at=expires_at
+        ))
+
+    with transaction.atomic():
+        SecureDownloadURL.objects.bulk_create(rows)
+
+    return [(row.encrypted_url, row.expires_at) for row in rows]
+
+
+def _parse_database_token(encrypted_url):
+    """``(file_id, user_id, token)`` from an encrypted download URL"""
+    decrypted_data = decrypt_url(encrypted_url)
+
+    if not decrypted_data:
+        raise DownloadTokenError('Invalid download URL')
+
+    try:
+        parts = decrypted_data.split('_')
+        return int(parts[0]), int(parts[1]), uuid.UUID(parts[2])
+    except (ValueError, IndexError):
+        raise DownloadTokenError('Invalid or expired download URL')
+
+
+def _database_token_query(encrypted_url):
+    file_id, user_id, token = _parse_database_token(encrypted_url)
+    return SecureDownloadURL.objects.select_related('file__blob').filter(
+        file_id=file_id,
+        user_id=user_id,
+        token=token,
+        is_used=False
+    )
+
+
+def _database_token_use(secure_url):
+    rows = SecureDownloadURL.objects.filter(pk=secure_url.pk)
+
+    def consume():
+        rows.update(is_used=True)
+
+    async def aconsume():
+        await rows.aupdate(is_used=True)
+
+    return TokenUse(f'download-url:{secure_url.token.hex}', int(secure_url.expires_at.timestamp()), consume, aconsume)
+
+
+def _redeem_database_token(encrypted_url):
+    try:
+        secure_url = _database_token_query(encrypted_url).get()
+    except SecureDownloadURL.DoesNotExist:
+        raise DownloadTokenError('Invalid or expired download URL')
+
+    if secure_url.is_expired():
+        raise DownloadTokenError('Download URL has expired')
+
+    return secure_url.file, _database_token_use(secure_url).claim()
+
+
+async def _aredeem_database_token(encrypted_url):
+    try:
+        secure_url = await _database_token_query(encrypted_url).aget()
+    except SecureDownloadURL.DoesNotExist:
+        raise DownloadTokenError('Invalid or expired download URL')
+
+    if secure_url.is_expired():
+        raise DownloadTokenError('Download URL has expired')
+
+    return secure_url.file, await _database_token_use(secure_url).aclaim()
+
+
+# ================================================================
+# Signed tokens (no database writes; optional cache-backed replay check)
+# ================================================================
+
+def _issue_signed_token(file_obj, user):
+    expires = int(time.time()) + settings.SECURE_URL_TIMEOUT
+    payload = _PAYLOAD.pack(file_obj.id, user.id, expires, os.urandom(12))
+    token = SIGNED_PREFIX + _b64encode(payload + _mac(payload))
+    return token, datetime.fromtimestamp(expires, tz=dt_timezone.utc)
+
+
+def _parse_signed_token(token):
+    """``(file_id, expires, nonce)`` from a signed token whose MAC and expiry check out"""
+    try:
+        raw = _b64decode(token[len(SIGNED_PREFIX):])
+    except (ValueError, TypeError):
+        raise DownloadTokenError('Invalid download URL')
+
+    payload, mac = raw[:-_MAC_SIZE], raw[-_MAC_SIZE:]
+    if len(payload) != _PAYLOAD.size or not constant_time_compare(mac, _mac(payload)):
+        raise DownloadTokenError('Invalid download URL')
+
+    file_id, user_id, expires, nonce = _PAYLOAD.unpack(payload)
+    remaining = expires - int(time.time())
+    if remaining <= 0:
+        raise DownloadTokenError('Download URL has expired')
+    return file_id, expires, nonce
+
+
+def _redeem_signed_token(token):
+    file_id, expires, nonce = _parse_signed_token(token)
+
+    try:
+        file_obj = UploadedFile.objects.select_related('blob').get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        raise DownloadTokenError('Invalid or expired download URL')
+
+    if not settings.DOWNLOAD_TOKEN_SINGLE_USE:
+        return file_obj, None
+    return file_obj, TokenUse(_replay_key(nonce), expires).claim()
+
+
+async def _aredeem_signed_token(token):
+    file_id, expires, nonce = _parse_signed_token(token)
+
+    try:
+        file_obj = await UploadedFile.objects.select_related('blob').aget(id=file_id)
+    except UploadedFile.DoesNotExist:
+        raise DownloadTokenError('Invalid or expired download URL')
+
+    if not settings.DOWNLOAD_TOKEN_SINGLE_USE:
+        return file_obj, None
+    return file_obj, await TokenUse(_replay_key(nonce), expires).aclaim()
+
+
+# ================================================================
+# Bundle tokens (several files behind one signed URL)
+# ================================================================
+
+def issue_bundle_token(file_ids, user):
+    """Mint a signed token for a ZIP bundle; returns ``(token, expires_at)``"""
+    expires = int(time.time()) + settings.SECURE_URL_TIMEOUT
+    token = signing.dumps(
+        {'f': list(file_ids), 'u': user.id, 'e': expires, 'n': os.urandom(12).hex()},
+        salt=_BUNDLE_SALT,
+        compress=True
+    )
+    TOKENS_MINTED.inc('bundle')
+    return token, datetime.fromtimestamp(expires, tz=dt_timezone.utc)
+
+
+def redeem_bundle_token(token):
+    """Validate a bundle token; returns ``(file_ids, use)`` (a claimed TokenUse, None unless single-use)"""
+    try:
+        result = _redeem_bundle_token(token)
+    except DownloadTokenError:
+        TOKENS_REDEEMED.inc('bundle', 'rejected')
+        raise
+    TOKENS_REDEEMED.inc('bundle', 'ok')
+    return result
+
+
+def _redeem_bundle_token(token):
+    try:
+        data = signing.loads(token, salt=_BUNDLE_SALT)
+        file_ids, expires, nonce = data['f'], data['e'], bytes.fromhex(data['n'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise DownloadTokenError('Invalid download URL')
+
+    if expires <= int(time.time()):
+        raise DownloadTokenError('Download URL has expired')
+
+    if not settings.DOWNLOAD_TOKEN_SINGLE_USE:
+        return file_ids, None
+    return file_ids, TokenUse(_replay_key(nonce), expires).claim()
+
+
+# ================================================================
+# Public API
+# ================================================================
+
+def issue_download_token(file_obj, user):
+    """Mint a download token for ``file_obj``; returns ``(token, expires_at)``"""
+    TOKENS_MINTED.inc('file')
+    if settings.DOWNLOAD_TOKEN_MODE == 'signed':
+        return _issue_signed_token(file_obj, user)
+    return _issue_database_token(file_obj, user)
+
+
+def issue_download_tokens(file_objs, user):
+    """Mint download tokens for several files; returns ``(token, expires_at)`` pairs in order"""
+    if settings.DOWNLOAD_TOKEN_MODE == 'signed':
+        issued = [_issue_signed_token(file_obj, user) for file_obj in file_objs]
+    else:
+        issued = _issue_database_tokens(file_objs, user)
+    TOKENS_MINTED.inc('file', amount=len(issued))
+    return issued
+
+
+def redeem_download_token(token):
+    """Validate a download token; returns ``(file_obj, use)``.
+
+    Both token formats are accepted regardless of DOWNLOAD_TOKEN_MODE so
+    that URLs minted before a mode switch keep working until they expire.
+    ``use`` is the token's claimed TokenUse, to be told what the transfer
+    delivered and released with the response; it is None when there is
+    nothing to consume (signed tokens with DOWNLOAD_TOKEN_SINGLE_USE off),
+    so that the response need not track the transfer.
+    """
+    redeem = _redeem_signed_token if token.startswith(SIGNED_PREFIX) else _redeem_database_token
+    try:
+        result = redeem(token)
+    except DownloadTokenError:
+        TOKENS_REDEEMED.inc('file', 'rejected')
+        raise
+    TOKENS_REDEEMED.inc('file', 'ok')
+    return result
+
+
+async def aissue_download_token(file_obj, user):
+    """issue_download_token() for async views"""
+    TOKENS_MINTED.inc('file')
+    if settings.DOWNLOAD_TOKEN_MODE == 'signed':
+        return _issue_signed_token(file_obj, user)
+    return await _aissue_database_token(file_obj, user)
+
+
+async def aredeem_download_token(token):
+    """redeem_download_token() for async views (report deliveries with ``use.adelivered()``)"""
+    redeem = _aredeem_signed_token if token.startswith(SIGNED_PREFIX) else _aredeem_database_token
+    try:
+        result = await redeem(token)
+    except DownloadTokenError:
+        TOKENS_REDEEMED.inc('file', 'rejected')
+        raise
+    TOKENS_REDEEMED.inc('file', 'ok')
+    return result
+
+
+def build_download_url(token):
+    return f"http://localhost:8000/api/download/{token}/"
+
+
+def build_bundle_url(token):
+    return f"http://localhost:8000/api/download/bundle/{token}/"
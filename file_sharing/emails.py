@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import transaction
+from .executor import submit
+from .models import OutboundEmail
+from .tasks import drain_outbox
+
+
+def build_verification_url(token):
+    return f"http://localhost:8000/api/verify-email/{token}/"
+
+
+def verification_email(verification, user=None):
+    """Unsaved outbox message asking ``user`` (default: verification.user) to verify their email"""
+    user = user or verification.user
+    return OutboundEmail(
+        subject='Verify Your Email',
+        body=f'Click here to verify your email: {build_verification_url(verification.token)}',
+        from_email=settings.EMAIL_HOST_USER,
+        to=[user.email]
+    )
+
+
+def queue_emails(emails):
+    """Write ``emails`` to the outbox and drain it once the transaction commits.
+
+    Call inside the transaction that creates whatever the emails are about,
+    so a message exists exactly when its data does; nothing talks to the
+    mail server until after commit, and then only in the background.
+    """
+    OutboundEmail.objects.bulk_create(emails, batch_size=settings.OUTBOX_BATCH_SIZE)
+    transaction.on_commit(lambda: submit(drain_outbox))
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.TASK_THREAD_WORKERS,
+                    thread_name_prefix='file-sharing-task'
+                )
+    return _executor
+
+
+def _run(task, args, kwargs):
+    try:
+        task(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', task.name)
+    finally:
+        # Worker threads get their own connections; don't leak them
+        connections.close_all()
+
+
+def submit(task, *args, **kwargs):
+    """Run a Celery task on the configured TASK_BACKEND.
+
+    'celery' sends it to the broker, 'thread' runs it on an in-process
+    thread pool (single-node installs, no Redis needed) and 'eager' runs it
+    inline, which is what tests want.
+    """
+    backend = settings.TASK_BACKEND
+
+    if backend == 'celery':
+        return task.delay(*args, **kwargs)
+    if backend == 'eager':
+        return task(*args, **kwargs)
+    return _get_executor().submit(_run, task, args, kwargs)
+
+
+def submit_later(delay, task, *args, **kwargs):
+    """Run a Celery task on the TASK_BACKEND after ``delay`` seconds.
+
+    The 'eager' backend does not wait and skips the run; work deferred like
+    this must also be picked up by a periodic job (see CELERY_BEAT_SCHEDULE).
+    """
+    backend = settings.TASK_BACKEND
+
+    if backend == 'celery':
+        return task.apply_async(args, kwargs, countdown=delay)
+    if backend == 'eager':
+        return None
+    timer = threading.Timer(delay, submit, (task,) + args, kwargs)
+    timer.daemon = True
+    timer.start()
+    return timer
@@ -0,0 +1,299 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from file_sharing.authentication import ClaimsRefreshToken
+from file_sharing.benchdb import (
+    isolated_database, make_document, pick_size, seed_download_urls, seed_stored_files, seed_users
+)
+from file_sharing.models import UploadedFile
+import asyncio
+import django
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ['signup', 'login', 'upload', 'list_files', 'get_download_url', 'download_file']
+
+LIST_QUERIES = ['?page_size=20', '?page_size=50', '?file_type=docx', '?q=report', '?min_size=100000']
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summary(latencies, statuses, elapsed, expected):
+    ok = statuses.count(expected)
+    summary = {
+        'requests': len(statuses),
+        'errors': len(statuses) - ok,
+        'status_codes': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(ok / elapsed, 1) if elapsed else None,
+    }
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        summary.update(p50_ms=cuts[49], p95_ms=cuts[94], p99_ms=cuts[98])
+    elif latencies:
+        summary.update(p50_ms=latencies[0], p95_ms=latencies[0], p99_ms=latencies[0])
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        if key in summary:
+            summary[key] = round(summary[key] * 1000, 2)
+    summary['peak_rss_mb'] = _peak_rss_mb()
+    return summary
+
+
+def _drain(response):
+    # Streamed downloads are timed until the last byte has been read
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+async def _adrain(response):
+    if not response.streaming:
+        return
+    if response.is_async:
+        async for _ in response.streaming_content:
+            pass
+    else:
+        # A sync stream may touch the database when it finishes
+        await sync_to_async(_drain)(response)
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive signup, login, upload, file list, download URL and download requests '
+        'concurrently against a seeded throwaway database and report latency, '
+        'throughput and peak RSS as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Seeded client users (plus one ops user per 10)')
+        parser.add_argument('--files', type=int, default=100, help='Seeded files with content on disk')
+        parser.add_argument('--urls', type=int, default=None,
+                            help='Outstanding download URLs (default: --requests); each download consumes one')
+        parser.add_argument('--requests', type=int, default=100, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--client', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='Test client to drive requests with; asgi uses the async views when '
+                                 'FILE_SHARING_ASYNC_VIEWS is set')
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--task-backend', choices=['eager', 'thread'], default='eager',
+                            help='Where post-upload processing and outgoing mail run during the benchmark')
+        parser.add_argument('--throttle', action='store_true',
+                            help='Keep the rate throttles and transfer concurrency caps on (off by default: '
+                                 'one client drives every request)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    # ================================================================
+    # Requests
+    # ================================================================
+
+    def _plan(self, scenario, count):
+        """The requests of one scenario, built before timing starts.
+
+        Each is a ``(method, path, kwargs)`` tuple; upload bodies are made
+        lazily by the worker (outside its timer) to bound memory.
+        """
+        rng = self.rng
+        if scenario == 'signup':
+            return [
+                ('post', '/api/signup/', {'data': {
+                    'username': f'signup-{i}',
+                    'email': f'signup-{i}@example.com',
+                    'password': 'password123',
+                    'password_confirm': 'password123',
+                    'user_type': 'client',
+                }})
+                for i in range(count)
+            ]
+        if scenario == 'login':
+            return [
+                ('post', '/api/login/', {'data': {'email': rng.choice(self.clients).email, 'password': 'password123'}})
+                for _ in range(count)
+            ]
+        if scenario == 'upload':
+            return [('post', '/api/upload/', {'headers': self._auth(rng.choice(self.ops)), 'upload': i})
+                    for i in range(count)]
+        if scenario == 'list_files':
+            return [('get', '/api/files/' + rng.choice(LIST_QUERIES), {'headers': self._auth(rng.choice(self.clients))})
+                    for _ in range(count)]
+        if scenario == 'get_download_url':
+            return [
+                ('get', f'/api/files/{rng.choice(self.files).id}/download-url/', {'headers': self._auth(rng.choice(self.clients))})
+                for _ in range(count)
+            ]
+        # download_file: one outstanding URL per request
+        tokens, self.tokens = self.tokens[:count], self.tokens[count:]
+        return [('get', f'/api/download/{token}/', {}) for token in tokens]
+
+    def _auth(self, user):
+        return {'Authorization': f'Bearer {self.access_tokens[user.pk]}'}
+
+    def _prepare(self, kwargs):
+        kwargs = dict(kwargs)
+        index = kwargs.pop('upload', None)
+        if index is not None:
+            file_type = ('docx', 'xlsx', 'pptx')[index % 3]
+            rng = random.Random(self.seed * 1000003 + index)
+            content = make_document(file_type, pick_size(rng), rng)
+            kwargs['data'] = {'file': SimpleUploadedFile(f'upload-{index}.{file_type}', content)}
+        return kwargs
+
+    # ================================================================
+    # Drivers
+    # ================================================================
+
+    def _run_wsgi(self, plan, concurrency):
+        latencies, statuses, lock = [], [], threading.Lock()
+        pending = iter(plan)
+
+        def worker():
+            # Server errors are counted, not raised
+            client = Client(raise_request_exception=False)
+            try:
+                while True:
+                    with lock:
+                        item = next(pending, None)
+                    if item is None:
+                        return
+                    method, path, kwargs = item
+                    kwargs = self._prepare(kwargs)
+                    start = time.perf_counter()
+                    response = getattr(client, method)(path, **kwargs)
+                    _drain(response)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, statuses, time.perf_counter() - start
+
+    def _run_asgi(self, plan, concurrency):
+        latencies, statuses = [], []
+
+        async def worker(queue):
+            client = AsyncClient(raise_request_exception=False)
+            while not queue.empty():
+                method, path, kwargs = queue.get_nowait()
+                kwargs = self._prepare(kwargs)
+                start = time.perf_counter()
+                response = await getattr(client, method)(path, **kwargs)
+                await _adrain(response)
+                latencies.append(time.perf_counter() - start)
+                statuses.append(response.status_code)
+
+        async def main():
+            queue = asyncio.Queue()
+            for item in plan:
+                queue.put_nowait(item)
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(queue) for _ in range(concurrency)))
+            return time.perf_counter() - start
+
+        elapsed = asyncio.run(main())
+        return latencies, statuses, elapsed
+
+    # ================================================================
+    # Command
+    # ================================================================
+
+    def _seed(self, options):
+        self.clients = seed_users(options['users'], user_type='client')
+        self.ops = seed_users(max(1, options['users'] // 10), user_type='ops')
+        self.files = seed_stored_files(options['files'], self.ops[0], self.rng)
+        self.access_tokens = {
+            user.pk: str(ClaimsRefreshToken.for_user(user).access_token) for user in self.clients + self.ops
+        }
+        self.tokens = seed_download_urls(options['urls'], self.files, self.clients[0])
+
+    def handle(self, *args, **options):
+        if options['files'] < 1 or options['users'] < 1:
+            raise CommandError('--users and --files must be at least 1')
+        if options['urls'] is None:
+            options['urls'] = options['requests']
+
+        self.seed = options['seed']
+        self.rng = random.Random(self.seed)
+        run = self._run_asgi if options['client'] == 'asgi' else self._run_wsgi
+        report = {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'client': options['client'],
+            'async_views': settings.FILE_SHARING_ASYNC_VIEWS,
+            'parameters': {key: options[key] for key in (
+                'users', 'files', 'urls', 'requests', 'concurrency', 'task_backend', 'throttle', 'seed'
+            )},
+        }
+        limits = {} if options['throttle'] else {
+            'REST_FRAMEWORK': {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}},
+            'TRANSFER_CONCURRENCY': {},
+        }
+
+        with tempfile.TemporaryDirectory(prefix='bench-endpoints-') as directory, \
+                override_settings(
+                    MEDIA_ROOT=directory,
+                    TASK_BACKEND=options['task_backend'],
+                    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                    **limits
+                ), \
+                isolated_database(directory=directory):
+            self._seed(options)
+            report['dataset'] = {
+                'users': len(self.clients) + len(self.ops),
+                'files': UploadedFile.objects.count(),
+                'outstanding_urls': len(self.tokens),
+            }
+            report['baseline_rss_mb'] = _peak_rss_mb()
+            report['scenarios'] = {}
+
+            expected = {'signup': 201, 'upload': 201}
+            for scenario in options['scenarios']:
+                plan = self._plan(scenario, options['requests'])
+                latencies, statuses, elapsed = run(plan, options['concurrency'])
+                report['scenarios'][scenario] = _summary(latencies, statuses, elapsed, expected.get(scenario, 200))
+                self.stderr.write(f'{scenario}: {len(plan)} requests in {elapsed:.2f}s')
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from file_sharing.benchdb import isolated_database, seed_files, seed_users
+from file_sharing.models import UploadedFile
+from file_sharing.renderers import FastJSONRenderer, orjson
+from file_sharing.serializers import UploadedFileSerializer, UPLOADED_FILE_COLUMNS, project_uploaded_files
+import time
+
+
+def _drf_path(queryset):
+    files = queryset.select_related('uploaded_by')
+    return JSONRenderer().render(UploadedFileSerializer(files, many=True).data)
+
+
+def _fast_path(queryset):
+    return FastJSONRenderer().render(project_uploaded_files(queryset.values_list(*UPLOADED_FILE_COLUMNS)))
+
+
+class Command(BaseCommand):
+    help = 'Compare the DRF serializer and the values_list/orjson fast path on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N runs per path')
+
+    def _time(self, func, queryset, repeat):
+        best, output = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = func(queryset)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'JSON encoder: {"orjson " + orjson.__version__ if orjson else "stdlib json"}')
+        self.stdout.write(f'{"rows":>8} {"DRF":>10} {"fast":>10} {"speedup":>8} {"bytes":>11}')
+
+        with isolated_database():
+            uploader = seed_users(1, user_type='ops')[0]
+            seeded = 0
+            for rows in sorted(options['rows']):
+                if rows > seeded:
+                    seed_files(rows - seeded, uploader, offset=seeded)
+                    seeded = rows
+                queryset = UploadedFile.objects.order_by('-uploaded_at', '-id')[:rows]
+
+                drf_time, drf_output = self._time(_drf_path, queryset, options['repeat'])
+                fast_time, fast_output = self._time(_fast_path, queryset, options['repeat'])
+                if drf_output != fast_output:
+                    raise CommandError(f'Fast path output differs from DRF at {rows} rows')
+
+                self.stdout.write(
+                    f'{rows:>8} {drf_time * 1000:>7.1f} ms {fast_time * 1000:>7.1f} ms '
+                    f'{drf_time / fast_time:>7.2f}x {len(fast_output):>11}'
+                )
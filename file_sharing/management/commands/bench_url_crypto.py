@@ -0,0 +1,43 @@
+from cryptography.fernet import Fernet
+from django.core.management.base import BaseCommand
+from file_sharing.utils import get_or_create_key, encrypt_url, decrypt_url
+import base64
+import time
+
+
+def _legacy_encrypt(data):
+    # The pre-key-ring implementation: key file read and Fernet built per call
+    f = Fernet(get_or_create_key())
+    return base64.urlsafe_b64encode(f.encrypt(data.encode())).decode()
+
+
+def _legacy_decrypt(encrypted_data):
+    f = Fernet(get_or_create_key())
+    return f.decrypt(base64.urlsafe_b64decode(encrypted_data.encode())).decode()
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark encrypt_url/decrypt_url against the uncached per-call key loading'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def _time(self, func, arg, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func(arg)
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    def handle(self, *args, **options):
+        n = options['iterations']
+        payload = '42_7_0b7e4c1e-9c1a-4a4e-bb8f-2f6d1b7a9c10'
+        token = encrypt_url(payload)
+
+        rows = [
+            ('encrypt', self._time(_legacy_encrypt, payload, n), self._time(encrypt_url, payload, n)),
+            ('decrypt', self._time(_legacy_decrypt, token, n), self._time(decrypt_url, token, n)),
+        ]
+
+        self.stdout.write(f'{"op":<8} {"per-call key load":>18} {"key ring":>10} {"speedup":>8}')
+        for op, before, after in rows:
+            self.stdout.write(f'{op:<8} {before:>15.1f} us {after:>7.1f} us {before / after:>7.2f}x')
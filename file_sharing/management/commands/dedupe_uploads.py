@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from file_sharing.models import UploadedFile
+from file_sharing.storage import adopt_legacy_file
+
+
+class Command(BaseCommand):
+    help = 'Move files uploaded before deduplication into content-addressed blobs'
+
+    def handle(self, *args, **options):
+        adopted = missing = 0
+
+        for uploaded_file in UploadedFile.objects.filter(blob__isnull=True).iterator():
+            try:
+                if adopt_legacy_file(uploaded_file):
+                    adopted += 1
+            except FileNotFoundError:
+                missing += 1
+                self.stderr.write(f'File {uploaded_file.id}: {uploaded_file.file.name} is missing on disk')
+
+        self.stdout.write(self.style.SUCCESS(f'{adopted} file(s) moved to blobs, {missing} missing'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from file_sharing.models import OutboundEmail
+from file_sharing.outbox import queue_depth
+from file_sharing.tasks import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails now and report the queue depth'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='store_true', help='Only report the queue depth')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Give messages that ran out of attempts another round first')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.stdout.write(str(queue_depth()))
+            return
+
+        if options['retry_failed']:
+            count = OutboundEmail.objects.filter(status='failed').update(
+                status='pending', attempts=0, next_attempt_at=timezone.now()
+            )
+            self.stdout.write(f'Requeued {count} failed message(s)')
+
+        # Run inline, whatever TASK_BACKEND says
+        result = drain_outbox()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {result['sent']} message(s), {result['failed']} failed; queue depth {result['depth']}"
+        ))
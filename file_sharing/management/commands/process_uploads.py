@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from file_sharing.executor import submit
+from file_sharing.models import UploadedFile
+from file_sharing.tasks import process_uploaded_file
+
+
+class Command(BaseCommand):
+    help = 'Queue the post-upload processing pipeline for files that have not been processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every file, including ready ones')
+        parser.add_argument('--failed', action='store_true', help='Retry files whose processing failed')
+
+    def handle(self, *args, **options):
+        files = UploadedFile.objects.all()
+        if not options['all']:
+            statuses = ['pending', 'failed'] if options['failed'] else ['pending']
+            files = files.filter(processing_status__in=statuses)
+
+        count = 0
+        for file_id in files.values_list('id', flat=True).iterator():
+            submit(process_uploaded_file, file_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Queued {count} file(s) for processing'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from file_sharing.provisioning import ProvisioningError, parse_users, provision_users
+import time
+
+
+class Command(BaseCommand):
+    help = 'Create users in bulk from a CSV (username,email,password[,user_type]) or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension')
+        parser.add_argument('--user-type', choices=['client', 'ops'], default='client',
+                            help='For rows without a user_type')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('json' if path.lower().endswith('.json') else 'csv')
+
+        try:
+            with open(path, 'rb') as f:
+                rows = parse_users(f.read(), fmt)
+        except (OSError, ProvisioningError) as e:
+            raise CommandError(str(e))
+
+        start = time.perf_counter()
+        try:
+            users, errors = provision_users(rows, default_user_type=options['user_type'])
+        except ProvisioningError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        for error in errors:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} user(s) in {elapsed:.1f}s; {len(errors)} row(s) rejected'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from file_sharing.reaper import reap_expired_rows, reaper_metrics
+
+
+class Command(BaseCommand):
+    help = 'Delete expired download URLs, email verifications, upload sessions and sent outbox mail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stats', action='store_true', help='Only show what previous runs purged')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(str(reaper_metrics()))
+            return
+
+        counts = reap_expired_rows()
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {sum(counts.values())} row(s)'))
@@ -0,0 +1,24 @@
+from cryptography.fernet import Fernet
+from django.core.management.base import BaseCommand
+from file_sharing.utils import read_keys, write_keys
+
+
+class Command(BaseCommand):
+    help = 'Prepend a new primary URL encryption key, keeping older keys for decryption'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int, default=2,
+            help='Number of previous keys to keep for decrypting outstanding URLs (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        old_keys = read_keys()
+        keys = [Fernet.generate_key()] + old_keys[:options['keep']]
+        write_keys(keys)
+
+        retired = len(old_keys) - (len(keys) - 1)
+        self.stdout.write(self.style.SUCCESS(
+            f'New primary key installed; {len(keys) - 1} previous key(s) kept, {retired} retired. '
+            'Running processes pick it up on their next key file check or reload signal.'
+        ))
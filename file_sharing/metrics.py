@@ -0,0 +1,261 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import bisect
+import threading
+import time
+
+# In-process metrics, exported in the Prometheus text format at /metrics.
+# Each process keeps its own registry, so with several worker processes
+# every scrape sees one worker; scrape them individually or run one
+# process per port.
+#
+# Per-request timings (database, URL crypto, storage) are collected only for
+# requests sampled by RequestTimingMiddleware (METRICS_SAMPLE_RATE): the
+# hooks below cost a ContextVar lookup when the request is not sampled.
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _samples(self):
+        with self._lock:
+            return [(labels, value) for labels, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labels, value in self._samples():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            return [(labels, (list(counts), total, count)) for labels, (counts, total, count) in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labels, (counts, total, count) in self._samples():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format(bound if bound == '+Inf' else _format_value(float(bound)))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ================================================================
+# Metrics
+# ================================================================
+
+REQUEST_DURATION = Histogram(
+    'file_sharing_request_duration_seconds',
+    'Time until the response (headers and any non-streamed body) was ready', ['endpoint']
+)
+REQUEST_DB_TIME = Histogram(
+    'file_sharing_request_db_seconds', 'Database time per sampled request', ['endpoint']
+)
+REQUEST_DB_QUERIES = Histogram(
+    'file_sharing_request_db_queries', 'Database queries per sampled request', ['endpoint'], buckets=COUNT_BUCKETS
+)
+REQUEST_CRYPTO_TIME = Histogram(
+    'file_sharing_request_crypto_seconds', 'URL encryption/decryption time per sampled request', ['endpoint']
+)
+REQUEST_STORAGE_TIME = Histogram(
+    'file_sharing_request_storage_seconds', 'File storage I/O time per sampled request', ['endpoint']
+)
+
+UPLOAD_BYTES = Counter('file_sharing_upload_bytes_total', 'File content bytes received')
+DOWNLOAD_BYTES = Counter('file_sharing_download_bytes_total', 'File content bytes sent', ['kind'])
+ACTIVE_TRANSFERS = Gauge('file_sharing_active_transfers', 'Uploads being received and downloads streaming', ['kind'])
+TRANSFER_DURATION = Histogram(
+    'file_sharing_transfer_duration_seconds', 'Time from the start of a transfer (download stream, upload body) to its end', ['kind'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+)
+TOKENS_MINTED = Counter('file_sharing_download_tokens_minted_total', 'Download tokens issued', ['kind'])
+TOKENS_REDEEMED = Counter(
+    'file_sharing_download_tokens_redeemed_total', 'Download token redemptions by outcome', ['kind', 'result']
+)
+
+
+# ================================================================
+# Per-request timings
+# ================================================================
+
+class RequestTimings:
+    """What one sampled request spent, by phase (seconds)"""
+    __slots__ = ('db', 'queries', 'crypto', 'storage')
+
+    def __init__(self):
+        self.db = 0.0
+        self.queries = 0
+        self.crypto = 0.0
+        self.storage = 0.0
+
+
+# The timings of the current request; None when it is not sampled
+_current = ContextVar('file_sharing_request_timings', default=None)
+
+
+def start_request():
+    """Begin collecting timings; returns ``(timings, token)``, the token for end_request()"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def timed(phase):
+    """Decorator adding the function's run time to ``phase`` of the sampled request"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                setattr(timings, phase, getattr(timings, phase) + time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def timing(phase):
+    """Context manager form of timed()"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, phase, getattr(timings, phase) + time.perf_counter() - start)
+
+
+def database_timer(execute, sql, params, many, context):
+    """Connection execute wrapper timing queries of sampled requests (installed in signals.py)"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+
+
+# ================================================================
+# Transfers
+# ================================================================
+
+class Transfer:
+    """Book-keeping of one transfer: active gauge, duration and (for downloads) bytes sent.
+
+    Also a context manager, for uploads received within one block.
+    """
+    __slots__ = ('kind', 'started', 'done')
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.done = False
+        ACTIVE_TRANSFERS.inc(kind)
+
+    def sent(self, size):
+        DOWNLOAD_BYTES.inc(self.kind, amount=size)
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            ACTIVE_TRANSFERS.dec(self.kind)
+            TRANSFER_DURATION.observe(time.perf_counter() - self.started, self.kind)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
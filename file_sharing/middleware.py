@@ -0,0 +1,124 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import metrics
+from .routers import PIN_COOKIE, end_request, start_request
+import random
+import time
+
+
+class DatabasePinMiddleware:
+    """Read-your-writes for the primary/replica router.
+
+    A request from a client that wrote recently (it carries the pin cookie)
+    reads only from the primary; a request that writes sets the cookie for
+    DATABASE_REPLICA_PIN_SECONDS, which should cover the replica's lag.
+    Works in sync and async middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, response, wrote):
+        if wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = start_request(pinned=PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = end_request(token)
+        return self._finish(response, wrote)
+
+    async def __acall__(self, request):
+        token = start_request(pinned=PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = end_request(token)
+        return self._finish(response, wrote)
+
+
+class RequestTimingMiddleware:
+    """Request timings for the Server-Timing header and the histograms in metrics.py.
+
+    Every request's duration is recorded. Database, URL crypto and storage
+    time are collected for a METRICS_SAMPLE_RATE fraction of requests, which
+    also get the Server-Timing header (METRICS_SERVER_TIMING). A streamed
+    body is sent after the response leaves here, so downloads report the
+    time to the first byte; transfers are measured in delivery.py.
+    Goes first in MIDDLEWARE so the total covers the whole chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        rate = settings.METRICS_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def _finish(self, request, response, start, timings):
+        total = time.perf_counter() - start
+        match = request.resolver_match
+        endpoint = (match.url_name or match.view_name) if match else 'unmatched'
+        metrics.REQUEST_DURATION.observe(total, endpoint)
+
+        if timings is not None:
+            metrics.REQUEST_DB_TIME.observe(timings.db, endpoint)
+            metrics.REQUEST_DB_QUERIES.observe(timings.queries, endpoint)
+            metrics.REQUEST_CRYPTO_TIME.observe(timings.crypto, endpoint)
+            metrics.REQUEST_STORAGE_TIME.observe(timings.storage, endpoint)
+            if settings.METRICS_SERVER_TIMING:
+                response['Server-Timing'] = (
+                    f'total;dur={total * 1000:.2f}, '
+                    f'db;dur={timings.db * 1000:.2f};desc="{timings.queries} queries", '
+                    f'crypto;dur={timings.crypto * 1000:.2f}, '
+                    f'storage;dur={timings.storage * 1000:.2f}'
+                )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        if not self._sampled():
+            return self._finish(request, self.get_response(request), start, None)
+
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, start, timings)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        if not self._sampled():
+            return self._finish(request, await self.get_response(request), start, None)
+
+        # sync_to_async() copies the context, so database time spent in
+        # worker threads lands in the same RequestTimings
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, start, timings)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_sharing', '0004_upload_processing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='uploadedfile_listing_idx'),
+        ),
+    ]
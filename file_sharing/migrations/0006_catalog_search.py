@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+def create_search_table(apps, schema_editor):
+    """Full-text index of file names and document text (see file_sharing.search).
+
+    Existing files are indexed by name here; their text is added by
+    `manage.py process_uploads --all`.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE file_sharing_search "
+            "USING fts5(filename, content, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO file_sharing_search (rowid, filename, content) "
+            "SELECT id, original_filename, '' FROM file_sharing_uploadedfile"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE file_sharing_search ("
+            "file_id bigint PRIMARY KEY REFERENCES file_sharing_uploadedfile(id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX file_sharing_search_document_idx ON file_sharing_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO file_sharing_search (file_id, document) "
+            "SELECT id, setweight(to_tsvector('simple', original_filename), 'A') FROM file_sharing_uploadedfile"
+        )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS file_sharing_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_sharing', '0005_file_listing_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['file_type', '-uploaded_at', '-id'], name='uploadedfile_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['uploaded_by', '-uploaded_at', '-id'], name='uploadedfile_uploader_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['file_size'], name='uploadedfile_size_idx'),
+        ),
+    ]
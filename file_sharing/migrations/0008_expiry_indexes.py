@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_sharing', '0007_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailverification',
+            index=models.Index(fields=['expires_at'], name='emailverification_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='securedownloadurl',
+            index=models.Index(fields=['expires_at'], name='securedownloadurl_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(fields=['expires_at'], name='uploadsession_expiry_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
@@ -26,6 +27,12 @@ class EmailVerification(models.Model):
     expires_at = models.DateTimeField()
     is_verified = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Expired rows are deleted in batches (file_sharing.reaper)
+            models.Index(fields=['expires_at'], name='emailverification_expiry_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.expires_at:
             self.expires_at = timezone.now() + timedelta(hours=24)
@@ -34,23 +41,172 @@ class EmailVerification(models.Model):
     def is_expired(self):
         return timezone.now() > self.expires_at
 
+class ProvisioningJob(models.Model):
+    """A bulk provisioning request, run in the background (see provisioning.run_job)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # The submitted rows as encrypted JSON (they hold passwords); cleared
+    # once the job has run
+    payload = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # {'users': [...], 'errors': [...]} when done, {'error': ...} when failed
+    result = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='provisioningjob_expiry_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if not self.expires_at:
+            self.expires_at = timezone.now() + timedelta(hours=24)
+        super().save(*args, **kwargs)
+
+class OutboundEmail(models.Model):
+    """A queued email (transactional outbox), delivered by the drain_outbox task"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When a pending message is due; for a claimed ('sending') one, when the
+    # claim lapses and another drain may pick it up
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outboundemail_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+def blob_upload_to(instance, filename):
+    """Content-addressed location: blobs/ab/abcdef..."""
+    return f"blobs/{instance.sha256[:2]}/{instance.sha256}"
+
+class FileBlob(models.Model):
+    """A unique piece of stored content, shared by every UploadedFile with the same SHA-256"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} refs)"
+
 class UploadedFile(models.Model):
     ALLOWED_EXTENSIONS = [
         ('pptx', 'PowerPoint'),
         ('docx', 'Word Document'),
         ('xlsx', 'Excel Spreadsheet'),
     ]
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
     
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     file = models.FileField(upload_to='uploads/')
+    # Deduplicated content; `file` points at the blob's file. Null for rows
+    # uploaded before deduplication (see the dedupe_uploads command).
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='uploads')
     original_filename = models.CharField(max_length=255)
     file_size = models.BigIntegerField()
     file_type = models.CharField(max_length=10, choices=ALLOWED_EXTENSIONS)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Filled in by the post-upload pipeline (file_sharing.tasks)
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_STATUS_CHOICES, default='pending')
+    processing_error = models.TextField(blank=True, default='')
+    metadata = models.JSONField(default=dict, blank=True)
+    preview = models.ImageField(upload_to='previews/', null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination of the file list (newest first)
+            models.Index(fields=['-uploaded_at', '-id'], name='uploadedfile_listing_idx'),
+            # The same order within one type / one uploader, for filtered lists
+            models.Index(fields=['file_type', '-uploaded_at', '-id'], name='uploadedfile_type_idx'),
+            models.Index(fields=['uploaded_by', '-uploaded_at', '-id'], name='uploadedfile_uploader_idx'),
+            models.Index(fields=['file_size'], name='uploadedfile_size_idx'),
+        ]
     
     def __str__(self):
         return f"{self.original_filename} - {self.uploaded_by.username}"
 
+class UploadSession(models.Model):
+    """A resumable upload: chunks are written straight into `staging_name`"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=10, choices=UploadedFile.ALLOWED_EXTENSIONS)
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    staging_name = models.CharField(max_length=255)
+    uploaded_file = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True)
+    is_complete = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='uploadsession_expiry_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if not self.expires_at:
+            self.expires_at = timezone.now() + timedelta(seconds=settings.CHUNKED_UPLOAD_SESSION_TIMEOUT)
+        super().save(*args, **kwargs)
+    
+    def is_expired(self):
+        return timezone.now() > self.expires_at
+    
+    @property
+    def total_chunks(self):
+        return -(-self.total_size // self.chunk_size)
+    
+    def chunk_length(self, index):
+        """Expected size of chunk `index` (the last one may be short)"""
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_chunk'),
+        ]
+
 class SecureDownloadURL(models.Model):
     file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -60,6 +216,11 @@ class SecureDownloadURL(models.Model):
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='securedownloadurl_expiry_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.expires_at:
             self.expires_at = timezone.now() + timedelta(hours=1)
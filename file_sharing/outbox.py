@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from datetime import timedelta
+from .models import OutboundEmail
+import logging
+import random
+import smtplib
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the connection is unusable: the rest of the batch is
+# put back without counting an attempt against each message
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for a message that failed ``attempts`` times"""
+    delay = min(settings.OUTBOX_RETRY_BASE * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(size):
+    """Claim up to ``size`` due messages for this drain and return them.
+
+    Pending messages whose time has come, and claimed ones whose drain died
+    (claim older than OUTBOX_CLAIM_TIMEOUT), are taken with one conditional
+    UPDATE, so concurrent drains never send the same message twice.
+    """
+    now = timezone.now()
+    due = Q(status__in=['pending', 'sending'], next_attempt_at__lte=now)
+    ids = list(OutboundEmail.objects.filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:size])
+    if not ids:
+        return []
+
+    claim = uuid.uuid4()
+    OutboundEmail.objects.filter(due, id__in=ids).update(
+        status='sending',
+        claimed_by=claim,
+        next_attempt_at=now + timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+    )
+    return list(OutboundEmail.objects.filter(id__in=ids, claimed_by=claim).order_by('id'))
+
+
+def _message(email):
+    return EmailMessage(email.subject, email.body, email.from_email or None, email.to)
+
+
+def _fail(email, error, now):
+    attempts = email.attempts + 1
+    exhausted = attempts >= settings.OUTBOX_MAX_ATTEMPTS
+    OutboundEmail.objects.filter(id=email.id, claimed_by=email.claimed_by).update(
+        status='failed' if exhausted else 'pending',
+        attempts=attempts,
+        next_attempt_at=now if exhausted else now + retry_delay(attempts),
+        claimed_by=None,
+        last_error=str(error)[:1000]
+    )
+    if exhausted:
+        logger.error('Giving up on outbound email %s after %s attempts: %s', email.id, attempts, error)
+
+
+def _release(emails, error, retry_at):
+    """Put claimed messages that were never tried back in the queue"""
+    if not emails:
+        return
+    OutboundEmail.objects.filter(id__in=[email.id for email in emails], claimed_by=emails[0].claimed_by).update(
+        status='pending', next_attempt_at=retry_at, claimed_by=None, last_error=str(error)[:1000]
+    )
+
+
+def deliver_batch(emails):
+    """Send claimed messages over one connection; returns ``(sent, failed)`` counts.
+
+    Sent messages are marked in one UPDATE. A message the server rejects is
+    rescheduled with backoff (or marked failed after OUTBOX_MAX_ATTEMPTS).
+    If the connection cannot be opened or drops, the message being sent
+    counts a failed attempt and the ones not yet tried are put back after
+    the same delay.
+    """
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning('Could not open a mail connection: %s', e)
+        now = timezone.now()
+        for email in emails:
+            _fail(email, e, now)
+        return 0, len(emails)
+
+    sent_ids, failed = [], 0
+    try:
+        for position, email in enumerate(emails):
+            try:
+                connection.send_messages([_message(email)])
+            except _CONNECTION_ERRORS as e:
+                logger.warning('Mail connection lost after %s message(s): %s', position, e)
+                now = timezone.now()
+                _fail(email, e, now)
+                _release(emails[position + 1:], e, now + retry_delay(1))
+                failed += len(emails) - position
+                break
+            except Exception as e:
+                logger.warning('Outbound email %s was not accepted: %s', email.id, e)
+                _fail(email, e, timezone.now())
+                failed += 1
+            else:
+                sent_ids.append(email.id)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        if sent_ids:
+            OutboundEmail.objects.filter(id__in=sent_ids).update(
+                status='sent', sent_at=timezone.now(), claimed_by=None, last_error=''
+            )
+    return len(sent_ids), failed
+
+
+def queue_depth():
+    """Counts of unsent messages by status, and the age in seconds of the oldest one waiting"""
+    unsent = OutboundEmail.objects.exclude(status='sent')
+    depth = {'pending': 0, 'sending': 0, 'failed': 0}
+    depth.update(unsent.values_list('status').annotate(count=Count('id')).order_by())
+    oldest = unsent.filter(status__in=['pending', 'sending']).aggregate(oldest=Min('created_at'))['oldest']
+    depth['oldest_unsent_age'] = round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0
+    return depth
+
+
+def next_due_in():
+    """Seconds until the earliest pending message is due, or None if none is waiting"""
+    next_at = OutboundEmail.objects.filter(status='pending').aggregate(next_at=Min('next_attempt_at'))['next_at']
+    if next_at is None:
+        return None
+    return max((next_at - timezone.now()).total_seconds(), 0)
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from datetime import datetime, timezone as dt_timezone
+import base64
+import struct
+
+# Cursor payload: direction (0 forward, 1 backward), uploaded_at in
+# microseconds since the epoch, and id of the row the page starts after
+_CURSOR = struct.Struct('>BqQ')
+
+
+class FileKeysetPagination(BasePagination):
+    """Keyset (seek) pagination over UploadedFile, newest first.
+
+    Pages are ordered by ``(uploaded_at, id)`` descending and each page
+    starts strictly after the last row of the previous one, so fetching page
+    1000 is the same index range scan as fetching page 1 (no OFFSET). The
+    ``id`` tie-breaker keeps rows with identical timestamps from being
+    skipped or repeated. Cursors are opaque url-safe strings.
+
+    Works on model querysets and on ``values_list(..., named=True)``
+    querysets that include ``id`` and ``uploaded_at``.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.FILE_LIST_PAGE_SIZE
+        self.max_page_size = settings.FILE_LIST_MAX_PAGE_SIZE
+
+    def _encode_cursor(self, reverse, row):
+        micros = int(row.uploaded_at.timestamp()) * 1_000_000 + row.uploaded_at.microsecond
+        raw = _CURSOR.pack(int(reverse), micros, row.id)
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+    def _decode_cursor(self, value):
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            reverse, micros, row_id = _CURSOR.unpack(raw)
+            seconds, micro = divmod(micros, 1_000_000)
+            uploaded_at = datetime.fromtimestamp(seconds, tz=dt_timezone.utc).replace(microsecond=micro)
+        except (ValueError, TypeError, struct.error, OverflowError, OSError):
+            raise NotFound('Invalid cursor')
+        return bool(reverse), uploaded_at, row_id
+
+    def _get_page_size(self, request):
+        try:
+            value = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(value, 1), self.max_page_size)
+
+    def _link(self, reverse, row):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self._encode_cursor(reverse, row))
+
+    def _seek(self, queryset, request):
+        """The queryset for the requested page, plus one row"""
+        self.request = request
+        self.page_size_value = self._get_page_size(request)
+
+        self.cursor = request.GET.get(self.cursor_query_param)
+        reverse, uploaded_at, row_id = self._decode_cursor(self.cursor) if self.cursor else (False, None, None)
+        self.reverse = reverse
+
+        if reverse:
+            queryset = queryset.order_by('uploaded_at', 'id')
+        else:
+            queryset = queryset.order_by('-uploaded_at', '-id')
+
+        if uploaded_at is not None:
+            # (uploaded_at, id) < (t, i), spelled out for backends without row
+            # values; the plain range on uploaded_at lets the planner seek the index
+            if reverse:
+                queryset = queryset.filter(uploaded_at__gte=uploaded_at).filter(
+                    Q(uploaded_at__gt=uploaded_at) | Q(uploaded_at=uploaded_at, id__gt=row_id)
+                )
+            else:
+                queryset = queryset.filter(uploaded_at__lte=uploaded_at).filter(
+                    Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=row_id)
+                )
+
+        # One extra row tells whether there is another page in this direction
+        return queryset[:self.page_size_value + 1]
+
+    def _page(self, rows):
+        page_size = self.page_size_value
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if self.reverse:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = self.cursor is not None, has_more
+
+        self.next_link = self._link(False, rows[-1]) if rows and has_next else None
+        self.previous_link = self._link(True, rows[0]) if rows and has_previous else None
+        if not rows and self.cursor is not None:
+            # Walked off either end: offer the way back to the first page
+            self.previous_link = remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._page(list(self._seek(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset() for async views (async ORM iteration)"""
+        return self._page([row async for row in self._seek(queryset, request)])
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
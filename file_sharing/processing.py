@@ -0,0 +1,173 @@
+from django.conf import settings
+from PIL import Image
+import io
+import xml.etree.ElementTree as ET
+import zipfile
+
+# Main part every valid document of each type must contain
+MAIN_PARTS = {
+    'docx': 'word/document.xml',
+    'pptx': 'ppt/presentation.xml',
+    'xlsx': 'xl/workbook.xml',
+}
+
+NS = {
+    'cp': 'http://schemas.openxmlformats.org/package/2006/metadata/core-properties',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'dcterms': 'http://purl.org/dc/terms/',
+    'ep': 'http://schemas.openxmlformats.org/officeDocument/2006/extended-properties',
+    'ss': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+}
+
+THUMBNAIL_PARTS = ('docProps/thumbnail.jpeg', 'docProps/thumbnail.jpg', 'docProps/thumbnail.png')
+PREVIEW_SIZE = (320, 320)
+
+
+def validate_ooxml(path, file_type):
+    """Check the zip container and OOXML package structure; raises ValueError"""
+    if not zipfile.is_zipfile(path):
+        raise ValueError('Not a zip container')
+
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+        names = {info.filename for info in infos}
+
+        if len(infos) > settings.OOXML_MAX_ENTRIES:
+            raise ValueError('Too many parts in package')
+
+        # Zip bomb guard before anything is decompressed
+        if sum(info.file_size for info in infos) > settings.OOXML_MAX_UNCOMPRESSED_SIZE:
+            raise ValueError('Package expands beyond the allowed size')
+
+        if '[Content_Types].xml' not in names:
+            raise ValueError('Missing [Content_Types].xml')
+        if MAIN_PARTS[file_type] not in names:
+            raise ValueError(f'Missing {MAIN_PARTS[file_type]} for a {file_type} document')
+
+        bad_member = archive.testzip()
+        if bad_member is not None:
+            raise ValueError(f'Corrupt part {bad_member}')
+
+        # The package manifest must at least be well-formed XML
+        ET.fromstring(archive.read('[Content_Types].xml'))
+
+
+def _text(root, path):
+    if root is None:
+        return None
+    element = root.find(path, NS)
+    if element is None or element.text is None:
+        return None
+    return element.text.strip() or None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse(archive, name, names):
+    if name not in names:
+        return None
+    try:
+        return ET.fromstring(archive.read(name))
+    except ET.ParseError:
+        return None
+
+
+def extract_metadata(path, file_type):
+    """Title, author, dates and page/slide/sheet counts from the package"""
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        core = _parse(archive, 'docProps/core.xml', names)
+        app = _parse(archive, 'docProps/app.xml', names)
+
+        metadata = {
+            'title': _text(core, 'dc:title'),
+            'author': _text(core, 'dc:creator'),
+            'last_modified_by': _text(core, 'cp:lastModifiedBy'),
+            'created': _text(core, 'dcterms:created'),
+            'modified': _text(core, 'dcterms:modified'),
+            'application': _text(app, 'ep:Application'),
+        }
+
+        if file_type == 'docx':
+            metadata['page_count'] = _int(_text(app, 'ep:Pages'))
+            metadata['word_count'] = _int(_text(app, 'ep:Words'))
+        elif file_type == 'pptx':
+            slides = sum(1 for n in names if n.startswith('ppt/slides/slide') and n.endswith('.xml'))
+            metadata['slide_count'] = _int(_text(app, 'ep:Slides')) or slides
+        elif file_type == 'xlsx':
+            workbook = _parse(archive, 'xl/workbook.xml', names)
+            sheets = workbook.findall('ss:sheets/ss:sheet', NS) if workbook is not None else []
+            metadata['sheet_count'] = len(sheets)
+            metadata['sheet_names'] = [sheet.get('name') for sheet in sheets]
+
+    return metadata
+
+
+def _text_parts(names, file_type):
+    """Package parts holding the document's text, in reading order"""
+    if file_type == 'docx':
+        prefixes = ('word/document.xml', 'word/header', 'word/footer', 'word/footnotes.xml')
+    elif file_type == 'pptx':
+        prefixes = ('ppt/slides/slide', 'ppt/notesSlides/notesSlide')
+    else:
+        prefixes = ('xl/sharedStrings.xml',)
+
+    def slide_number(name):
+        digits = ''.join(c for c in name.rsplit('/', 1)[-1] if c.isdigit())
+        return int(digits) if digits else 0
+
+    return sorted(
+        (n for n in names if n.endswith('.xml') and n.startswith(prefixes)),
+        key=lambda n: (prefixes.index(next(p for p in prefixes if n.startswith(p))), slide_number(n))
+    )
+
+
+def extract_text(path, file_type, max_length):
+    """Plain text of a document (runs, slide text, shared strings) for search.
+
+    Parts are parsed incrementally and reading stops after ``max_length``
+    characters, so large documents cost bounded memory.
+    """
+    pieces = []
+    length = 0
+    with zipfile.ZipFile(path) as archive:
+        for name in _text_parts(archive.namelist(), file_type):
+            with archive.open(name) as part:
+                try:
+                    for _, element in ET.iterparse(part):
+                        # w:t (Word), a:t (DrawingML) and t (SpreadsheetML)
+                        if element.tag.rsplit('}', 1)[-1] == 't' and element.text:
+                            pieces.append(element.text)
+                            length += len(element.text) + 1
+                            if length >= max_length:
+                                return ' '.join(pieces)[:max_length]
+                        element.clear()
+                except ET.ParseError:
+                    continue
+    return ' '.join(pieces)
+
+
+def extract_preview(path):
+    """PNG thumbnail from the thumbnail part Office embeds, or None"""
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        for name in THUMBNAIL_PARTS:
+            if name in names:
+                data = archive.read(name)
+                break
+        else:
+            return None
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(PREVIEW_SIZE)
+        output = io.BytesIO()
+        image.convert('RGB').save(output, format='PNG')
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return output.getvalue()
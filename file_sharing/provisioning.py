@@ -0,0 +1,203 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from datetime import timedelta
+from .emails import queue_emails, verification_email
+from .models import User, EmailVerification, ProvisioningJob
+from .serializers import ProvisionUserSerializer
+from .utils import decrypt_url, encrypt_url
+import csv
+import io
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('username', 'email', 'password', 'user_type')
+
+
+class ProvisioningError(Exception):
+    """Raised when a provisioning file cannot be read at all; str() is the API message"""
+
+
+def parse_users(data, fmt):
+    """Rows (dicts) from CSV text with a header line, or from a JSON list"""
+    if fmt == 'json':
+        try:
+            rows = json.loads(data) if isinstance(data, (str, bytes)) else data
+        except ValueError as e:
+            raise ProvisioningError(f'Invalid JSON: {e}')
+        if isinstance(rows, dict):
+            rows = rows.get('users')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ProvisioningError('Expected a list of user objects')
+        return rows
+
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    reader = csv.DictReader(io.StringIO(data))
+    if not reader.fieldnames or not {'username', 'email', 'password'} <= set(reader.fieldnames):
+        raise ProvisioningError('CSV needs a header with username, email and password columns')
+    return list(reader)
+
+
+def _init_worker(settings_module):
+    # Spawned (non-fork) workers start without Django configured
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    """make_password for many passwords, spread over ``workers`` processes (PROVISIONING_HASH_WORKERS).
+
+    Password hashing is deliberately slow and CPU-bound, so threads would
+    serialize on the GIL; small batches (and ``workers=1``) are hashed inline.
+    """
+    workers = workers or settings.PROVISIONING_HASH_WORKERS or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2 * workers:
+        return [make_password(password) for password in passwords]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'file_sharing_project.settings'),)
+    ) as pool:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def _validate(rows, default_user_type):
+    """Split rows into (valid, errors); valid rows are normalized dicts"""
+    valid, errors = [], []
+    seen_emails, seen_usernames = set(), set()
+    for line, row in enumerate(rows, start=1):
+        data = {field: row.get(field) for field in FIELDS if row.get(field) not in (None, '')}
+        data.setdefault('user_type', default_user_type)
+        serializer = ProvisionUserSerializer(data=data)
+        if not serializer.is_valid():
+            errors.append({'row': line, 'errors': serializer.errors})
+            continue
+
+        user = serializer.validated_data
+        user['email'] = User.objects.normalize_email(user['email'])
+        if user['email'].lower() in seen_emails or user['username'] in seen_usernames:
+            errors.append({'row': line, 'errors': {'non_field_errors': ['Duplicate user in this batch']}})
+            continue
+        seen_emails.add(user['email'].lower())
+        seen_usernames.add(user['username'])
+        user['row'] = line
+        valid.append(user)
+
+    # Two queries for the whole batch instead of two per row
+    emails = {email.lower() for email in User.objects.filter(
+        email__in=[user['email'] for user in valid]
+    ).values_list('email', flat=True)}
+    usernames = set(User.objects.filter(
+        username__in=[user['username'] for user in valid]
+    ).values_list('username', flat=True))
+
+    fresh = []
+    for user in valid:
+        if user['email'].lower() in emails or user['username'] in usernames:
+            errors.append({'row': user['row'], 'errors': {'non_field_errors': ['User already exists']}})
+        else:
+            fresh.append(user)
+    errors.sort(key=lambda error: error['row'])
+    return fresh, errors
+
+
+def validate_users(rows, default_user_type='client'):
+    """Row errors of a batch, and whether any row can be created"""
+    valid, errors = _validate(rows, default_user_type)
+    return bool(valid), errors
+
+
+def provision_users(rows, default_user_type='client', hash_workers=None):
+    """Create users in bulk; returns ``(created_users, errors)``.
+
+    Passwords are hashed in a pool of ``hash_workers`` processes, users and
+    their verification rows are written with bulk_create in one transaction,
+    and the verification emails are queued in the outbox in the same
+    transaction. Raises ProvisioningError when another request creates one
+    of the users meanwhile.
+    """
+    valid, errors = _validate(rows, default_user_type)
+    if not valid:
+        return [], errors
+
+    hashes = hash_passwords([user['password'] for user in valid], hash_workers)
+    users = [
+        User(
+            username=user['username'],
+            email=user['email'],
+            user_type=user['user_type'],
+            password=password_hash
+        )
+        for user, password_hash in zip(valid, hashes)
+    ]
+
+    batch_size = settings.PROVISIONING_BATCH_SIZE
+    expires_at = timezone.now() + timedelta(hours=24)
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=batch_size)
+
+            clients = [user for user in users if user.user_type == 'client']
+            for user in clients:
+                user.encrypted_signup_url = encrypt_url(f"signup_success_{user.id}")
+            User.objects.bulk_update(clients, ['encrypted_signup_url'], batch_size=batch_size)
+
+            verifications = EmailVerification.objects.bulk_create(
+                [EmailVerification(user=user, expires_at=expires_at) for user in users],
+                batch_size=batch_size
+            )
+            queue_emails([
+                verification_email(verification, user) for verification, user in zip(verifications, users)
+            ])
+    except IntegrityError:
+        # Another request created one of these users since _validate() checked
+        raise ProvisioningError('Some of these users were created meanwhile; submit the batch again')
+
+    return users, errors
+
+
+# ================================================================
+# Background Jobs (/api/users/bulk/)
+# ================================================================
+
+def queue_job(rows, requested_by_id):
+    """Store ``rows`` as a ProvisioningJob; the caller submits run_provisioning_job for it"""
+    return ProvisioningJob.objects.create(requested_by_id=requested_by_id, payload=encrypt_url(json.dumps(rows)))
+
+
+def run_job(job_id):
+    """Provision a queued job's users and record the outcome on the job.
+
+    Runs on a task worker (or a web process's task thread), so passwords are
+    hashed inline rather than in a process pool.
+    """
+    # Claimed with a conditional update: a redelivered task does not run it twice
+    if not ProvisioningJob.objects.filter(pk=job_id, status='queued').update(status='running'):
+        return
+    payload = decrypt_url(ProvisioningJob.objects.values_list('payload', flat=True).get(pk=job_id))
+
+    try:
+        if payload is None:
+            raise ProvisioningError('The job can no longer be read; submit the batch again')
+        users, errors = provision_users(json.loads(payload), hash_workers=1)
+    except ProvisioningError as e:
+        status, result = 'failed', {'error': str(e)}
+    except Exception:
+        logger.exception('Provisioning job %s failed', job_id)
+        status, result = 'failed', {'error': 'Provisioning failed'}
+    else:
+        status, result = 'done', {
+            'users': [{'user_id': user.id, 'email': user.email} for user in users],
+            'errors': errors,
+        }
+    ProvisioningJob.objects.filter(pk=job_id).update(
+        status=status, result=result, payload='', finished_at=timezone.now()
+    )
@@ -0,0 +1,176 @@
+from contextlib import ExitStack
+from django.db import connections
+from functools import partial
+from .models import EmailVerification, SecureDownloadURL, UploadedFile
+import re
+
+# Per-endpoint SQL budgets (see test_query_budget.py). QueryRecorder hooks
+# every connection with execute_wrapper() and, as each statement runs, notes
+# how many rows it returned or changed (not how many it read) and takes its
+# EXPLAIN QUERY PLAN, so later writes in the same request cannot change what
+# is reported.
+# Savepoints and other transaction control are not counted.
+
+# A bare "SCAN <table>" in a plan on one of these fails the budget
+WATCHED_TABLES = frozenset(model._meta.db_table for model in (UploadedFile, SecureDownloadURL, EmailVerification))
+
+_DATA_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+_WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# Django quotes table names and gives subquery tables short aliases (U0, T3)
+_TABLE_REF = re.compile(r'(?:FROM|JOIN|UPDATE|INTO)\s+"(\w+)"(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+# SQLite >= 3.36 prints "SCAN <name>", older versions "SCAN TABLE <table> [AS <alias>]";
+# a scan driven by an index says USING ... INDEX and is not a table scan
+_TABLE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+class Statement:
+    __slots__ = ('alias', 'sql', 'params', 'rows_returned', 'plan')
+
+    def __init__(self, alias, sql, params):
+        self.alias = alias
+        self.sql = sql
+        self.params = params
+        self.rows_returned = 0
+        self.plan = []
+
+    @property
+    def verb(self):
+        return self.sql.lstrip().split(None, 1)[0].upper()
+
+    @property
+    def is_write(self):
+        return self.verb in _WRITE_STATEMENTS
+
+    def table_scans(self):
+        """Tables this statement reads with a full scan, by real table name"""
+        aliases = {}
+        for table, alias in _TABLE_REF.findall(self.sql):
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+        scans = []
+        for line in self.plan:
+            match = _TABLE_SCAN.match(line)
+            if match:
+                scans.append(aliases.get(match.group(1), match.group(1)))
+        return scans
+
+    def __str__(self):
+        plan = ''.join(f'\n      {line}' for line in self.plan)
+        return f'[{self.alias}] ({self.rows_returned} rows returned) {self.sql}{plan}'
+
+
+class QueryRecorder:
+    """Context manager recording the statements run on all (or ``using``) connections"""
+
+    def __init__(self, using=None):
+        self.using = list(using or connections)
+        self.statements = []
+        self._inspecting = False
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in self.using:
+            self._stack.enter_context(connections[alias].execute_wrapper(partial(self._record, alias)))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+    @property
+    def queries(self):
+        return len(self.statements)
+
+    @property
+    def writes(self):
+        return sum(1 for statement in self.statements if statement.is_write)
+
+    @property
+    def rows_returned(self):
+        return sum(statement.rows_returned for statement in self.statements)
+
+    def _record(self, alias, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if self._inspecting or sql.lstrip().split(None, 1)[0].upper() not in _DATA_STATEMENTS:
+            return result
+
+        statement = Statement(alias, sql, list(params)[0] if many and params else params)
+        # The inspection queries below run through this wrapper too
+        self._inspecting = True
+        try:
+            statement.rows_returned = self._rows_returned(statement, context['cursor'], many)
+            statement.plan = self._plan(alias, statement)
+        finally:
+            self._inspecting = False
+        self.statements.append(statement)
+        return result
+
+    def _rows_returned(self, statement, cursor, many):
+        if statement.verb == 'INSERT' and not many and ' RETURNING ' in statement.sql:
+            # rowcount is 0 until RETURNING rows are fetched; count the VALUES tuples
+            return statement.sql.count('), (') + 1
+        if statement.is_write:
+            return max(cursor.rowcount, 0)
+        with connections[statement.alias].cursor() as count_cursor:
+            count_cursor.execute(f'SELECT COUNT(*) FROM ({statement.sql})', statement.params)
+            return count_cursor.fetchone()[0]
+
+    def _plan(self, alias, statement):
+        connection = connections[alias]
+        if connection.vendor != 'sqlite' or statement.verb == 'INSERT':
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {statement.sql}', statement.params)
+            return [row[3] for row in cursor.fetchall()]
+
+
+class Budget:
+    """What one request to an endpoint may cost"""
+
+    def __init__(self, queries, writes=0, rows_returned=None):
+        self.queries = queries
+        self.writes = writes
+        # Rows returned by reads plus rows changed by writes; None for no
+        # limit. Rows a statement reads but filters out are not counted
+        # (SQLite does not report them): full scans are caught by the plan.
+        self.rows_returned = rows_returned
+
+    def violations(self, recorder, watched_tables=WATCHED_TABLES):
+        """Human-readable reasons ``recorder`` exceeds this budget (empty if within it)"""
+        problems = []
+        if recorder.queries > self.queries:
+            problems.append(f'{recorder.queries} queries, budget {self.queries}')
+        if recorder.writes > self.writes:
+            problems.append(f'{recorder.writes} writes, budget {self.writes}')
+        if self.rows_returned is not None and recorder.rows_returned > self.rows_returned:
+            problems.append(f'{recorder.rows_returned} rows returned, budget {self.rows_returned}')
+        for statement in recorder.statements:
+            for table in statement.table_scans():
+                if table in watched_tables:
+                    problems.append(f'full scan of {table}: {statement.sql}')
+        return problems
+
+
+class QueryBudgetMixin:
+    """TestCase mixin: ``with self.assertQueryBudget(budget): <request>``"""
+
+    def assertQueryBudget(self, budget, using=None):
+        return _BudgetContext(self, budget, using)
+
+
+class _BudgetContext(QueryRecorder):
+    def __init__(self, test_case, budget, using):
+        super().__init__(using)
+        self.test_case = test_case
+        self.budget = budget
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        problems = self.budget.violations(self)
+        if problems:
+            statements = '\n'.join(f'  {statement}' for statement in self.statements)
+            self.test_case.fail('Query budget exceeded: ' + '; '.join(problems) + f'\nStatements:\n{statements}')
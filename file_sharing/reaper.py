@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from datetime import timedelta
+from .models import EmailVerification, OutboundEmail, ProvisioningJob, SecureDownloadURL, UploadChunk, UploadSession
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cache keys for the reaper metrics: the last run's counts, and running
+# totals per table
+LAST_RUN_KEY = 'reaper:last-run'
+TOTAL_KEY = 'reaper:purged:{}'
+
+
+def purge_in_batches(queryset, batch_size=None, delete=None):
+    """Delete the rows of ``queryset`` REAPER_BATCH_SIZE at a time; returns the count.
+
+    Each batch is a short SELECT of primary keys (on an index, for the
+    querysets below) and a DELETE by primary key in its own transaction, so
+    no lock is held for long and other writers get in between batches.
+    ``delete`` replaces the plain DELETE, for rows that own more than that.
+    """
+    batch_size = batch_size or settings.REAPER_BATCH_SIZE
+    model = queryset.model
+    total = 0
+    for _ in range(settings.REAPER_MAX_BATCHES):
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        if delete is not None:
+            delete(ids)
+        else:
+            model.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+        time.sleep(settings.REAPER_BATCH_PAUSE)
+    return total
+
+
+def _delete_upload_sessions(ids):
+    for staging_name in UploadSession.objects.filter(pk__in=ids).values_list('staging_name', flat=True):
+        # Complete sessions' staging files became blobs; the rest are partial uploads
+        if default_storage.exists(staging_name):
+            default_storage.delete(staging_name)
+    UploadChunk.objects.filter(session_id__in=ids).delete()
+    UploadSession.objects.filter(pk__in=ids).delete()
+
+
+def _record(counts, duration):
+    cache = caches[settings.REAPER_METRICS_CACHE]
+    for table, count in counts.items():
+        key = TOTAL_KEY.format(table)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, count)
+    cache.set(LAST_RUN_KEY, {
+        'finished_at': timezone.now().isoformat(),
+        'duration': round(duration, 3),
+        'purged': counts,
+    }, timeout=None)
+
+
+def reap_expired_rows():
+    """Delete rows that can no longer be used; returns ``{table: rows deleted}``.
+
+    Download URLs and email verifications are dead once expired (used ones
+    expire too, and are kept until then for auditing); they go
+    REAPER_RETENTION seconds after expiry. Also removes expired upload
+    sessions with their staging files, delivered outbox mail and expired
+    provisioning jobs.
+    """
+    started = time.monotonic()
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.REAPER_RETENTION)
+
+    counts = {
+        'secure_download_urls': purge_in_batches(
+            SecureDownloadURL.objects.filter(expires_at__lt=cutoff).order_by('expires_at')
+        ),
+        'email_verifications': purge_in_batches(
+            EmailVerification.objects.filter(expires_at__lt=cutoff).order_by('expires_at')
+        ),
+        'upload_sessions': purge_in_batches(
+            UploadSession.objects.filter(expires_at__lt=now).order_by('expires_at'),
+            delete=_delete_upload_sessions
+        ),
+        # A sent message's next_attempt_at is its claim's expiry, minutes
+        # after it went out; ranging over it uses the outbox's due index
+        'outbound_emails': purge_in_batches(
+            OutboundEmail.objects.filter(status='sent', next_attempt_at__lt=cutoff).order_by('next_attempt_at')
+        ),
+        'provisioning_jobs': purge_in_batches(
+            ProvisioningJob.objects.filter(expires_at__lt=now).order_by('expires_at')
+        ),
+    }
+
+    duration = time.monotonic() - started
+    _record(counts, duration)
+    logger.info('Reaped expired rows in %.2fs: %s', duration, counts)
+    return counts
+
+
+def reaper_metrics():
+    """The last run's counts and the running totals, as recorded in the cache"""
+    cache = caches[settings.REAPER_METRICS_CACHE]
+    tables = ('secure_download_urls', 'email_verifications', 'upload_sessions', 'outbound_emails', 'provisioning_jobs')
+    totals = cache.get_many([TOTAL_KEY.format(table) for table in tables])
+    return {
+        'last_run': cache.get(LAST_RUN_KEY),
+        'totals': {table: totals.get(TOTAL_KEY.format(table), 0) for table in tables},
+    }
@@ -0,0 +1,48 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional; without it the stock encoder is used
+    orjson = None
+
+# DRF escapes these so its JSON is also valid JavaScript; so must we
+_LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def _escape_line_separators(data):
+    if b'\xe2\x80' in data:
+        for raw, escaped in _LINE_SEPARATORS:
+            data = data.replace(raw, escaped)
+    return data
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson, producing the same bytes.
+
+    orjson's output matches DRF's compact, non-ASCII-escaping default byte
+    for byte for plain dicts, lists, strings, numbers, bools and None.
+    Anything where the two could differ goes through the stock renderer:
+    indented output, non-default JSON settings, datetimes (DRF writes UTC as
+    'Z') and types orjson refuses (Decimals, lazy strings, lone surrogates).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or not (self.compact and self.strict and not self.ensure_ascii)
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return _escape_line_separators(orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME))
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+_renderer = FastJSONRenderer()
+
+
+def render_json(data):
+    """Render ``data`` as the API's JSON response body"""
+    return _renderer.render(data)
@@ -0,0 +1,72 @@
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = 'replica'
+# Set on a client that just wrote, so its next requests read from the primary
+PIN_COOKIE = 'db-pin'
+
+
+def is_read_only(connection):
+    """True for the replica connection (opened with mode=ro: no writes, no write lock)"""
+    return connection.alias == REPLICA_DB_ALIAS or 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+class _RequestRouting:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+# Routing state of the current request; None outside requests (tasks,
+# commands), which always use the primary. A mutable holder, so a write in
+# a sync_to_async thread is seen by the request that started it.
+_routing = ContextVar('file_sharing_db_routing', default=None)
+
+
+def start_request(pinned):
+    """Begin routing for a request; returns the token for end_request()"""
+    use_replica = not pinned and REPLICA_DB_ALIAS in settings.DATABASES
+    return _routing.set(_RequestRouting(use_replica))
+
+
+def end_request(token):
+    """Finish routing for a request; True if it wrote to the primary"""
+    state = _routing.get()
+    _routing.reset(token)
+    return state is not None and state.wrote
+
+
+class PrimaryReplicaRouter:
+    """Send catalog reads made during a request to the replica, everything else to the primary.
+
+    Only models listed in DATABASE_REPLICA_MODELS are read from the replica;
+    reads that guard a write (download tokens, verifications, users) stay
+    on the primary. Once a request writes, the rest of it reads from the
+    primary too, and the DatabasePinMiddleware keeps that client on the
+    primary for DATABASE_REPLICA_PIN_SECONDS so it sees its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is not None and state.use_replica and model._meta.label_lower in settings.DATABASE_REPLICA_MODELS:
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.use_replica = False
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+import re
+
+# Full-text index over file names and extracted document text, one row per
+# UploadedFile keyed by its id. SQLite uses an FTS5 table, PostgreSQL a
+# tsvector column with a GIN index; other backends fall back to a filename
+# substring match. Rows are written and removed one file at a time (see
+# signals.py and tasks.py), never rebuilt wholesale. The table is created
+# by migration 0006.
+SEARCH_TABLE = 'file_sharing_search'
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def _vendor():
+    return connection.vendor
+
+
+def index_file(file_id, filename, content=None):
+    """Add or replace the index row of one file.
+
+    ``content`` is the text extracted from the document; None keeps the
+    text already indexed (e.g. when only the name is known at upload time).
+    Returns whether there is a full-text index (False on other backends).
+    """
+    vendor = _vendor()
+    if vendor not in ('sqlite', 'postgresql'):
+        return False
+    if content is not None:
+        content = content[:settings.SEARCH_MAX_TEXT_LENGTH]
+
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            if content is None:
+                cursor.execute(f"SELECT content FROM {SEARCH_TABLE} WHERE rowid = %s", [file_id])
+                row = cursor.fetchone()
+                content = row[0] if row else ''
+            # FTS5 has no upsert; delete + insert of a single rowid
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [file_id])
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, filename, content) VALUES (%s, %s, %s)",
+                [file_id, filename, content]
+            )
+        elif content is None:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (file_id, document) "
+                f"VALUES (%s, setweight(to_tsvector('simple', %s), 'A')) "
+                f"ON CONFLICT (file_id) DO NOTHING",
+                [file_id, filename]
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (file_id, document) "
+                f"VALUES (%s, setweight(to_tsvector('simple', %s), 'A') || to_tsvector('simple', %s)) "
+                f"ON CONFLICT (file_id) DO UPDATE SET document = EXCLUDED.document",
+                [file_id, filename, content]
+            )
+    return True
+
+
+def unindex_file(file_id):
+    vendor = _vendor()
+    if vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [file_id])
+        else:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE file_id = %s", [file_id])
+
+
+def _fts5_query(text):
+    """User input as an FTS5 query: every word must match, as a prefix.
+
+    Only word characters survive and each word is quoted, so FTS5 operators
+    and syntax in the input are inert.
+    """
+    words = _WORD.findall(text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_files(queryset, text):
+    """Restrict an UploadedFile queryset to files matching ``text``"""
+    vendor = _vendor()
+
+    if vendor == 'sqlite':
+        match = _fts5_query(text)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match]
+        ))
+
+    if vendor == 'postgresql':
+        words = _WORD.findall(text)
+        if not words:
+            return queryset.none()
+        # Same semantics as FTS5 above: all words, each as a prefix
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT file_id FROM {SEARCH_TABLE} "
+            f"WHERE document @@ to_tsquery('simple', %s)", [' & '.join(f'{word}:*' for word in words)]
+        ))
+
+    return queryset.filter(original_filename__icontains=text)
@@ -1,7 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from .models import User, UploadedFile, EmailVerification
-import magic
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.conf import settings
+from django.utils import timezone
+from .models import User, UploadedFile, UploadSession
+from .search import search_files
+from .storage import store_blob, staging_name_for, create_staging_file
+import uuid
 
 # from file_sharing.utils import encrypt_url
 try:
@@ -10,7 +16,6 @@ except ImportError:
     # Fallback: define a dummy encrypt_url or import from the correct location
     def encrypt_url(value):
         return value  # TODO: Replace with actual implementation or correct import path
-import magic
 
 class UserSignUpSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
@@ -27,24 +32,35 @@ class UserSignUpSerializer(serializers.ModelSerializer):
         if data['user_type'] not in ['ops', 'client']:
             raise serializers.ValidationError("Invalid user type")
         
+        # Hashed here, before the caller's transaction: the write lock it
+        # takes is not held for the (slow, by design) password hash
+        data['password'] = make_password(data['password'])
+        
         return data
     
     def create(self, validated_data):
         validated_data.pop('password_confirm')
         password = validated_data.pop('password')
         
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
+        # One INSERT (the password was hashed in validate); the caller provides the transaction
+        user = User(**validated_data, password=password)
+        user.email = User.objects.normalize_email(user.email)
+        user.save(force_insert=True)
         
-        # Generate encrypted signup URL for client users
+        # Generate encrypted signup URL for client users (it needs the new id)
         if user.user_type == 'client':
-            encrypted_url = encrypt_url(f"signup_success_{user.id}")
-            user.encrypted_signup_url = encrypted_url
-            user.save()
+            user.encrypted_signup_url = encrypt_url(f"signup_success_{user.id}")
+            User.objects.filter(pk=user.pk).update(encrypted_signup_url=user.encrypted_signup_url)
         
         return user
 
+class ProvisionUserSerializer(serializers.Serializer):
+    """One row of a bulk provisioning file (uniqueness is checked per batch)"""
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField()
+    password = serializers.CharField(min_length=8, write_only=True)
+    user_type = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES)
+
 class UserLoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField()
@@ -85,18 +101,24 @@ class FileUploadSerializer(serializers.ModelSerializer):
                 f"Only {', '.join(allowed_extensions)} files are allowed"
             )
         
-        # Check file size (max 10MB)
-        if value.size > 10 * 1024 * 1024:
-            raise serializers.ValidationError("File size cannot exceed 10MB")
+        # Check file size (FILE_UPLOAD_MAX_SIZE, 10MB by default)
+        if value.size > settings.FILE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"File size cannot exceed {settings.FILE_UPLOAD_MAX_SIZE // (1024 * 1024)}MB"
+            )
         
         return value
     
     def create(self, validated_data):
         file = validated_data['file']
         
+        # Identical content is stored once; sha256 comes from the upload handler
+        blob = store_blob(file, getattr(file, 'sha256', None))
+        
         uploaded_file = UploadedFile.objects.create(
-            uploaded_by=self.context['request'].user,
-            file=file,
+            uploaded_by_id=self.context['request'].user.id,
+            file=blob.file.name,
+            blob=blob,
             original_filename=file.name,
             file_size=file.size,
             file_type=file.name.split('.')[-1].lower()
@@ -104,9 +126,157 @@ class FileUploadSerializer(serializers.ModelSerializer):
         
         return uploaded_file
 
+class UploadSessionSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    
+    def validate_filename(self, value):
+        # Stored as original_filename and used for ZIP entry names and
+        # Content-Disposition: only a bare file name, never a path
+        if any(char in value for char in ('/', '\\', '\x00')):
+            raise serializers.ValidationError("File name must not contain '/', '\\' or NUL characters")
+        value = value.strip()
+        if value in ('', '.', '..'):
+            raise serializers.ValidationError("Invalid file name")
+        
+        allowed_extensions = [ext for ext, _ in UploadedFile.ALLOWED_EXTENSIONS]
+        file_extension = value.split('.')[-1].lower()
+        
+        if file_extension not in allowed_extensions:
+            raise serializers.ValidationError(
+                f"Only {', '.join(allowed_extensions)} files are allowed"
+            )
+        
+        return value
+    
+    def validate_size(self, value):
+        if value > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"File size cannot exceed {settings.CHUNKED_UPLOAD_MAX_SIZE // (1024 * 1024)}MB"
+            )
+        
+        return value
+    
+    def create(self, validated_data):
+        session_id = uuid.uuid4()
+        session = UploadSession(
+            id=session_id,
+            user_id=self.context['request'].user.id,
+            filename=validated_data['filename'],
+            file_type=validated_data['filename'].split('.')[-1].lower(),
+            total_size=validated_data['size'],
+            chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+            staging_name=staging_name_for(session_id)
+        )
+        create_staging_file(session.staging_name, session.total_size)
+        session.save(force_insert=True)
+        
+        return session
+
+class UploadSessionStatusSerializer(serializers.ModelSerializer):
+    upload_id = serializers.UUIDField(source='id', read_only=True)
+    size = serializers.IntegerField(source='total_size', read_only=True)
+    total_chunks = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    received_bytes = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = ['upload_id', 'filename', 'size', 'chunk_size', 'total_chunks',
+                  'received_chunks', 'received_bytes', 'is_complete', 'expires_at']
+    
+    def _received(self, obj):
+        if not hasattr(obj, '_received_chunks'):
+            obj._received_chunks = list(obj.chunks.order_by('index').values_list('index', 'size'))
+        return obj._received_chunks
+    
+    def get_received_chunks(self, obj):
+        return [index for index, _ in self._received(obj)]
+    
+    def get_received_bytes(self, obj):
+        return sum(size for _, size in self._received(obj))
+
 class UploadedFileSerializer(serializers.ModelSerializer):
     uploaded_by = serializers.CharField(source='uploaded_by.username', read_only=True)
     
     class Meta:
         model = UploadedFile
         fields = ['id', 'original_filename', 'file_size', 'file_type', 'uploaded_at', 'uploaded_by']
+
+def format_datetime(value):
+    """A datetime as DRF's DateTimeField renders it (current timezone, UTC as 'Z')"""
+    if value is None:
+        return None
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+# Read-only fast path for UploadedFileSerializer: the same fields, projected
+# with values_list() instead of instantiating models and running DRF fields
+# per row. Keep the two in step; the output must stay identical.
+UPLOADED_FILE_COLUMNS = ('id', 'original_filename', 'file_size', 'file_type', 'uploaded_at', 'uploaded_by__username')
+
+def project_uploaded_files(rows):
+    """UploadedFileSerializer output for ``values_list(*UPLOADED_FILE_COLUMNS)`` rows"""
+    return [
+        {
+            'id': file_id,
+            'original_filename': original_filename,
+            'file_size': file_size,
+            'file_type': file_type,
+            'uploaded_at': format_datetime(uploaded_at),
+            'uploaded_by': uploaded_by,
+        }
+        for file_id, original_filename, file_size, file_type, uploaded_at, uploaded_by in rows
+    ]
+
+class UploadedFileDetailSerializer(UploadedFileSerializer):
+    class Meta(UploadedFileSerializer.Meta):
+        fields = UploadedFileSerializer.Meta.fields + [
+            'processing_status', 'processing_error', 'metadata', 'preview', 'processed_at'
+        ]
+
+
+class FileFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the file list"""
+    file_type = serializers.ChoiceField(choices=UploadedFile.ALLOWED_EXTENSIONS, required=False)
+    uploaded_by = serializers.IntegerField(min_value=1, required=False)
+    min_size = serializers.IntegerField(min_value=0, required=False)
+    max_size = serializers.IntegerField(min_value=0, required=False)
+    uploaded_after = serializers.DateTimeField(required=False)
+    uploaded_before = serializers.DateTimeField(required=False)
+    q = serializers.CharField(max_length=200, required=False)
+    
+    def filter_queryset(self, queryset):
+        filters = self.validated_data
+        
+        if 'file_type' in filters:
+            queryset = queryset.filter(file_type=filters['file_type'])
+        if 'uploaded_by' in filters:
+            queryset = queryset.filter(uploaded_by_id=filters['uploaded_by'])
+        if 'min_size' in filters:
+            queryset = queryset.filter(file_size__gte=filters['min_size'])
+        if 'max_size' in filters:
+            queryset = queryset.filter(file_size__lte=filters['max_size'])
+        if 'uploaded_after' in filters:
+            queryset = queryset.filter(uploaded_at__gte=filters['uploaded_after'])
+        if 'uploaded_before' in filters:
+            queryset = queryset.filter(uploaded_at__lt=filters['uploaded_before'])
+        if filters.get('q'):
+            queryset = search_files(queryset, filters['q'])
+        
+        return queryset
+
+class FileBatchSerializer(serializers.Serializer):
+    file_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False
+    )
+    
+    def validate_file_ids(self, value):
+        # Read per request (not at import) so the setting can change at runtime
+        limit = settings.DOWNLOAD_URL_BATCH_LIMIT
+        if len(value) > limit:
+            raise serializers.ValidationError(f'Ensure this field has no more than {limit} elements.')
+        return value
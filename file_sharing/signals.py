@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import user_status_cache
+from .catalog import bump_catalog_version, touches_catalog
+from .executor import submit
+from .metrics import database_timer
+from .models import User, UploadedFile
+from .routers import is_read_only
+from .search import index_file, unindex_file
+from .storage import release_blob
+from .tasks import process_uploaded_file
+
+
+@receiver(post_save, sender=UploadedFile)
+def queue_uploaded_file_processing(sender, instance, created, **kwargs):
+    if created:
+        # The name is searchable right away; the text follows from the pipeline
+        index_file(instance.pk, instance.original_filename)
+        # After commit: the worker must be able to see the row
+        transaction.on_commit(lambda: submit(process_uploaded_file, instance.pk))
+
+
+@receiver(post_delete, sender=UploadedFile)
+def release_uploaded_file_blob(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def delete_uploaded_file_preview(sender, instance, **kwargs):
+    if instance.preview:
+        instance.preview.delete(save=False)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def remove_uploaded_file_from_search(sender, instance, **kwargs):
+    unindex_file(instance.pk)
+
+
+@receiver(post_save, sender=UploadedFile)
+@receiver(post_delete, sender=UploadedFile)
+def invalidate_catalog(sender, instance, update_fields=None, **kwargs):
+    if touches_catalog(update_fields):
+        # After commit, so a page rebuilt for the new version sees the change
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=User)
+def invalidate_catalog_on_rename(sender, instance, created, update_fields=None, **kwargs):
+    # The list shows uploader usernames; logins (last_login only) don't matter
+    if not created and (update_fields is None or 'username' in update_fields):
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_status(sender, instance, **kwargs):
+    user_status_cache.invalidate(instance.pk)
+
+
+# Only matter to a connection that writes. journal_mode = WAL also rewrites
+# the file header, which a read-only connection cannot do ("attempt to write
+# a readonly database" until the primary has switched the file to WAL)
+_FILE_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    read_only = is_read_only(connection)
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            if read_only and pragma in _FILE_PRAGMAS:
+                continue
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() blocks already entered on this
+    # connection (e.g. a test's query recorder) pop theirs from the end
+    if database_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, database_timer)
@@ -0,0 +1,152 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from .metrics import timed, timing
+from .models import FileBlob, blob_upload_to
+import hashlib
+import os
+
+
+@timed('storage')
+def hash_file(content, chunk_size=64 * 1024):
+    """SHA-256 hex digest of a Django File, read in chunks"""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(chunk_size):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def store_blob(content, sha256=None):
+    """Store ``content`` once per unique SHA-256 and take a reference to it.
+
+    ``sha256`` is normally the digest computed by the hashing upload
+    handlers; it is computed here when missing. Returns the FileBlob, whose
+    ``file.name`` is what UploadedFile.file should point at.
+    """
+    if sha256 is None:
+        sha256 = hash_file(content)
+
+    with transaction.atomic():
+        blob, created = FileBlob.objects.get_or_create(sha256=sha256, defaults={'size': content.size})
+
+        if created:
+            with timing('storage'):
+                blob.file.save(sha256, content, save=False)
+            blob.ref_count = 1
+            blob.save(update_fields=['file', 'ref_count'])
+        else:
+            FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+    return blob
+
+
+def store_staged_blob(staging_name, sha256):
+    """store_blob for content already written to storage (e.g. a chunked upload).
+
+    A new blob is created by renaming the staging file into place, so the
+    content is never copied; if the content already exists the staging file
+    is simply dropped.
+    """
+    size = default_storage.size(staging_name)
+
+    with transaction.atomic():
+        blob, created = FileBlob.objects.get_or_create(sha256=sha256, defaults={'size': size})
+
+        if created:
+            name = default_storage.get_available_name(blob_upload_to(blob, staging_name))
+            target = default_storage.path(name)
+            with timing('storage'):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(default_storage.path(staging_name), target)
+            blob.file.name = name
+            blob.ref_count = 1
+            blob.save(update_fields=['file', 'ref_count'])
+        else:
+            FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+    if not created:
+        default_storage.delete(staging_name)
+    return blob
+
+
+def release_blob(blob_id):
+    """Drop one reference; the blob and its file go away with the last one"""
+    with transaction.atomic():
+        FileBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+
+        name = FileBlob.objects.filter(pk=blob_id, ref_count=0).values_list('file', flat=True).first()
+        if name is None:
+            return
+
+        # Conditional delete: a concurrent upload may have taken a new reference
+        deleted, _ = FileBlob.objects.filter(pk=blob_id, ref_count=0).delete()
+
+    if deleted:
+        # A new blob for the same content saved meanwhile gets an alternative
+        # storage name, so removing this one cannot clobber it
+        transaction.on_commit(lambda: default_storage.delete(name))
+
+
+def adopt_legacy_file(uploaded_file):
+    """Move a pre-deduplication UploadedFile onto a shared blob.
+
+    Returns True if the row was linked to a blob. The row's old file is
+    removed once no other row points at it.
+    """
+    if uploaded_file.blob_id is not None:
+        return False
+
+    old_name = uploaded_file.file.name
+    with uploaded_file.file.open('rb') as content:
+        blob = store_blob(content)
+
+    uploaded_file.blob = blob
+    uploaded_file.file.name = blob.file.name
+    uploaded_file.save(update_fields=['blob', 'file'])
+
+    if old_name != blob.file.name and not type(uploaded_file).objects.filter(file=old_name).exists():
+        default_storage.delete(old_name)
+    return True
+
+
+# ================================================================
+# Chunked upload staging
+# ================================================================
+
+def staging_name_for(session_id):
+    return f"uploads/partial/{session_id}.part"
+
+
+def create_staging_file(staging_name, size):
+    """Create the (sparse) file that chunks are written into at their offsets"""
+    path = default_storage.path(staging_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.truncate(size)
+
+
+@timed('storage')
+def write_chunk(staging_name, offset, stream, length, read_size=64 * 1024):
+    """Copy exactly ``length`` bytes from ``stream`` to ``offset`` of the staging file.
+
+    Returns the SHA-256 hex digest of the bytes written. Raises ValueError if
+    the stream does not carry exactly ``length`` bytes.
+    """
+    digest = hashlib.sha256()
+    fd = os.open(default_storage.path(staging_name), os.O_WRONLY)
+    try:
+        written = 0
+        while written < length:
+            data = stream.read(min(read_size, length - written))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + written)
+            digest.update(data)
+            written += len(data)
+        if written != length or stream.read(1):
+            raise ValueError(f"Chunk must be exactly {length} bytes")
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
@@ -0,0 +1,173 @@
+from celery import chain, shared_task
+from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from . import reaper
+from .catalog import bump_search_version
+from .executor import submit, submit_later
+from .models import UploadedFile
+from .outbox import claim_batch, deliver_batch, next_due_in, queue_depth
+from .processing import validate_ooxml, extract_metadata, extract_text, extract_preview
+from .search import index_file
+from .storage import adopt_legacy_file
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _update(file_id, **fields):
+    # update() rather than save(): no model signals, no lost concurrent writes
+    UploadedFile.objects.filter(pk=file_id).update(**fields)
+
+
+@shared_task
+def compute_checksum(file_id):
+    """Make sure the content hash is known (legacy rows are moved onto a blob)"""
+    uploaded_file = UploadedFile.objects.select_related('blob').get(pk=file_id)
+    if uploaded_file.blob_id is None:
+        adopt_legacy_file(uploaded_file)
+    return uploaded_file.blob.sha256
+
+
+@shared_task
+def validate_document(file_id):
+    """Deep OOXML structure validation; raises ValueError on a broken package"""
+    uploaded_file = UploadedFile.objects.get(pk=file_id)
+    validate_ooxml(uploaded_file.file.path, uploaded_file.file_type)
+
+
+@shared_task
+def extract_document_metadata(file_id):
+    uploaded_file = UploadedFile.objects.get(pk=file_id)
+    metadata = extract_metadata(uploaded_file.file.path, uploaded_file.file_type)
+    _update(file_id, metadata=metadata)
+    return metadata
+
+
+@shared_task
+def index_document_text(file_id):
+    """Add the document's text to the full-text search index"""
+    uploaded_file = UploadedFile.objects.get(pk=file_id)
+    text = extract_text(uploaded_file.file.path, uploaded_file.file_type, settings.SEARCH_MAX_TEXT_LENGTH)
+    # Only ?q= results can show the text, and only once there is some
+    if index_file(file_id, uploaded_file.original_filename, text) and text:
+        bump_search_version()
+
+
+@shared_task
+def generate_preview(file_id):
+    uploaded_file = UploadedFile.objects.get(pk=file_id)
+    preview = extract_preview(uploaded_file.file.path)
+    if preview is None:
+        return None
+
+    if uploaded_file.preview:
+        # Reprocessing: replace rather than pile up previews/<id>_<random>.png
+        uploaded_file.preview.delete(save=False)
+    name = default_storage.save(f"previews/{file_id}.png", ContentFile(preview))
+    _update(file_id, preview=name)
+    return name
+
+
+PIPELINE = (compute_checksum, validate_document, extract_document_metadata, index_document_text, generate_preview)
+
+
+@shared_task
+def start_processing(file_id):
+    _update(file_id, processing_status='processing', processing_error='')
+
+
+@shared_task
+def finish_processing(file_id):
+    _update(file_id, processing_status='ready', processed_at=timezone.now())
+
+
+def _record_failure(file_id, exc):
+    if isinstance(exc, UploadedFile.DoesNotExist):
+        # Deleted while it was being processed
+        return
+    logger.warning('Processing file %s failed: %s', file_id, exc)
+    _update(file_id, processing_status='failed', processing_error=str(exc), processed_at=timezone.now())
+
+
+@shared_task
+def processing_failed(request, exc, traceback, file_id):
+    """Error callback of the pipeline chain: Celery calls it with the failed stage's request"""
+    _record_failure(file_id, exc)
+
+
+def processing_chain(file_id):
+    """The pipeline as a Celery chain, one task per stage.
+
+    The chain stops at the first stage that raises, whose error is recorded
+    by processing_failed. A worker lost mid-pipeline only redoes the stage it
+    was running, and slow stages can be routed to queues of their own.
+    """
+    return chain(
+        start_processing.si(file_id),
+        *(stage.si(file_id) for stage in PIPELINE),
+        finish_processing.si(file_id)
+    ).on_error(processing_failed.s(file_id))
+
+
+@shared_task
+def process_uploaded_file(file_id):
+    """Run the post-upload pipeline and record its outcome on the UploadedFile.
+
+    On the 'celery' TASK_BACKEND this starts processing_chain(); the 'thread'
+    and 'eager' backends have no broker to pass stages through and run them
+    in turn here.
+    """
+    if settings.TASK_BACKEND == 'celery':
+        processing_chain(file_id).apply_async()
+        return
+
+    start_processing(file_id)
+    try:
+        for stage in PIPELINE:
+            stage(file_id)
+    except Exception as e:
+        _record_failure(file_id, e)
+        return
+    finish_processing(file_id)
+
+
+@shared_task
+def drain_outbox():
+    """Deliver due outbox emails in batches of OUTBOX_BATCH_SIZE, one SMTP connection each"""
+    sent = failed = 0
+    for _ in range(settings.OUTBOX_MAX_BATCHES):
+        emails = claim_batch(settings.OUTBOX_BATCH_SIZE)
+        if not emails:
+            break
+        batch_sent, batch_failed = deliver_batch(emails)
+        sent += batch_sent
+        failed += batch_failed
+    else:
+        # Still more due: carry on in a fresh task rather than hog this worker
+        submit(drain_outbox)
+
+    if failed:
+        # Come back when the earliest retry is due
+        delay = next_due_in()
+        if delay is not None:
+            submit_later(delay, drain_outbox)
+
+    depth = queue_depth()
+    logger.info('Outbox drained: %s sent, %s failed; queue depth %s', sent, failed, depth)
+    return {'sent': sent, 'failed': failed, 'depth': depth}
+
+
+@shared_task
+def reap_expired_rows():
+    """Periodic cleanup of expired tokens, sessions and sent mail (see reaper.py)"""
+    return reaper.reap_expired_rows()
+
+
+@shared_task
+def run_provisioning_job(job_id):
+    """Create the users of a bulk provisioning request (see provisioning.run_job)"""
+    # provisioning queues emails, and emails imports this module
+    from .provisioning import run_job
+    run_job(job_id)
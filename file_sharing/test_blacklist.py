@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from .authentication import ClaimsRefreshToken
+from .benchdb import seed_users
+from .blacklist import BloomFilter, TokenBlacklist
+import time
+
+# Refresh-token revocation (file_sharing.blacklist): the shared revoked set in
+# the cache and each process's Bloom filter in front of it.
+# Run with: python manage.py test file_sharing.test_blacklist
+
+
+def _exp(seconds=3600):
+    return time.time() + seconds
+
+
+class BloomFilterTests(SimpleTestCase):
+
+    def test_added_values_are_found(self):
+        bloom = BloomFilter(1000, 0.01)
+        values = [f'jti-{i}' for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        self.assertEqual(bloom.count, 1000)
+
+    def test_false_positive_rate_is_near_target(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        hits = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(hits, 300)
+
+
+class TokenBlacklistTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = caches[settings.JWT_BLACKLIST_CACHE]
+        self.cache.clear()
+
+    def test_revoked_token_is_rejected(self):
+        blacklist = TokenBlacklist()
+        self.assertFalse(blacklist.is_revoked('a'))
+        self.assertTrue(blacklist.revoke('a', _exp()))
+        self.assertTrue(blacklist.is_revoked('a'))
+        # Revoking is a one-time claim
+        self.assertFalse(blacklist.revoke('a', _exp()))
+
+    @override_settings(JWT_BLACKLIST_BLOOM_CAPACITY=4, JWT_BLACKLIST_BLOOM_ERROR_RATE=0.3)
+    def test_false_positive_is_confirmed_in_the_cache(self):
+        blacklist = TokenBlacklist()
+        blacklist.revoke('revoked-1', _exp())
+        blacklist.revoke('revoked-2', _exp())
+        # A JTI the (deliberately tiny) filter claims to have seen
+        jti = next(
+            jti for jti in (f'live-{i}' for i in range(1000))
+            if any(jti in bloom for bloom in blacklist._filters)
+        )
+        self.assertFalse(blacklist.saturated)
+
+        reads = []
+        get = self.cache.get
+        self.cache.get = lambda key, *args, **kwargs: reads.append(key) or get(key, *args, **kwargs)
+        try:
+            self.assertFalse(blacklist.is_revoked(jti))
+        finally:
+            del self.cache.get
+        self.assertIn(f'jwt-revoked:{jti}', reads)
+
+    @override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0)
+    def test_other_process_picks_up_revocations_from_the_log(self):
+        first, second = TokenBlacklist(), TokenBlacklist()
+        self.assertFalse(second.is_revoked('a'))
+
+        first.revoke('a', _exp())
+        first.revoke('b', _exp())
+        self.assertTrue(second.is_revoked('a'))
+        # Replayed into the second process's filter, not only read through
+        self.assertIn('b', second._filters[0])
+        self.assertEqual(second._seq, 2)
+
+    @override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0)
+    def test_new_process_replays_earlier_revocations(self):
+        TokenBlacklist().revoke('a', _exp())
+        late = TokenBlacklist()
+        self.assertTrue(late.is_revoked('a'))
+        self.assertIn('a', late._filters[0])
+
+    @override_settings(JWT_BLACKLIST_SYNC_INTERVAL=60)
+    def test_sync_waits_for_the_interval(self):
+        first, second = TokenBlacklist(), TokenBlacklist()
+        second.is_revoked('a')
+        first.revoke('a', _exp())
+        # Unnoticed until the interval has passed
+        self.assertFalse(second.is_revoked('a'))
+        second._synced_at -= 60
+        self.assertTrue(second.is_revoked('a'))
+
+
+class RefreshTokenRotationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_users(1, user_type='client')[0]
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_rotated_refresh_token_is_rejected(self):
+        refresh = str(ClaimsRefreshToken.for_user(self.user))
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        rotated = response.data['refresh_token']
+
+        response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/token/refresh/', {'refresh': rotated})
+        self.assertEqual(response.status_code, 200)
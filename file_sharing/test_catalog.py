@@ -0,0 +1,97 @@
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from .authentication import ClaimsRefreshToken
+from .benchdb import make_document, seed_files, seed_users
+from .catalog import bump_search_version
+from .models import UploadedFile
+import random
+import shutil
+import tempfile
+
+# The versioned file list cache and its ETags (file_sharing.catalog).
+# Run with: python manage.py test file_sharing.test_catalog
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='file-sharing-test-')
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DATABASE_REPLICA_MODELS=[],
+    TASK_BACKEND='eager',
+    TRANSFER_CONCURRENCY={}
+)
+class CatalogCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = seed_users(1, user_type='ops')[0]
+        cls.client_user = seed_users(1, user_type='client')[0]
+        seed_files(5, cls.ops)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def _auth(self, user):
+        return {'Authorization': f'Bearer {ClaimsRefreshToken.for_user(user).access_token}'}
+
+    def _list(self, etag=None, query=''):
+        headers = self._auth(self.client_user)
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        return self.client.get(f'/api/files/{query}', headers=headers)
+
+    def _ids(self, response):
+        return [row['id'] for row in response.json()['results']]
+
+    def test_unchanged_list_is_not_modified(self):
+        first = self._list()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self._list(first['ETag']).status_code, 304)
+        # Served from the cache: no queries
+        with self.assertNumQueries(0):
+            self.assertEqual(self._ids(self._list()), self._ids(first))
+
+    def test_upload_changes_list_and_etag(self):
+        before = self._list()
+        document = make_document('docx', 4096, random.Random(0))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/upload/', {'file': SimpleUploadedFile('new.docx', document)},
+                                        headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 201)
+
+        after = self._list(before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(self._ids(after), [response.json()['file_id']] + self._ids(before))
+
+    def test_delete_changes_list_and_etag(self):
+        before = self._list()
+        deleted = self._ids(before)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadedFile.objects.get(id=deleted).delete()
+
+        after = self._list(before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(self._ids(after), self._ids(before)[1:])
+
+    def test_unlisted_change_keeps_etag(self):
+        before = self._list()
+        file_obj = UploadedFile.objects.get(id=self._ids(before)[0])
+        file_obj.processing_status = 'failed'
+        with self.captureOnCommitCallbacks(execute=True):
+            file_obj.save(update_fields=['processing_status'])
+        self.assertEqual(self._list(before['ETag']).status_code, 304)
+
+    def test_indexed_text_only_changes_search_pages(self):
+        plain, search = self._list(), self._list(query='?q=report')
+        bump_search_version()
+        self.assertEqual(self._list(plain['ETag']).status_code, 304)
+        self.assertEqual(self._list(search['ETag'], query='?q=report').status_code, 200)
@@ -0,0 +1,201 @@
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase, override_settings
+from wsgiref.util import FileWrapper, setup_testing_defaults
+from .benchdb import seed_stored_files, seed_users
+from .download_tokens import issue_download_token
+from .models import SecureDownloadURL
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+
+# Downloads served the way production WSGI servers serve them.
+# Run with: python manage.py test file_sharing.test_delivery
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='file-sharing-test-')
+
+
+class SendfileWrapper:
+    """``wsgi.file_wrapper`` sending like gunicorn: socket.sendfile() from
+    the current offset, after which the descriptor's position is restored.
+    The body yields what a client reading ``drop_after`` bytes received."""
+
+    def __init__(self, filelike, block_size=8192, drop_after=None):
+        self.filelike = filelike
+        self.drop_after = drop_after
+
+    def __iter__(self):
+        fd = self.filelike.fileno()
+        offset = os.lseek(fd, 0, os.SEEK_CUR)
+        server, client = socket.socketpair()
+        received = bytearray()
+
+        def receive():
+            with client:
+                while self.drop_after is None or len(received) < self.drop_after:
+                    chunk = client.recv(65536)
+                    if not chunk:
+                        return
+                    received.extend(chunk)
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        try:
+            with server:
+                server.sendfile(self.filelike, offset, os.fstat(fd).st_size - offset)
+        except OSError:
+            pass
+        finally:
+            receiver.join()
+            os.lseek(fd, offset, os.SEEK_SET)
+        yield bytes(received)
+
+    def close(self):
+        self.filelike.close()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DATABASE_REPLICA_MODELS=[],
+    DOWNLOAD_TOKEN_MODE='database',
+    FILE_DOWNLOAD_BACKEND='stream',
+    # Several chunks per file, so a transfer can be cut short
+    FILE_DOWNLOAD_CHUNK_SIZE=1024
+)
+class WSGIFileWrapperDownloadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = seed_users(1, user_type='ops')[0]
+        cls.client_user = seed_users(1, user_type='client')[0]
+        # 1 MiB, more than a socket buffer holds
+        cls.file = seed_stored_files(1, cls.ops, random.Random(0))[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # As the test client does: closing connections at the end of a
+        # request would end the test case's transaction
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        # Delivered coverage of earlier tests' tokens
+        cache.clear()
+
+    def _get(self, path, file_wrapper=SendfileWrapper, **headers):
+        environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_HOST': 'testserver', **headers}
+        if file_wrapper is not None:
+            environ['wsgi.file_wrapper'] = file_wrapper
+        setup_testing_defaults(environ)
+        status = []
+        body = WSGIHandler()(environ, lambda s, h: status.append(s))
+        return status[0], body
+
+    def _download(self, path, **kwargs):
+        status, body = self._get(path, **kwargs)
+        try:
+            return status, body, b''.join(body)
+        finally:
+            body.close()
+
+    def _token_used(self, token):
+        return SecureDownloadURL.objects.get(encrypted_url=token).is_used
+
+    def test_complete_download_is_sent_by_the_file_wrapper(self):
+        token, _ = issue_download_token(self.file, self.client_user)
+        status, body, content = self._download(f'/api/download/{token}/')
+        self.assertEqual(status, '200 OK')
+        self.assertIsInstance(body, SendfileWrapper)
+        self.assertEqual(len(content), self.file.file_size)
+        self.assertTrue(self._token_used(token))
+
+    def test_complete_download_read_in_python_consumes_token(self):
+        for file_wrapper in (FileWrapper, None):
+            with self.subTest(file_wrapper=file_wrapper):
+                token, _ = issue_download_token(self.file, self.client_user)
+                status, _, content = self._download(f'/api/download/{token}/', file_wrapper=file_wrapper)
+                self.assertEqual(len(content), self.file.file_size)
+                self.assertTrue(self._token_used(token))
+
+    def test_resumed_download_consumes_token(self):
+        token, _ = issue_download_token(self.file, self.client_user)
+        status, body = self._get(f'/api/download/{token}/', file_wrapper=None)
+        chunks = iter(body)
+        received = next(chunks) + next(chunks)
+        # The client went away: writing the next chunk failed
+        next(chunks)
+        body.close()
+        self.assertFalse(self._token_used(token))
+
+        status, _, content = self._download(f'/api/download/{token}/', HTTP_RANGE=f'bytes={len(received)}-')
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(len(received + content), self.file.file_size)
+        self.assertTrue(self._token_used(token))
+
+    def test_resumed_sendfile_consumes_token(self):
+        token, _ = issue_download_token(self.file, self.client_user)
+        wrapper = lambda filelike, block_size: SendfileWrapper(filelike, block_size, drop_after=64 * 1024)
+        _, _, received = self._download(f'/api/download/{token}/', file_wrapper=wrapper)
+        _, _, content = self._download(f'/api/download/{token}/', HTTP_RANGE=f'bytes={len(received)}-')
+        self.assertEqual(len(received + content), self.file.file_size)
+        self.assertTrue(self._token_used(token))
+
+    def test_ranges_leaving_a_gap_keep_token(self):
+        for range_header in ('bytes=100-', 'bytes=-1', 'bytes=0-99,200-'):
+            with self.subTest(range_header=range_header):
+                token, _ = issue_download_token(self.file, self.client_user)
+                status, _, _ = self._download(f'/api/download/{token}/', HTTP_RANGE=range_header)
+                self.assertEqual(status, '206 Partial Content')
+                self.assertFalse(self._token_used(token))
+
+    def test_ranges_covering_the_file_consume_token(self):
+        token, _ = issue_download_token(self.file, self.client_user)
+        for range_header in ('bytes=0-99', 'bytes=100-199,500-', 'bytes=200-'):
+            self.assertFalse(self._token_used(token))
+            status, _, _ = self._download(f'/api/download/{token}/', HTTP_RANGE=range_header)
+            self.assertEqual(status, '206 Partial Content')
+        self.assertTrue(self._token_used(token))
+
+    def test_concurrent_requests_with_one_token_are_refused(self):
+        for mode in ('database', 'signed'):
+            with self.subTest(mode=mode), self.settings(DOWNLOAD_TOKEN_MODE=mode):
+                token, _ = issue_download_token(self.file, self.client_user)
+                path = f'/api/download/{token}/'
+                _, first = self._get(path, file_wrapper=None)
+                status, _, content = self._download(path)
+                self.assertEqual(status, '400 Bad Request')
+                self.assertIn(b'already in use', content)
+
+                # Once the first transfer is dropped, the URL can be used again
+                next(iter(first))
+                first.close()
+                status, _, content = self._download(path)
+                self.assertEqual(status, '200 OK')
+                self.assertEqual(len(content), self.file.file_size)
+                status, _, _ = self._download(path)
+                self.assertEqual(status, '400 Bad Request')
+
+    def test_dropped_sendfile_keeps_token(self):
+        token, _ = issue_download_token(self.file, self.client_user)
+        wrapper = lambda filelike, block_size: SendfileWrapper(filelike, block_size, drop_after=64 * 1024)
+        status, _, content = self._download(f'/api/download/{token}/', file_wrapper=wrapper)
+        self.assertEqual(status, '200 OK')
+        self.assertLess(len(content), self.file.file_size)
+        self.assertFalse(self._token_used(token))
+
+    def test_dropped_download_keeps_token(self):
+        token, _ = issue_download_token(self.file, self.client_user)
+        status, body = self._get(f'/api/download/{token}/', file_wrapper=None)
+        next(iter(body))
+        body.close()
+        self.assertEqual(status, '200 OK')
+        self.assertFalse(self._token_used(token))
@@ -0,0 +1,90 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .authentication import ClaimsRefreshToken
+from .benchdb import seed_files, seed_users
+from .models import UploadedFile
+from .pagination import _CURSOR
+from datetime import timedelta
+import base64
+
+# Keyset pagination of the file list (file_sharing.pagination).
+# Run with: python manage.py test file_sharing.test_pagination
+
+
+def _cursor(reverse, micros, row_id):
+    return base64.urlsafe_b64encode(_CURSOR.pack(reverse, micros, row_id)).rstrip(b'=').decode()
+
+
+@override_settings(DATABASE_REPLICA_MODELS=[])
+class FileKeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = seed_users(1, user_type='ops')[0]
+        cls.client_user = seed_users(1, user_type='client')[0]
+        seed_files(20, cls.ops)
+        # Uploads landing in the same microsecond: runs of 4 rows share a timestamp
+        files = list(UploadedFile.objects.order_by('id'))
+        start = timezone.now().replace(microsecond=0)
+        for i, file_obj in enumerate(files):
+            file_obj.uploaded_at = start - timedelta(seconds=i // 4)
+        UploadedFile.objects.bulk_update(files, ['uploaded_at'])
+        cls.expected = list(UploadedFile.objects.order_by('-uploaded_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        # Rendered pages are cached by URL
+        for cache in caches.all():
+            cache.clear()
+
+    def _get(self, url):
+        token = ClaimsRefreshToken.for_user(self.client_user).access_token
+        return self.client.get(url, headers={'Authorization': f'Bearer {token}'})
+
+    def _walk(self, url, link):
+        pages = []
+        while url:
+            response = self._get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.json()['results']])
+            url = response.json()[link]
+        return pages
+
+    def test_pages_through_duplicate_timestamps(self):
+        # Page boundaries fall inside runs of equal timestamps
+        pages = self._walk('/api/files/?page_size=3', 'next')
+        self.assertEqual([len(page) for page in pages], [3] * 6 + [2])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_previous_links_retrace_the_pages(self):
+        pages = self._walk('/api/files/?page_size=3', 'next')
+        last = self._get(f"/api/files/?page_size=3&cursor={self._cursor_of_last_page()}")
+        backwards = self._walk(last.json()['previous'], 'previous')
+        self.assertEqual(backwards, pages[-2::-1])
+
+    def _cursor_of_last_page(self):
+        url = '/api/files/?page_size=3'
+        while True:
+            data = self._get(url).json()
+            if data['next'] is None:
+                return url.rsplit('cursor=', 1)[1]
+            url = data['next']
+
+    def test_forged_cursor_seeks_from_its_position(self):
+        # Any well-formed cursor is just a position: rows strictly after it
+        row = UploadedFile.objects.get(id=self.expected[5])
+        micros = int(row.uploaded_at.timestamp()) * 1_000_000 + row.uploaded_at.microsecond
+        response = self._get(f'/api/files/?page_size=3&cursor={_cursor(0, micros, row.id)}')
+        self.assertEqual([r['id'] for r in response.json()['results']], self.expected[6:9])
+
+        # Past the oldest row: an empty page leading back to the first one
+        response = self._get(f'/api/files/?cursor={_cursor(0, 0, 1)}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+        self.assertEqual(response.json()['previous'], 'http://testserver/api/files/')
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('not-a-cursor', _cursor(0, 0, 1)[:-2], _cursor(0, 2 ** 62, 1), '%00'):
+            with self.subTest(cursor=cursor):
+                response = self._get(f'/api/files/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
@@ -0,0 +1,252 @@
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import URLPattern
+from .authentication import ClaimsRefreshToken
+from .benchdb import make_document, seed_files, seed_stored_files, seed_users
+from .download_tokens import issue_bundle_token, issue_download_token
+from .models import EmailVerification, User
+from .querybudget import Budget, QueryBudgetMixin
+from . import urls
+import hashlib
+import random
+import shutil
+import tempfile
+
+# SQL budget of one request to each named endpoint in file_sharing/urls.py.
+# Run with: python manage.py test file_sharing.test_query_budget
+# A failure lists every statement with the rows it returned and its query plan. Raise a
+# budget only together with the change that needs it.
+BUDGETS = {
+    # User INSERT, its encrypted URL (needs the new id), verification, outbox
+    'signup': Budget(queries=6, writes=4, rows_returned=4),
+    'login': Budget(queries=1, rows_returned=1),
+    # Claims and the rotated-token blacklist live in the token and the cache
+    'token-refresh': Budget(queries=0),
+    # Checked and queued by the request, then run by the (eager) job: its
+    # claim, the duplicate check again, the same inserts as signup, the result
+    'bulk-provision-users': Budget(queries=13, writes=7, rows_returned=17),
+    'provisioning-job-status': Budget(queries=1, rows_returned=1),
+    'verify-email': Budget(queries=3, writes=2, rows_returned=3),
+    # Blob, file row and its search index entry
+    'upload-file': Budget(queries=7, writes=5, rows_returned=4),
+    'create-upload-session': Budget(queries=2, writes=1, rows_returned=1),
+    'upload-session-status': Budget(queries=2, rows_returned=1),
+    'upload-chunk': Budget(queries=3, writes=1, rows_returned=2),
+    # Includes the conditional UPDATE claiming the session against a concurrent complete
+    'complete-upload': Budget(queries=12, writes=8, rows_returned=9),
+    # One keyset page (default size 50, plus one row to detect a next page)
+    'list-files': Budget(queries=1, rows_returned=51),
+    'file-detail': Budget(queries=1, rows_returned=1),
+    'get-download-url': Budget(queries=2, writes=1, rows_returned=2),
+    'get-download-urls': Budget(queries=2, writes=1, rows_returned=6),
+    'download-bundle': Budget(queries=2, rows_returned=4),
+    'get-bundle-url': Budget(queries=1, rows_returned=3),
+    'download-bundle-token': Budget(queries=1, rows_returned=3),
+    'download-file': Budget(queries=2, writes=1, rows_returned=2),
+}
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='file-sharing-test-')
+
+
+def _drain(response):
+    # Downloads do their last queries when the stream is exhausted
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+# The test replica mirrors default on its own connection, which cannot see
+# the uncommitted rows of a TestCase: all reads stay on the primary here
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DATABASE_REPLICA_MODELS=[],
+    DOWNLOAD_TOKEN_MODE='database',
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+)
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = seed_users(1, user_type='ops')[0]
+        cls.client_user = seed_users(1, user_type='client')[0]
+        # A realistic catalog: most rows have no content, a few can be downloaded
+        seed_files(200, cls.ops)
+        cls.files = seed_stored_files(3, cls.ops, random.Random(0))
+        cls.file_ids = [f.id for f in cls.files]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Page and user-status caches would hide queries between tests
+        for cache in caches.all():
+            cache.clear()
+
+    def _auth(self, user):
+        return {'Authorization': f'Bearer {ClaimsRefreshToken.for_user(user).access_token}'}
+
+    def budget(self, name):
+        return self.assertQueryBudget(BUDGETS[name])
+
+    def test_every_endpoint_has_a_budget(self):
+        names = {p.name for p in urls.urlpatterns if isinstance(p, URLPattern) and p.name}
+        self.assertEqual(names - set(BUDGETS), set())
+
+    # ================================================================
+    # Authentication
+    # ================================================================
+
+    def test_signup(self):
+        data = {'username': 'new', 'email': 'new@example.com', 'password': 'password123',
+                'password_confirm': 'password123', 'user_type': 'client'}
+        with self.budget('signup'):
+            response = self.client.post('/api/signup/', data)
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        with self.budget('login'):
+            response = self.client.post('/api/login/', {'email': self.client_user.email, 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_refresh(self):
+        refresh = str(ClaimsRefreshToken.for_user(self.client_user))
+        with self.budget('token-refresh'):
+            response = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_provision_users(self):
+        users = [{'username': f'p{i}', 'email': f'p{i}@example.com', 'password': 'password123'} for i in range(3)]
+        with self.settings(TASK_BACKEND='eager'), self.budget('bulk-provision-users'):
+            response = self.client.post('/api/users/bulk/', users, content_type='application/json',
+                                        headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 202)
+
+        with self.budget('provisioning-job-status'):
+            response = self.client.get(response.data['status_url'], headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['created']), ('done', 3))
+
+    def test_verify_email(self):
+        user = User.objects.create_user(username='unverified', email='unverified@example.com',
+                                        password='password123', user_type='client')
+        verification = EmailVerification.objects.create(user=user)
+        with self.budget('verify-email'):
+            response = self.client.get(f'/api/verify-email/{verification.token}/')
+        self.assertEqual(response.status_code, 200)
+
+    # ================================================================
+    # Uploads
+    # ================================================================
+
+    def _document(self, size=16 * 1024):
+        return make_document('docx', size, random.Random(size))
+
+    def test_upload_file(self):
+        upload = SimpleUploadedFile('report.docx', self._document())
+        with self.budget('upload-file'):
+            response = self.client.post('/api/upload/', {'file': upload}, headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 201)
+
+    def _start_upload(self, content):
+        response = self.client.post('/api/uploads/', {'filename': 'big.docx', 'size': len(content)},
+                                    headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def _put_chunk(self, upload_id, content):
+        return self.client.put(
+            f'/api/uploads/{upload_id}/chunks/0/', content, content_type='application/octet-stream',
+            headers={**self._auth(self.ops), 'X-Chunk-SHA256': hashlib.sha256(content).hexdigest()}
+        )
+
+    def test_create_upload_session(self):
+        with self.budget('create-upload-session'):
+            self._start_upload(self._document())
+
+    def test_upload_session_status(self):
+        upload_id = self._start_upload(self._document())
+        with self.budget('upload-session-status'):
+            response = self.client.get(f'/api/uploads/{upload_id}/', headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 200)
+
+    def test_upload_chunk(self):
+        content = self._document()
+        upload_id = self._start_upload(content)
+        with self.budget('upload-chunk'):
+            response = self._put_chunk(upload_id, content)
+        self.assertEqual(response.status_code, 200)
+
+    def test_complete_upload(self):
+        content = self._document()
+        upload_id = self._start_upload(content)
+        self._put_chunk(upload_id, content)
+        with self.budget('complete-upload'):
+            response = self.client.post(f'/api/uploads/{upload_id}/complete/', headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 201)
+
+    # ================================================================
+    # File Catalog
+    # ================================================================
+
+    def test_list_files(self):
+        queries = ['', '?page_size=50', '?file_type=docx', f'?uploaded_by={self.ops.id}',
+                   '?min_size=2000', '?uploaded_after=2000-01-01T00:00:00Z', '?q=report']
+        for query in queries:
+            with self.subTest(query=query), self.budget('list-files'):
+                response = self.client.get(f'/api/files/{query}', headers=self._auth(self.client_user))
+                self.assertEqual(response.status_code, 200)
+
+    def test_list_files_next_page(self):
+        first = self.client.get('/api/files/?page_size=20', headers=self._auth(self.client_user)).json()
+        with self.budget('list-files'):
+            response = self.client.get(first['next'], headers=self._auth(self.client_user))
+        self.assertEqual(response.status_code, 200)
+
+    def test_file_detail(self):
+        with self.budget('file-detail'):
+            response = self.client.get(f'/api/files/{self.file_ids[0]}/', headers=self._auth(self.client_user))
+        self.assertEqual(response.status_code, 200)
+
+    # ================================================================
+    # Downloads
+    # ================================================================
+
+    def test_get_download_url(self):
+        with self.budget('get-download-url'):
+            response = self.client.get(f'/api/files/{self.file_ids[0]}/download-url/',
+                                       headers=self._auth(self.client_user))
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_download_urls(self):
+        with self.budget('get-download-urls'):
+            response = self.client.post('/api/files/download-urls/', {'file_ids': self.file_ids},
+                                        content_type='application/json', headers=self._auth(self.client_user))
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_file(self):
+        token, _ = issue_download_token(self.files[0], self.client_user)
+        with self.budget('download-file'):
+            response = _drain(self.client.get(f'/api/download/{token}/'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_bundle(self):
+        with self.budget('download-bundle'):
+            response = _drain(self.client.post('/api/files/bundle/', {'file_ids': self.file_ids},
+                                               content_type='application/json',
+                                               headers=self._auth(self.client_user)))
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_bundle_url(self):
+        with self.budget('get-bundle-url'):
+            response = self.client.post('/api/files/bundle-url/', {'file_ids': self.file_ids},
+                                        content_type='application/json', headers=self._auth(self.client_user))
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_bundle_token(self):
+        token, _ = issue_bundle_token(self.file_ids, self.client_user)
+        with self.budget('download-bundle-token'):
+            response = _drain(self.client.get(f'/api/download/bundle/{token}/'))
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,68 @@
+from django.core.cache import caches
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from .authentication import ClaimsRefreshToken
+from .benchdb import seed_files, seed_users
+from .routers import PIN_COOKIE, REPLICA_DB_ALIAS
+import os
+import sqlite3
+import tempfile
+
+# Primary/replica routing (file_sharing.routers) and replica connections.
+# Run with: python manage.py test file_sharing.test_routers
+
+
+class ReadOnlyReplicaConnectionTests(SimpleTestCase):
+
+    def test_replica_opens_before_primary_switches_to_wal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            # A database file still in the default rollback journal mode
+            with sqlite3.connect(path) as db:
+                db.execute('CREATE TABLE t (x INTEGER)')
+            db.close()
+
+            replica = DatabaseWrapper(
+                {**connections['default'].settings_dict, 'NAME': f'file:{path}?mode=ro'},
+                alias=REPLICA_DB_ALIAS
+            )
+            try:
+                with replica.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM t')
+                    self.assertEqual(cursor.fetchone(), (0,))
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone(), ('delete',))
+            finally:
+                replica.close()
+
+
+# The test replica mirrors default on its own connection, which only sees
+# committed rows: hence a TransactionTestCase
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', REPLICA_DB_ALIAS}
+
+    def setUp(self):
+        # A cached page would be served without any query
+        for cache in caches.all():
+            cache.clear()
+        ops = seed_users(1, user_type='ops')[0]
+        self.client_user = seed_users(1, user_type='client')[0]
+        seed_files(5, ops)
+        access = ClaimsRefreshToken.for_user(self.client_user).access_token
+        self.headers = {'Authorization': f'Bearer {access}'}
+
+    def _list_files(self):
+        with CaptureQueriesContext(connections[REPLICA_DB_ALIAS]) as replica_queries:
+            response = self.client.get('/api/files/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 5)
+        return replica_queries
+
+    def test_catalog_reads_go_to_the_replica(self):
+        self.assertGreater(len(self._list_files()), 0)
+
+    def test_pinned_client_reads_from_the_primary(self):
+        self.client.cookies[PIN_COOKIE] = '1'
+        self.assertEqual(len(self._list_files()), 0)
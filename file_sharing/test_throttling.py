@@ -0,0 +1,165 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase, override_settings
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+from .authentication import ClaimsRefreshToken
+from .benchdb import seed_stored_files, seed_users
+from .download_tokens import issue_download_token
+from .throttling import FixedWindowRateThrottle
+import random
+import shutil
+import tempfile
+
+# Rate throttles and concurrent-transfer caps (file_sharing.throttling).
+# Run with: python manage.py test file_sharing.test_throttling
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='file-sharing-test-')
+
+RATES = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'upload': '2/min', 'download_url': '2/min'}}
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DATABASE_REPLICA_MODELS=[],
+    DOWNLOAD_TOKEN_MODE='database',
+    FILE_DOWNLOAD_BACKEND='stream',
+    FILE_DOWNLOAD_CHUNK_SIZE=1024,
+    REST_FRAMEWORK=RATES,
+    TRANSFER_CONCURRENCY={'download': 2, 'upload': 2},
+    TRANSFER_RETRY_AFTER=7
+)
+class ThrottlingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ops = seed_users(1, user_type='ops')[0]
+        cls.client_user = seed_users(1, user_type='client')[0]
+        cls.file = seed_stored_files(1, cls.ops, random.Random(0))[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.cache = caches[settings.THROTTLE_CACHE]
+        self.cache.clear()
+
+    def _auth(self, user):
+        return {'Authorization': f'Bearer {ClaimsRefreshToken.for_user(user).access_token}'}
+
+    def _download_path(self):
+        return f'/api/download/{issue_download_token(self.file, self.client_user)[0]}/'
+
+    def _running_downloads(self):
+        return self.cache.get('transfers:download:addr-127.0.0.1')
+
+    # ================================================================
+    # Rate Throttles
+    # ================================================================
+
+    def test_download_url_rate(self):
+        path = f'/api/files/{self.file.id}/download-url/'
+        # 1000 s into a 60 s window: it ends at 1020
+        with mock.patch.object(FixedWindowRateThrottle, 'timer', lambda self: 1000.0):
+            for _ in range(2):
+                self.assertEqual(self.client.get(path, headers=self._auth(self.client_user)).status_code, 200)
+            response = self.client.get(path, headers=self._auth(self.client_user))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+
+        # The next window starts afresh
+        with mock.patch.object(FixedWindowRateThrottle, 'timer', lambda self: 1020.0):
+            self.assertEqual(self.client.get(path, headers=self._auth(self.client_user)).status_code, 200)
+
+    def test_upload_rate(self):
+        data = {'filename': 'report.docx', 'size': 1024}
+        with mock.patch.object(FixedWindowRateThrottle, 'timer', lambda self: 1019.5):
+            for _ in range(2):
+                response = self.client.post('/api/uploads/', data, content_type='application/json',
+                                            headers=self._auth(self.ops))
+                self.assertEqual(response.status_code, 201)
+            response = self.client.post('/api/uploads/', data, content_type='application/json',
+                                        headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 429)
+        # Never less than a second
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_rates_are_per_user(self):
+        other = seed_users(1, user_type='client', prefix='other')[0]
+        path = f'/api/files/{self.file.id}/download-url/'
+        for _ in range(2):
+            self.client.get(path, headers=self._auth(self.client_user))
+        self.assertEqual(self.client.get(path, headers=self._auth(self.client_user)).status_code, 429)
+        self.assertEqual(self.client.get(path, headers=self._auth(other)).status_code, 200)
+
+    # ================================================================
+    # Concurrent Transfers
+    # ================================================================
+
+    def test_download_concurrency(self):
+        held = [self.client.get(self._download_path()) for _ in range(2)]
+        self.assertEqual([response.status_code for response in held], [200, 200])
+        self.assertEqual(self._running_downloads(), 2)
+
+        response = self.client.get(self._download_path())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        # The refused request does not count
+        self.assertEqual(self._running_downloads(), 2)
+
+        # The test client leaves streamed responses open; a server closes them
+        held[0].close()
+        self.assertEqual(self._running_downloads(), 1)
+        response = self.client.get(self._download_path())
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        held[1].close()
+        self.assertEqual(self._running_downloads(), 0)
+
+    def test_upload_concurrency(self):
+        # Two uploads of this user still running elsewhere
+        self.cache.set(f'transfers:upload:user-{self.ops.id}', 2)
+        response = self.client.post('/api/upload/', {}, headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(self.cache.get(f'transfers:upload:user-{self.ops.id}'), 2)
+
+        self.cache.decr(f'transfers:upload:user-{self.ops.id}')
+        response = self.client.post('/api/upload/', {}, headers=self._auth(self.ops))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cache.get(f'transfers:upload:user-{self.ops.id}'), 1)
+
+    def test_client_disconnect_frees_download_slot(self):
+        # As the test client does: closing connections at the end of a
+        # request would end the test case's transaction
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+        environ = {'PATH_INFO': self._download_path(), 'REQUEST_METHOD': 'GET', 'HTTP_HOST': 'testserver',
+                   'REMOTE_ADDR': '127.0.0.1'}
+        setup_testing_defaults(environ)
+        status = []
+        body = WSGIHandler()(environ, lambda s, h: status.append(s))
+        self.assertEqual(status, ['200 OK'])
+        # The server sent a chunk, then writing the next one failed
+        chunks = iter(body)
+        next(chunks)
+        next(chunks)
+        self.assertEqual(self._running_downloads(), 1)
+        body.close()
+        self.assertEqual(self._running_downloads(), 0)
+
+    @override_settings(TRANSFER_CONCURRENCY={})
+    def test_no_cap_without_a_limit(self):
+        held = [self.client.get(self._download_path()) for _ in range(3)]
+        self.assertEqual([response.status_code for response in held], [200, 200, 200])
+        for response in held:
+            response.close()
+        self.assertIsNone(self._running_downloads())
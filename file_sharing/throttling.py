@@ -0,0 +1,280 @@
+from django.conf import settings
+from django.core.cache import caches
+from functools import wraps
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+import asyncio
+import math
+import time
+
+# Rate limits and concurrent-transfer caps shared by all worker processes
+# through the THROTTLE_CACHE cache (use memcached or Redis in production;
+# the default LocMemCache only limits each process on its own).
+#
+# A limited request costs one atomic cache incr before it is served: on a
+# rate-throttled endpoint the counter of the current window, on a transfer
+# endpoint the caller's count of running transfers (decremented again when
+# the response closes). Keys are created with add(); each process notes
+# the keys it knows to exist (_KnownKeys), so that only its first request
+# on a key takes the add() first. Transfers have no rate throttle of their
+# own: each download needs a link minted under the download_url rate, and
+# uploads are begun and completed under the upload rate.
+#
+# The rate throttles are fixed windows: a client may make the rate's
+# requests in each period, so up to twice the rate can pass across a period
+# boundary. A token bucket (continuous refill) would need a read and a
+# compare-and-set, which the Django cache API does not offer in one round
+# trip.
+
+
+def _cache():
+    return caches[settings.THROTTLE_CACHE]
+
+
+class _KnownKeys:
+    """Cache keys this process has seen exist, each until a deadline"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.deadlines = {}
+
+    def __contains__(self, key):
+        deadline = self.deadlines.get(key)
+        return deadline is not None and deadline > time.monotonic()
+
+    def add(self, key, ttl):
+        now = time.monotonic()
+        if len(self.deadlines) >= self.max_size:
+            self.deadlines = {k: d for k, d in self.deadlines.items() if d > now}
+            if len(self.deadlines) >= self.max_size:
+                self.deadlines.clear()
+        self.deadlines[key] = now + ttl
+
+    def discard(self, key):
+        self.deadlines.pop(key, None)
+
+
+_known_keys = _KnownKeys()
+
+
+def _count(cache, key, timeout, known_for, refresh=False):
+    """Atomically count one more on ``key``, creating it with ``timeout``.
+
+    A key known to exist is incremented in one round trip; otherwise add()
+    creates it (whoever loses that race increments, and with ``refresh``
+    resets the key's timeout), and the key is then known for ``known_for``
+    seconds.
+    """
+    if key in _known_keys:
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Expired or evicted since
+            _known_keys.discard(key)
+    if cache.add(key, 1, timeout):
+        count = 1
+    else:
+        count = cache.incr(key)
+        if refresh:
+            cache.touch(key, timeout)
+    _known_keys.add(key, known_for)
+    return count
+
+
+async def _acount(cache, key, timeout, known_for, refresh=False):
+    if key in _known_keys:
+        try:
+            return await cache.aincr(key)
+        except ValueError:
+            _known_keys.discard(key)
+    if await cache.aadd(key, 1, timeout):
+        count = 1
+    else:
+        count = await cache.aincr(key)
+        if refresh:
+            await cache.atouch(key, timeout)
+    _known_keys.add(key, known_for)
+    return count
+
+
+# DRF's client address lookup (honours NUM_PROXIES)
+_addresses = BaseThrottle()
+
+
+def _ident(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user-{user.pk}'
+    # Download links are used without a login: limited per client address
+    return f'addr-{_addresses.get_ident(request)}'
+
+
+# ================================================================
+# Rate Throttles
+# ================================================================
+
+class FixedWindowRateThrottle(SimpleRateThrottle):
+    """Per-user (per client address when anonymous) request rate for ``scope``, counted in fixed windows.
+
+    Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] like DRF's own
+    throttles; a scope without a rate (or with None) is not throttled.
+    Async views call aallow_request().
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s:%(period)d'
+
+    @property
+    def cache(self):
+        return _cache()
+
+    def get_rate(self):
+        # Looked up per instance (DRF makes one per request), so that
+        # changed settings apply without a restart of the class
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def _window_key(self, request):
+        self.now = self.timer()
+        period = int(self.now // self.duration)
+        self.window_end = (period + 1) * self.duration
+        return self.cache_format % {'scope': self.scope, 'ident': _ident(request), 'period': period}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self._window_key(request)
+        # Window keys outlive their period by a little, then expire
+        count = _count(self.cache, key, self.duration + 1, self.window_end - self.now)
+        return count <= self.num_requests
+
+    async def aallow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self._window_key(request)
+        count = await _acount(self.cache, key, self.duration + 1, self.window_end - self.now)
+        return count <= self.num_requests
+
+    def wait(self):
+        return max(math.ceil(self.window_end - self.now), 1)
+
+
+class UploadThrottle(FixedWindowRateThrottle):
+    scope = 'upload'
+
+
+class DownloadURLThrottle(FixedWindowRateThrottle):
+    scope = 'download_url'
+
+
+# ================================================================
+# Concurrent Transfers
+# ================================================================
+
+class _TransferSlot:
+    """One of the caller's TRANSFER_CONCURRENCY[kind] transfers, counted in the cache.
+
+    The count is one key per caller and kind, incremented on acquire and
+    decremented on release. Its timeout is reset when a process first counts
+    on the key and then at most every half TRANSFER_SLOT_TIMEOUT, so the
+    key only expires once the caller has started no transfer for that long,
+    forgetting any count leaked by a killed worker. A release after the key
+    expired does nothing, and one that finds the count at zero leaves it there.
+    """
+
+    def __init__(self, kind, request):
+        self.key = f'transfers:{kind}:{_ident(request)}'
+        self.held = False
+
+    def acquire(self, limit):
+        timeout = settings.TRANSFER_SLOT_TIMEOUT
+        self.held = True
+        if _count(_cache(), self.key, timeout, timeout / 2, refresh=True) > limit:
+            self.release()
+            return False
+        return True
+
+    async def aacquire(self, limit):
+        timeout = settings.TRANSFER_SLOT_TIMEOUT
+        self.held = True
+        if await _acount(_cache(), self.key, timeout, timeout / 2, refresh=True) > limit:
+            await self.arelease()
+            return False
+        return True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            cache = _cache()
+            try:
+                count = cache.decr(self.key)
+            except ValueError:
+                # Expired while the transfer was running
+                return
+            if count < 0:
+                cache.incr(self.key, -count)
+
+    async def arelease(self):
+        if self.held:
+            self.held = False
+            cache = _cache()
+            try:
+                count = await cache.adecr(self.key)
+            except ValueError:
+                return
+            if count < 0:
+                await cache.aincr(self.key, -count)
+
+    def release_on_close(self, response):
+        # Django closes the response once the server has sent (or dropped) it,
+        # which for a streamed download is after the last byte
+        response._resource_closers.append(self.release)
+        return response
+
+
+def _too_many(kind):
+    return Throttled(wait=settings.TRANSFER_RETRY_AFTER, detail=f'Too many concurrent {kind}s.')
+
+
+def transfer_slot(kind):
+    """View decorator capping the caller's concurrent ``kind`` transfers at TRANSFER_CONCURRENCY[kind].
+
+    A request over the cap gets a 429 with Retry-After (TRANSFER_RETRY_AFTER).
+    The slot is held until the response is closed; a slot leaked by a
+    killed worker is forgotten once the caller has started no transfer for
+    TRANSFER_SLOT_TIMEOUT seconds. Goes
+    below @api_view / @async_api_view, so the user is authenticated.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                limit = settings.TRANSFER_CONCURRENCY.get(kind)
+                if not limit:
+                    return await view(request, *args, **kwargs)
+                slot = _TransferSlot(kind, request)
+                if not await slot.aacquire(limit):
+                    raise _too_many(kind)
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    await slot.arelease()
+                    raise
+                return slot.release_on_close(response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limit = settings.TRANSFER_CONCURRENCY.get(kind)
+            if not limit:
+                return view(request, *args, **kwargs)
+            slot = _TransferSlot(kind, request)
+            if not slot.acquire(limit):
+                raise _too_many(kind)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                slot.release()
+                raise
+            return slot.release_on_close(response)
+        return wrapper
+
+    return decorator
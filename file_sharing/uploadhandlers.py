@@ -0,0 +1,118 @@
+from django.core.files.uploadhandler import (
+    FileUploadHandler, MemoryFileUploadHandler, TemporaryFileUploadHandler, StopUpload
+)
+import hashlib
+import magic
+
+OOXML_MIME_TYPES = {
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def sniff_ooxml(data, extension):
+    """Check the first bytes of an upload; returns an error message or None.
+
+    OOXML documents are zip containers. libmagic recognises the specific
+    format when [Content_Types].xml comes first (as Office writes it) and
+    reports a generic zip otherwise, which is accepted.
+    """
+    if not data.startswith(b'PK\x03\x04'):
+        return f"File content is not a valid {extension} document"
+
+    mime = magic.from_buffer(data, mime=True)
+    if mime in OOXML_MIME_TYPES.values() and mime != OOXML_MIME_TYPES[extension]:
+        return f"File content does not match the .{extension} extension"
+    if mime not in OOXML_MIME_TYPES.values() and mime not in ('application/zip', 'application/octet-stream'):
+        return f"File content is not a valid {extension} document"
+    return None
+
+
+class HashingMixin:
+    """Compute the SHA-256 of an upload while its chunks stream in.
+
+    The digest is attached to the resulting UploadedFile as ``sha256`` so the
+    content can be deduplicated without reading it back from disk.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Set before super(): the memory handler may raise StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        if data is None:
+            # This handler kept the chunk, so it is the one producing the file
+            self.sha256.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class UploadGuardHandler(FileUploadHandler):
+    """Reject oversized or non-OOXML uploads before the body has been read.
+
+    Must come first in ``request.upload_handlers``. It checks Content-Length
+    before parsing starts, the extension when a file part begins, the running
+    byte count, and the magic bytes of the first chunk. On violation it
+    records ``error``/``status_code`` and raises StopUpload without draining
+    the rest of the request body.
+    """
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size
+        self.error = None
+        self.status_code = None
+
+    def reject(self, error, status_code):
+        self.error = error
+        self.status_code = status_code
+        raise StopUpload(connection_reset=True)
+
+    def _too_large(self):
+        self.reject(f"File size cannot exceed {self.max_size // (1024 * 1024)}MB", 413)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.max_size + MULTIPART_OVERHEAD:
+            self._too_large()
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.extension = file_name.split('.')[-1].lower()
+        self.received = 0
+
+        if self.extension not in OOXML_MIME_TYPES:
+            self.reject(f"Only {', '.join(OOXML_MIME_TYPES)} files are allowed", 400)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self._too_large()
+
+        if start == 0:
+            error = sniff_ooxml(raw_data, self.extension)
+            if error:
+                self.reject(error, 400)
+
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -1,16 +1,35 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.FILE_SHARING_ASYNC_VIEWS:
+    # ASGI: the catalog and download endpoints run natively async
+    from . import async_views as catalog_views
+else:
+    catalog_views = views
+
 urlpatterns = [
     path('', views.home),
     # Authentication endpoints
     path('signup/', views.signup, name='signup'),
     path('login/', views.login, name='login'),
+    path('token/refresh/', views.refresh_token, name='token-refresh'),
+    path('users/bulk/', views.bulk_provision_users, name='bulk-provision-users'),
+    path('users/bulk/<uuid:job_id>/', views.provisioning_job_status, name='provisioning-job-status'),
     path('verify-email/<uuid:token>/', views.verify_email, name='verify-email'),
     
     # File management endpoints
     path('upload/', views.upload_file, name='upload-file'),
-    path('files/', views.list_files, name='list-files'),
-    path('files/<int:file_id>/download-url/', views.get_download_url, name='get-download-url'),
-    path('download/<str:encrypted_url>/', views.download_file, name='download-file'),
+    path('uploads/', views.create_upload_session, name='create-upload-session'),
+    path('uploads/<uuid:upload_id>/', views.upload_session_status, name='upload-session-status'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', views.upload_chunk, name='upload-chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.complete_upload, name='complete-upload'),
+    path('files/', catalog_views.list_files, name='list-files'),
+    path('files/<int:file_id>/', views.file_detail, name='file-detail'),
+    path('files/<int:file_id>/download-url/', catalog_views.get_download_url, name='get-download-url'),
+    path('files/download-urls/', views.get_download_urls, name='get-download-urls'),
+    path('files/bundle/', views.download_bundle, name='download-bundle'),
+    path('files/bundle-url/', views.get_bundle_url, name='get-bundle-url'),
+    path('download/bundle/<str:token>/', views.download_bundle_token, name='download-bundle-token'),
+    path('download/<str:encrypted_url>/', catalog_views.download_file, name='download-file'),
 ]
\ No newline at end of file
@@ -1,36 +1,120 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from django.conf import settings
+from .metrics import timed
 import base64
 import os
+import signal
+import threading
+import time
+
+def get_key_file():
+    """Path of the file holding the URL encryption keys, one per line"""
+    return getattr(settings, 'ENCRYPTION_KEY_FILE', os.path.join(settings.BASE_DIR, 'encryption.key'))
 
 def get_or_create_key():
-    """Get or create encryption key"""
-    key_file = os.path.join(settings.BASE_DIR, 'encryption.key')
-    
+    """Get or create encryption key (the primary key of the key file)"""
+    key_file = get_key_file()
+
     if os.path.exists(key_file):
         with open(key_file, 'rb') as f:
-            key = f.read()
+            key = f.read().split()[0]
     else:
         key = Fernet.generate_key()
         with open(key_file, 'wb') as f:
             f.write(key)
-    
+
     return key
 
+def read_keys():
+    """All keys from the key file, primary first"""
+    get_or_create_key()
+    with open(get_key_file(), 'rb') as f:
+        return f.read().split()
+
+def write_keys(keys):
+    """Atomically replace the key file with ``keys`` (primary first)"""
+    key_file = get_key_file()
+    tmp_file = f"{key_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(b'\n'.join(keys) + b'\n')
+    os.replace(tmp_file, key_file)
+
+class KeyRing:
+    """Process-wide cache of the Fernet keys used for URL encryption.
+
+    The key file is read once and the MultiFernet built from it is reused.
+    The first key encrypts, every key decrypts, so a new key can be
+    prepended without invalidating URLs that are still outstanding. The file
+    is re-read when its mtime changes (checked at most every
+    ENCRYPTION_KEY_RELOAD_INTERVAL seconds) or after a reload signal.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fernet = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._reload_requested = False
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(get_key_file())
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load(self):
+        stamp = self._file_stamp()
+        fernet = MultiFernet([Fernet(key) for key in read_keys()])
+        # A single reference assignment, so readers never see a half-built ring
+        self._fernet = fernet
+        self._stamp = stamp if stamp is not None else self._file_stamp()
+
+    def _refresh(self, now):
+        with self._lock:
+            if self._fernet is None or self._reload_requested:
+                self._reload_requested = False
+                self._load()
+            elif self._file_stamp() != self._stamp:
+                self._load()
+            self._checked_at = now
+
+    def get(self):
+        """The current MultiFernet"""
+        now = time.monotonic()
+        interval = settings.ENCRYPTION_KEY_RELOAD_INTERVAL
+        if (
+            self._fernet is None
+            or self._reload_requested
+            or (interval and now - self._checked_at >= interval)
+        ):
+            self._refresh(now)
+        return self._fernet
+
+    def request_reload(self, *args):
+        """Reload the keys on next use; safe to call from a signal handler"""
+        self._reload_requested = True
+
+    def install_reload_signal(self, signum):
+        """Reload the keys when the process receives ``signum``"""
+        if isinstance(signum, str):
+            signum = getattr(signal, signum)
+        signal.signal(signum, self.request_reload)
+
+key_ring = KeyRing()
+
+@timed('crypto')
 def encrypt_url(data):
     """Encrypt URL data"""
-    key = get_or_create_key()
-    f = Fernet(key)
-    encrypted_data = f.encrypt(data.encode())
+    encrypted_data = key_ring.get().encrypt(data.encode())
     return base64.urlsafe_b64encode(encrypted_data).decode()
 
+@timed('crypto')
 def decrypt_url(encrypted_data):
     """Decrypt URL data"""
     try:
-        key = get_or_create_key()
-        f = Fernet(key)
         decoded_data = base64.urlsafe_b64decode(encrypted_data.encode())
-        decrypted_data = f.decrypt(decoded_data)
+        decrypted_data = key_ring.get().decrypt(decoded_data)
         return decrypted_data.decode()
     except Exception:
-        return None
\ No newline at end of file
+        return None
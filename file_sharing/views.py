@@ -2,24 +2,55 @@ from django.shortcuts import render
 
 # Create your views here.
 from rest_framework import status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
-from django.core.mail import send_mail
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
-from .models import User, UploadedFile, EmailVerification, SecureDownloadURL
-from .serializers import UserSignUpSerializer, UserLoginSerializer, FileUploadSerializer, UploadedFileSerializer
-from .utils import encrypt_url, decrypt_url
-import uuid
+from django.utils.crypto import constant_time_compare
+from .models import User, UploadedFile, EmailVerification, ProvisioningJob, UploadSession, UploadChunk
+from .serializers import (
+    UserSignUpSerializer, UserLoginSerializer, FileUploadSerializer, FileBatchSerializer,
+    UploadedFileDetailSerializer, FileFilterSerializer, UPLOADED_FILE_COLUMNS, project_uploaded_files,
+    UploadSessionSerializer, UploadSessionStatusSerializer
+)
+from .storage import hash_file, store_staged_blob, write_chunk
+from .emails import queue_emails, verification_email
+from .uploadhandlers import UploadGuardHandler, StopUpload, sniff_ooxml
+from .authentication import ClaimsRefreshToken, ClaimsTokenRefreshSerializer
+from .catalog import cached_catalog_response
+from .delivery import serve_file, serve_bundle
+from . import metrics as file_sharing_metrics
+from .pagination import FileKeysetPagination
+from .executor import submit
+from .provisioning import ProvisioningError, parse_users, queue_job, validate_users
+from .tasks import run_provisioning_job
+from .renderers import FastJSONRenderer
+from .throttling import DownloadURLThrottle, UploadThrottle, transfer_slot
+from .download_tokens import (
+    DownloadTokenError, issue_download_token, issue_download_tokens, redeem_download_token,
+    issue_bundle_token, redeem_bundle_token, build_download_url, build_bundle_url
+)
 from django.http import JsonResponse
 
 def home(request):
     return JsonResponse({"message": "Welcome to the File Sharing API"})
 
+def metrics(request):
+    """Prometheus scrape endpoint (bearer METRICS_TOKEN; open without one only under DEBUG)"""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), expected):
+            return HttpResponse(status=403)
+    elif not settings.DEBUG:
+        return HttpResponse(status=403)
+    return HttpResponse(file_sharing_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def signup(request):
@@ -27,22 +58,14 @@ def signup(request):
     serializer = UserSignUpSerializer(data=request.data)
     
     if serializer.is_valid():
-        user = serializer.save()
-        
-        # Create email verification token
-        verification = EmailVerification.objects.create(user=user)
-        
-        # Send verification email (in production, use proper email service)
-        verification_url = f"http://localhost:8000/api/verify-email/{verification.token}/"
-        
-        # For development, we'll use console backend
-        send_mail(
-            'Verify Your Email',
-            f'Click here to verify your email: {verification_url}',
-            settings.EMAIL_HOST_USER,
-            [user.email],
-            fail_silently=False,
-        )
+        with transaction.atomic():
+            user = serializer.save()
+            
+            # Create email verification token
+            verification = EmailVerification.objects.create(user=user)
+            
+            # Queued in the same transaction; sent in the background after commit
+            queue_emails([verification_email(verification, user)])
         
         response_data = {
             'message': 'User created successfully',
@@ -63,16 +86,18 @@ def signup(request):
 def verify_email(request, token):
     """Email verification endpoint"""
     try:
-        verification = EmailVerification.objects.get(token=token, is_verified=False)
+        verification = EmailVerification.objects.select_related('user').get(token=token, is_verified=False)
         
         if verification.is_expired():
             return Response({'error': 'Verification link has expired'}, status=status.HTTP_400_BAD_REQUEST)
         
-        verification.user.is_email_verified = True
-        verification.user.save()
-        
-        verification.is_verified = True
-        verification.save()
+        # Two narrow UPDATEs; a full save() of the user would also invalidate the file list cache
+        with transaction.atomic():
+            verification.user.is_email_verified = True
+            verification.user.save(update_fields=['is_email_verified'])
+            
+            verification.is_verified = True
+            verification.save(update_fields=['is_verified'])
         
         return Response({'message': 'Email verified successfully'}, status=status.HTTP_200_OK)
     
@@ -89,7 +114,8 @@ def login(request):
         user = serializer.validated_data['user']
         
         # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        # user_type / is_email_verified travel in the token (see authentication.py)
+        refresh = ClaimsRefreshToken.for_user(user)
         access_token = str(refresh.access_token)
         
         return Response({
@@ -102,21 +128,109 @@ def login(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def refresh_token(request):
+    """Exchange a refresh token for a new access token (and a rotated refresh token)"""
+    serializer = ClaimsTokenRefreshSerializer(data=request.data)
+    
+    if serializer.is_valid():
+        data = serializer.validated_data
+        response = {'access_token': data['access']}
+        if 'refresh' in data:
+            response['refresh_token'] = data['refresh']
+        return Response(response, status=status.HTTP_200_OK)
+    
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_provision_users(request):
+    """Create many users at once from a CSV or JSON upload (ops users only).
+
+    The rows are checked here and provisioned by a background job (password
+    hashing is slow); poll the returned status_url for the outcome.
+    """
+    if request.user.user_type != 'ops':
+        return Response({'error': 'Only ops users can provision users'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        if request.content_type.startswith('text/csv'):
+            rows = parse_users(request.body, 'csv')
+        elif 'file' in request.FILES:
+            upload = request.FILES['file']
+            rows = parse_users(upload.read(), 'json' if upload.name.lower().endswith('.json') else 'csv')
+        else:
+            rows = parse_users(request.data, 'json')
+    except ProvisioningError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(rows) > settings.PROVISIONING_MAX_USERS:
+        return Response(
+            {'error': f'At most {settings.PROVISIONING_MAX_USERS} users per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    can_create, errors = validate_users(rows)
+    if not can_create:
+        return Response({'created': 0, 'users': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+    
+    job = queue_job(rows, request.user.id)
+    submit(run_provisioning_job, str(job.id))
+    
+    return Response({
+        'job_id': job.id,
+        'status': 'queued',
+        'status_url': request.build_absolute_uri(reverse('provisioning-job-status', args=[job.id]))
+    }, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def provisioning_job_status(request, job_id):
+    """Progress of a bulk provisioning job, and its created users and row errors once done"""
+    job = ProvisioningJob.objects.filter(pk=job_id, requested_by_id=request.user.id).first()
+    
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    result = job.result
+    return Response({
+        'job_id': job.id,
+        'status': job.status,
+        'created': len(result.get('users', [])),
+        **result
+    }, status=status.HTTP_200_OK)
+
 # ================================================================
 # File Management Views
 # ================================================================
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@transfer_slot('upload')
 def upload_file(request):
     """File upload for ops users only"""
     if request.user.user_type != 'ops':
         return Response({'error': 'Only operation users can upload files'}, status=status.HTTP_403_FORBIDDEN)
     
-    serializer = FileUploadSerializer(data=request.data, context={'request': request})
+    # Abort oversized / non-OOXML bodies while they stream in, not after
+    guard = UploadGuardHandler(request, max_size=settings.FILE_UPLOAD_MAX_SIZE)
+    request.upload_handlers.insert(0, guard)
+    
+    with file_sharing_metrics.Transfer('upload'):
+        try:
+            data = request.data
+        except StopUpload:
+            data = None
+    
+    if guard.error:
+        return Response({'file': [guard.error]}, status=guard.status_code)
+    
+    serializer = FileUploadSerializer(data=data, context={'request': request})
     
     if serializer.is_valid():
         uploaded_file = serializer.save()
+        file_sharing_metrics.UPLOAD_BYTES.inc(amount=uploaded_file.file_size)
         
         return Response({
             'message': 'File uploaded successfully',
@@ -128,20 +242,206 @@ def upload_file(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# ================================================================
+# Resumable (Chunked) Upload Views
+# ================================================================
+
+def _get_upload_session(request, upload_id):
+    try:
+        return UploadSession.objects.get(id=upload_id, user_id=request.user.id)
+    except UploadSession.DoesNotExist:
+        return None
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([UploadThrottle])
+def create_upload_session(request):
+    """Start a resumable upload for ops users"""
+    if request.user.user_type != 'ops':
+        return Response({'error': 'Only operation users can upload files'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = UploadSessionSerializer(data=request.data, context={'request': request})
+    
+    if serializer.is_valid():
+        session = serializer.save()
+        return Response(UploadSessionStatusSerializer(session).data, status=status.HTTP_201_CREATED)
+    
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+def upload_session_status(request, upload_id):
+    """Report which chunks of a resumable upload have been received"""
+    session = _get_upload_session(request, upload_id)
+    
+    if session is None:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(UploadSessionStatusSerializer(session).data, status=status.HTTP_200_OK)
+
+@api_view(['PUT'])
+@permission_classes([permissions.IsAuthenticated])
+@transfer_slot('upload')
+def upload_chunk(request, upload_id, index):
+    """Receive one chunk (raw request body) and write it at its offset"""
+    session = _get_upload_session(request, upload_id)
+    
+    if session is None:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if session.is_complete or session.is_expired():
+        return Response({'error': 'Upload is already complete or has expired'}, status=status.HTTP_409_CONFLICT)
+    
+    if index >= session.total_chunks:
+        return Response({'error': f'Chunk index must be below {session.total_chunks}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    checksum = request.META.get('HTTP_X_CHUNK_SHA256', '').lower()
+    if not checksum:
+        return Response({'error': 'X-Chunk-SHA256 header is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    length = session.chunk_length(index)
+    
+    # An empty or chunked (unsized) body leaves DRF with no stream at all
+    declared = request.META.get('CONTENT_LENGTH')
+    if not declared:
+        return Response({'error': 'Content-Length header is required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+    if declared != str(length) or request.stream is None:
+        return Response({'error': f'Chunk must be exactly {length} bytes'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        with file_sharing_metrics.Transfer('chunk'):
+            digest = write_chunk(session.staging_name, index * session.chunk_size, request.stream, length)
+        if digest != checksum:
+            raise ValueError('Chunk checksum mismatch')
+        if index == 0:
+            # Same content sniffing as single-request uploads
+            with default_storage.open(session.staging_name) as f:
+                error = sniff_ooxml(f.read(min(length, 64 * 1024)), session.file_type)
+            if error:
+                raise ValueError(error)
+    except ValueError as e:
+        # The region may now hold partial data: it has to be sent again
+        UploadChunk.objects.filter(session=session, index=index).delete()
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    UploadChunk.objects.update_or_create(
+        session=session, index=index,
+        defaults={'size': length, 'sha256': digest}
+    )
+    file_sharing_metrics.UPLOAD_BYTES.inc(amount=length)
+    
+    return Response({'index': index, 'size': length}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([UploadThrottle])
+def complete_upload(request, upload_id):
+    """Finalize a resumable upload into an UploadedFile"""
+    session = _get_upload_session(request, upload_id)
+    
+    if session is None:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if not session.is_complete:
+        if session.is_expired():
+            return Response({'error': 'Upload has expired'}, status=status.HTTP_409_CONFLICT)
+        
+        received = session.chunks.count()
+        if received != session.total_chunks:
+            return Response({
+                'error': 'Upload is missing chunks',
+                'received_chunks': received,
+                'total_chunks': session.total_chunks
+            }, status=status.HTTP_409_CONFLICT)
+        
+        # Claim the session before touching the staging file: of two
+        # concurrent completes only one gets past this update
+        if not UploadSession.objects.filter(pk=session.pk, is_complete=False).update(is_complete=True):
+            session.refresh_from_db(fields=['uploaded_file', 'is_complete'])
+            if session.uploaded_file is None:
+                return Response({'error': 'Upload is already being completed'}, status=status.HTTP_409_CONFLICT)
+        else:
+            try:
+                # The staging file becomes the blob itself (a rename, not a copy)
+                with default_storage.open(session.staging_name) as f:
+                    sha256 = hash_file(f)
+                
+                with transaction.atomic():
+                    blob = store_staged_blob(session.staging_name, sha256)
+                    uploaded_file = UploadedFile.objects.create(
+                        uploaded_by_id=session.user_id,
+                        file=blob.file.name,
+                        blob=blob,
+                        original_filename=session.filename,
+                        file_size=session.total_size,
+                        file_type=session.file_type
+                    )
+                    session.uploaded_file = uploaded_file
+                    session.save(update_fields=['uploaded_file'])
+                    session.chunks.all().delete()
+            except BaseException:
+                # Give the claim back so the client can retry
+                UploadSession.objects.filter(pk=session.pk).update(is_complete=False)
+                raise
+    
+    uploaded_file = session.uploaded_file
+    
+    if uploaded_file is None:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'message': 'File uploaded successfully',
+        'file_id': uploaded_file.id,
+        'filename': uploaded_file.original_filename,
+        'file_type': uploaded_file.file_type,
+        'size': uploaded_file.file_size
+    }, status=status.HTTP_201_CREATED)
+
+@api_view(['GET', 'HEAD'])
+@permission_classes([permissions.IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
 def list_files(request):
-    """List all uploaded files for client users"""
+    """List uploaded files for client users (filterable, full-text searchable with ?q=)"""
     if request.user.user_type != 'client':
         return Response({'error': 'Only client users can list files'}, status=status.HTTP_403_FORBIDDEN)
     
-    files = UploadedFile.objects.all().order_by('-uploaded_at')
-    serializer = UploadedFileSerializer(files, many=True)
+    filters = FileFilterSerializer(data=request.query_params)
     
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    if not filters.is_valid():
+        return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    def build_page():
+        # Keyset-paginated on (uploaded_at, id); the uploader name is joined in
+        # and rows are projected straight to dicts (see project_uploaded_files)
+        paginator = FileKeysetPagination()
+        files = filters.filter_queryset(UploadedFile.objects.all())
+        rows = paginator.paginate_queryset(files.values_list(*UPLOADED_FILE_COLUMNS, named=True), request)
+        return paginator.get_paginated_data(project_uploaded_files(rows))
+    
+    # Rendered pages are cached per catalog version; unchanged polls get a 304
+    return cached_catalog_response(request, build_page)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+def file_detail(request, file_id):
+    """File details, including post-upload processing status and extracted metadata"""
+    try:
+        file_obj = UploadedFile.objects.select_related('uploaded_by').get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # Ops users see their own uploads' progress; clients see every file
+    if request.user.user_type != 'client' and file_obj.uploaded_by_id != request.user.id:
+        return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    serializer = UploadedFileDetailSerializer(file_obj, context={'request': request})
+    
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+@api_view(['GET', 'HEAD'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([DownloadURLThrottle])
 def get_download_url(request, file_id):
     """Generate secure download URL for client users"""
     if request.user.user_type != 'client':
@@ -153,71 +453,161 @@ def get_download_url(request, file_id):
         return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
     
     # Generate secure download URL
-    token = uuid.uuid4()
-    encrypted_data = encrypt_url(f"{file_id}_{request.user.id}_{token}")
-    
-    # Create secure download record
-    secure_url = SecureDownloadURL.objects.create(
-        file=file_obj,
-        user=request.user,
-        encrypted_url=encrypted_data,
-        token=token
-    )
-    
-    download_url = f"http://localhost:8000/api/download/{encrypted_data}/"
+    token, expires_at = issue_download_token(file_obj, request.user)
+    download_url = build_download_url(token)
     
     return Response({
         'download_url': download_url,
-        'expires_at': secure_url.expires_at,
+        'expires_at': expires_at,
         'filename': file_obj.original_filename
     }, status=status.HTTP_200_OK)
 
-@api_view(['GET'])
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([DownloadURLThrottle])
+def get_download_urls(request):
+    """Generate secure download URLs for a batch of files (client users)"""
+    if request.user.user_type != 'client':
+        return Response({'error': 'Only client users can download files'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = FileBatchSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    # De-duplicate while keeping the caller's order
+    file_ids = list(dict.fromkeys(serializer.validated_data['file_ids']))
+    
+    # One id__in query for all files, one bulk INSERT for all token rows
+    files = UploadedFile.objects.in_bulk(file_ids)
+    found = [files[file_id] for file_id in file_ids if file_id in files]
+    tokens = issue_download_tokens(found, request.user)
+    
+    results = [
+        {
+            'file_id': file_obj.id,
+            'download_url': build_download_url(token),
+            'expires_at': expires_at,
+            'filename': file_obj.original_filename
+        }
+        for file_obj, (token, expires_at) in zip(found, tokens)
+    ]
+    errors = [
+        {'file_id': file_id, 'error': 'File not found'}
+        for file_id in file_ids if file_id not in files
+    ]
+    
+    return Response({'results': results, 'errors': errors}, status=status.HTTP_200_OK)
+
+@api_view(['GET', 'HEAD'])
 @permission_classes([permissions.AllowAny])
+@transfer_slot('download')
 def download_file(request, encrypted_url):
     """Download file using encrypted URL"""
-    decrypted_data = decrypt_url(encrypted_url)
+    try:
+        file_obj, use = redeem_download_token(encrypted_url)
+    except DownloadTokenError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    if not decrypted_data:
-        return Response({'error': 'Invalid download URL'}, status=status.HTTP_400_BAD_REQUEST)
+    # Serve file (streamed from disk or offloaded to the web server). The
+    # token is consumed only once the whole file has been delivered, so an
+    # interrupted transfer can be resumed with a Range request
+    try:
+        response = serve_file(request, file_obj, on_delivered=use.delivered if use else None)
+    except FileNotFoundError:
+        response = Response({'error': 'File not found on server'}, status=status.HTTP_404_NOT_FOUND)
+    except BaseException:
+        if use:
+            use.release()
+        raise
+    
+    # Held until the transfer is over: a concurrent request is refused
+    return use.release_on_close(response) if use else response
+
+
+# ================================================================
+# Bundle (ZIP) Views
+# ================================================================
+
+def _bundle_response(file_objs, on_complete=None):
+    if not file_objs:
+        return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
     
     try:
-        parts = decrypted_data.split('_')
-        file_id = int(parts[0])
-        user_id = int(parts[1])
-        token = parts[2]
-        
-        # Verify secure download record
-        secure_url = SecureDownloadURL.objects.get(
-            file_id=file_id,
-            user_id=user_id,
-            token=token,
-            is_used=False
-        )
-        
-        if secure_url.is_expired():
-            return Response({'error': 'Download URL has expired'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Mark as used (optional - remove if multiple downloads allowed)
-        secure_url.is_used = True
-        secure_url.save()
-        
-        # Serve file
-        file_obj = secure_url.file
-        
-        try:
-            with open(file_obj.file.path, 'rb') as f:
-                file_data = f.read()
-                
-            response = HttpResponse(
-                file_data,
-                content_type='application/octet-stream'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{file_obj.original_filename}"'
-            return response
-            
-        except FileNotFoundError:
-            return Response({'error': 'File not found on server'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_bundle(file_objs, on_complete=on_complete)
+    except FileNotFoundError:
+        return Response({'error': 'File not found on server'}, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@transfer_slot('download')
+def download_bundle(request):
+    """Stream a ZIP of several files in one response (client users)"""
+    if request.user.user_type != 'client':
+        return Response({'error': 'Only client users can download files'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = FileBatchSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    file_ids = list(dict.fromkeys(serializer.validated_data['file_ids']))
+    files = UploadedFile.objects.in_bulk(file_ids)
+    missing = [file_id for file_id in file_ids if file_id not in files]
+    
+    if missing:
+        return Response({'error': 'File not found', 'file_ids': missing}, status=status.HTTP_404_NOT_FOUND)
+    
+    return _bundle_response([files[file_id] for file_id in file_ids])
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([DownloadURLThrottle])
+def get_bundle_url(request):
+    """Generate one secure URL for a ZIP of several files (client users)"""
+    if request.user.user_type != 'client':
+        return Response({'error': 'Only client users can download files'}, status=status.HTTP_403_FORBIDDEN)
+    
+    serializer = FileBatchSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    file_ids = list(dict.fromkeys(serializer.validated_data['file_ids']))
+    found = set(UploadedFile.objects.filter(id__in=file_ids).values_list('id', flat=True))
+    missing = [file_id for file_id in file_ids if file_id not in found]
+    
+    if missing:
+        return Response({'error': 'File not found', 'file_ids': missing}, status=status.HTTP_404_NOT_FOUND)
+    
+    token, expires_at = issue_bundle_token(file_ids, request.user)
+    
+    return Response({
+        'download_url': build_bundle_url(token),
+        'expires_at': expires_at,
+        'file_count': len(file_ids)
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET', 'HEAD'])
+@permission_classes([permissions.AllowAny])
+@transfer_slot('download')
+def download_bundle_token(request, token):
+    """Stream the ZIP bundle behind a bundle URL"""
+    try:
+        file_ids, use = redeem_bundle_token(token)
+    except DownloadTokenError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Files deleted since the URL was minted are left out of the archive
+        files = UploadedFile.objects.in_bulk(file_ids)
+        file_objs = [files[file_id] for file_id in file_ids if file_id in files]
+        response = _bundle_response(file_objs, on_complete=use.consume if use and request.method != 'HEAD' else None)
+    except BaseException:
+        if use:
+            use.release()
+        raise
     
-    except (ValueError, IndexError, SecureDownloadURL.DoesNotExist):
-        return Response({'error': 'Invalid or expired download URL'}, status=status.HTTP_400_BAD_REQUEST)
+    return use.release_on_close(response) if use else response
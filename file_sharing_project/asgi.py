@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'file_sharing_project.settings')
+# Route the catalog and download endpoints to their async views
+os.environ.setdefault('FILE_SHARING_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
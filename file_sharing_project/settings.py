@@ -42,11 +42,14 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
+    'django_celery_beat',
     'file_sharing',
 ]
 
 MIDDLEWARE = [
+    'file_sharing.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'file_sharing.middleware.DatabasePinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -73,6 +76,21 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'file_sharing_project.wsgi.application'
+ASGI_APPLICATION = 'file_sharing_project.asgi.application'
+# Serve the file list, download URLs and downloads from the async views in
+# file_sharing.async_views (set by asgi.py; leave off under WSGI)
+FILE_SHARING_ASYNC_VIEWS = config('FILE_SHARING_ASYNC_VIEWS', default=False, cast=bool)
+
+# Request metrics (file_sharing.metrics, scraped at /metrics). Database,
+# crypto and storage timings are collected for this fraction of requests
+# (e.g. 0.01); 0 leaves only the per-request total. Sampled responses carry
+# a Server-Timing header when METRICS_SERVER_TIMING is on, which exposes
+# internals to clients.
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.0, cast=float)
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=False, cast=bool)
+# /metrics requires "Authorization: Bearer <token>"; without a token it is
+# only served when DEBUG is on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
 
 AUTH_USER_MODEL = 'file_sharing.User'
 
@@ -81,14 +99,63 @@ AUTH_USER_MODEL = 'file_sharing.User'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 that starts write transactions as
+        # IMMEDIATE (SQLITE_TRANSACTION_MODE below)
+        'ENGINE': 'file_sharing.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open across requests, checked before reuse
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+
+# Catalog reads made while serving a request (the file list, file details)
+# go to the 'replica' alias (see file_sharing.routers); writes and every
+# other read go to the primary. By default the replica is the same SQLite
+# file opened read-only: WAL lets its readers run next to the writer
+# without taking the write lock. DB_REPLICA_NAME can point it at a copy
+# kept in sync by external replication; DB_REPLICA=False turns it off.
+if config('DB_REPLICA', default=True, cast=bool):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': config('DB_REPLICA_NAME', default=f"file:{DATABASES['default']['NAME']}?mode=ro"),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['file_sharing.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_MODELS = ['file_sharing.uploadedfile', 'file_sharing.fileblob']
+# After a write the client reads from the primary for this long (cookie)
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# Applied to every SQLite connection: WAL so readers and the writer don't
+# block each other, NORMAL sync (safe with WAL, fsync at checkpoints only),
+# wait up to busy_timeout ms for the write lock instead of failing, and
+# memory-map the first mmap_size bytes of the file
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+}
+# BEGIN mode of transaction.atomic() blocks on the primary. IMMEDIATE takes
+# the write lock at BEGIN, waiting up to busy_timeout for it, instead of
+# failing with "database is locked" when a read in the block has to be
+# upgraded to a write. Empty for SQLite's default (DEFERRED).
+SQLITE_TRANSACTION_MODE = config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE')
+
+# Cache Configuration
+# LocMemCache is per process; point CACHE_BACKEND at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache) with several workers.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='file-sharing'),
+    }
+}
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'file_sharing.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -96,7 +163,26 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    # Per user and endpoint class, see file_sharing.throttling (transfers
+    # are limited by TRANSFER_CONCURRENCY); an empty rate turns a scope off
+    'DEFAULT_THROTTLE_RATES': {
+        'upload': config('THROTTLE_RATE_UPLOAD', default='30/min') or None,
+        'download_url': config('THROTTLE_RATE_DOWNLOAD_URL', default='120/min') or None,
+    },
 }
+# Cache holding throttle windows and transfer slots; it must be shared by
+# all workers (memcached, Redis) for the limits to hold across processes
+THROTTLE_CACHE = config('THROTTLE_CACHE', default='default')
+# In-flight downloads / uploads per user (0 for no cap); a request over the
+# cap gets a 429 with Retry-After: TRANSFER_RETRY_AFTER seconds
+TRANSFER_CONCURRENCY = {
+    'download': config('TRANSFER_CONCURRENCY_DOWNLOAD', default=4, cast=int),
+    'upload': config('TRANSFER_CONCURRENCY_UPLOAD', default=4, cast=int),
+}
+TRANSFER_RETRY_AFTER = config('TRANSFER_RETRY_AFTER', default=5, cast=int)
+# A caller's count of running transfers expires once they have started none
+# for this many seconds, forgetting slots leaked by a killed worker
+TRANSFER_SLOT_TIMEOUT = config('TRANSFER_SLOT_TIMEOUT', default=3600, cast=int)
 
 # JWT Configuration
 SIMPLE_JWT = {
@@ -104,7 +190,26 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Tokens carry user_type and is_email_verified; requests are authorized
+    # from them without loading the User row
+    'TOKEN_OBTAIN_SERIALIZER': 'file_sharing.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_USER_CLASS': 'file_sharing.authentication.ClaimsUser',
+    'TOKEN_REFRESH_SERIALIZER': 'file_sharing.authentication.ClaimsTokenRefreshSerializer',
 }
+# Rotated-out refresh tokens are blacklisted in this cache (not the
+# token_blacklist app's tables) until they expire, behind a per-process Bloom
+# filter sized for JWT_BLACKLIST_BLOOM_CAPACITY revocations per token
+# lifetime. Other processes learn of a revocation within
+# JWT_BLACKLIST_SYNC_INTERVAL seconds (0: check on every refresh).
+JWT_BLACKLIST_CACHE = 'default'
+JWT_BLACKLIST_BLOOM_CAPACITY = config('JWT_BLACKLIST_BLOOM_CAPACITY', default=100000, cast=int)
+JWT_BLACKLIST_BLOOM_ERROR_RATE = 0.001
+JWT_BLACKLIST_SYNC_INTERVAL = config('JWT_BLACKLIST_SYNC_INTERVAL', default=1.0, cast=float)
+JWT_BLACKLIST_SYNC_BATCH = 500
+# Per-process cache of each user's active flag / role used by
+# ClaimsJWTAuthentication; deactivation elsewhere takes effect within the TTL
+USER_STATUS_CACHE_TTL = config('USER_STATUS_CACHE_TTL', default=30, cast=int)
+USER_STATUS_CACHE_SIZE = 10000
 
 
 # Email Configuration
@@ -114,16 +219,97 @@ EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
-
-
+# Outgoing mail is written to an outbox table in the request's transaction
+# and delivered by the drain_outbox task, OUTBOX_BATCH_SIZE messages per
+# SMTP connection. Failed messages are retried with exponential backoff
+# (OUTBOX_RETRY_BASE doubling up to OUTBOX_RETRY_MAX seconds) and given up
+# after OUTBOX_MAX_ATTEMPTS; a drain that dies releases its claim after
+# OUTBOX_CLAIM_TIMEOUT seconds.
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=100, cast=int)
+OUTBOX_MAX_BATCHES = 50  # per task run
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+OUTBOX_RETRY_BASE = 30
+OUTBOX_RETRY_MAX = 3600
+OUTBOX_CLAIM_TIMEOUT = 300
+
+# Expired download URLs, email verifications and upload sessions, and sent
+# outbox mail, are deleted by the reap_expired_rows task (or `manage.py
+# reap_expired`) REAPER_RETENTION seconds after they stop being useful, in
+# batches of REAPER_BATCH_SIZE rows with a short pause between batches.
+# Rows purged per run are recorded in REAPER_METRICS_CACHE.
+REAPER_RETENTION = config('REAPER_RETENTION', default=24 * 3600, cast=int)
+REAPER_BATCH_SIZE = config('REAPER_BATCH_SIZE', default=1000, cast=int)
+REAPER_BATCH_PAUSE = 0.05  # seconds
+REAPER_MAX_BATCHES = 1000  # per table per run
+REAPER_METRICS_CACHE = 'default'
+
+
+
+# Bulk user provisioning. /api/users/bulk/ queues a background job (on
+# TASK_BACKEND), which hashes passwords inline; `manage.py provision_users`
+# hashes them in a pool of PROVISIONING_HASH_WORKERS processes (0: one per CPU)
+PROVISIONING_MAX_USERS = config('PROVISIONING_MAX_USERS', default=10000, cast=int)
+PROVISIONING_HASH_WORKERS = config('PROVISIONING_HASH_WORKERS', default=0, cast=int)
+PROVISIONING_BATCH_SIZE = 1000
 
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+# Where post-upload processing runs: 'celery' (the workers above), 'thread'
+# (an in-process pool, for single-node installs without Redis) or 'eager'
+# (inline, for tests). Either way it runs after the upload response.
+TASK_BACKEND = config('TASK_BACKEND', default='thread')
+TASK_THREAD_WORKERS = config('TASK_THREAD_WORKERS', default=2, cast=int)
+# Periodic jobs for `celery beat`; django_celery_beat's scheduler copies
+# them into the database, where they can be changed in the admin
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'reap-expired-rows': {
+        'task': 'file_sharing.tasks.reap_expired_rows',
+        'schedule': 15 * 60.0,
+    },
+    # Safety net for outbox retries (drains are also queued on every commit
+    # that writes mail, and after failures for when the next retry is due)
+    'drain-outbox': {
+        'task': 'file_sharing.tasks.drain_outbox',
+        'schedule': 60.0,
+    },
+}
+# Limits applied while validating uploaded OOXML packages (zip bomb guard)
+OOXML_MAX_ENTRIES = 10000
+OOXML_MAX_UNCOMPRESSED_SIZE = config('OOXML_MAX_UNCOMPRESSED_SIZE', default=1024 * 1024 * 1024, cast=int)
 
 # File Upload Settings
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Single-request uploads (/api/upload/) are capped at FILE_UPLOAD_MAX_SIZE;
+# larger files go through the resumable /api/uploads/ protocol in chunks of
+# CHUNKED_UPLOAD_CHUNK_SIZE, up to CHUNKED_UPLOAD_MAX_SIZE.
+FILE_UPLOAD_MAX_SIZE = config('FILE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024, cast=int)
+CHUNKED_UPLOAD_MAX_SIZE = config('CHUNKED_UPLOAD_MAX_SIZE', default=2 * 1024 * 1024 * 1024, cast=int)
+CHUNKED_UPLOAD_CHUNK_SIZE = config('CHUNKED_UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+CHUNKED_UPLOAD_SESSION_TIMEOUT = 24 * 3600  # seconds
+
+# Uploads are hashed (SHA-256) while they stream in so identical content is
+# stored once under media/blobs/
+FILE_UPLOAD_HANDLERS = [
+    'file_sharing.uploadhandlers.HashingMemoryFileUploadHandler',
+    'file_sharing.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
+# File list pagination (keyset, see file_sharing.pagination); clients can
+# ask for up to FILE_LIST_MAX_PAGE_SIZE rows with ?page_size=
+FILE_LIST_PAGE_SIZE = config('FILE_LIST_PAGE_SIZE', default=50, cast=int)
+FILE_LIST_MAX_PAGE_SIZE = config('FILE_LIST_MAX_PAGE_SIZE', default=500, cast=int)
+
+# Rendered file list pages are cached per catalog version (bumped on every
+# catalog change); use a cache shared by all workers
+CATALOG_CACHE = 'default'
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Full-text search (?q= on the file list) indexes at most this many
+# characters of text extracted from each document
+SEARCH_MAX_TEXT_LENGTH = config('SEARCH_MAX_TEXT_LENGTH', default=1024 * 1024, cast=int)
 
 # CORS Settings
 CORS_ALLOWED_ORIGINS = [
@@ -134,6 +320,33 @@ CORS_ALLOWED_ORIGINS = [
 # Security Settings
 SECURE_URL_TIMEOUT = 3600  # 1 hour in seconds
 
+# URL encryption keys, one per line: the first encrypts, all of them decrypt.
+# Rotate with `manage.py rotate_encryption_key`; processes notice the change
+# within ENCRYPTION_KEY_RELOAD_INTERVAL seconds (0 disables polling), or on the reload
+# signal when one is configured (e.g. SIGUSR1).
+ENCRYPTION_KEY_FILE = os.path.join(BASE_DIR, 'encryption.key')
+ENCRYPTION_KEY_RELOAD_INTERVAL = config('ENCRYPTION_KEY_RELOAD_INTERVAL', default=30, cast=int)
+ENCRYPTION_KEY_RELOAD_SIGNAL = config('ENCRYPTION_KEY_RELOAD_SIGNAL', default='')
+
+# Download token mode: 'database' stores a SecureDownloadURL row per URL
+# (auditable), 'signed' carries file id, user id, expiry and a nonce in an
+# HMAC-signed token and needs no database writes to mint or redeem.
+DOWNLOAD_TOKEN_MODE = config('DOWNLOAD_TOKEN_MODE', default='database')
+# In 'signed' mode, single use is enforced by remembering consumed nonces in
+# this cache until they expire; use a cache shared by all workers.
+DOWNLOAD_TOKEN_SINGLE_USE = config('DOWNLOAD_TOKEN_SINGLE_USE', default=True, cast=bool)
+DOWNLOAD_TOKEN_REPLAY_CACHE = 'default'
+# Maximum number of file ids accepted by the batch download-URL endpoint
+DOWNLOAD_URL_BATCH_LIMIT = config('DOWNLOAD_URL_BATCH_LIMIT', default=500, cast=int)
+
+# File Delivery Settings
+# 'stream' serves files from Django in chunks (FileResponse / wsgi.file_wrapper).
+# 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd) let the web
+# server ship the bytes once the view has validated the download token.
+FILE_DOWNLOAD_BACKEND = config('FILE_DOWNLOAD_BACKEND', default='stream')
+FILE_DOWNLOAD_CHUNK_SIZE = config('FILE_DOWNLOAD_CHUNK_SIZE', default=64 * 1024, cast=int)
+FILE_DOWNLOAD_ACCEL_PREFIX = config('FILE_DOWNLOAD_ACCEL_PREFIX', default='/protected-media/')
+
 
 
 # Password validation
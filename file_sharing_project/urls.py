@@ -23,6 +23,7 @@ from file_sharing import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.home),
+    path('metrics', views.metrics, name='metrics'),
     path('api/', include('file_sharing.urls')),
 ]
 